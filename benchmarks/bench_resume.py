@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+
+    Compare recovering from a dropped connection by resuming the session
+    with XEP-0198 against a full reconnect, which authenticates, binds a
+    resource, starts a session, and fetches the roster again.
+
+    A local server answers each request after a simulated round trip
+    time, then drops the connection once the session is ready. The time
+    until the client's next message arrives on the new connection, and
+    the number of requests and bytes exchanged, are reported.
+
+    Usage: python benchmarks/bench_resume.py [rtt_ms] [roster_size]
+"""
+
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sleekxmpp import ClientXMPP
+from sleekxmpp.xmlstream.parser import XMLStreamParser
+
+
+SASL_NS = 'urn:ietf:params:xml:ns:xmpp-sasl'
+BIND_NS = 'urn:ietf:params:xml:ns:xmpp-bind'
+SESSION_NS = 'urn:ietf:params:xml:ns:xmpp-session'
+SM_NS = 'urn:xmpp:sm:3'
+
+HEADER = "<stream:stream xmlns='jabber:client' " + \
+         "xmlns:stream='http://etherx.jabber.org/streams' " + \
+         "from='localhost' id='%s' version='1.0'>"
+
+
+class Server(object):
+
+    """A minimal XMPP server that drops each connection once."""
+
+    def __init__(self, rtt, roster_size):
+        self.rtt = rtt
+        self.roster = ''.join(["<item jid='contact%s@localhost' " % i + \
+                               "subscription='both' />"
+                               for i in range(roster_size)])
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.sessions = {}
+        self.arrived = threading.Event()
+        self.dropped = None
+        self.requests = 0
+        self.bytes = 0
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        while True:
+            conn, addr = self.listener.accept()
+            thread = threading.Thread(target=self.serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def reply(self, conn, data):
+        """Answer a request after the simulated round trip."""
+        time.sleep(self.rtt)
+        self.requests += 1
+        self.bytes += len(data)
+        conn.sendall(data.encode('utf-8'))
+
+    def serve(self, conn):
+        try:
+            self.converse(conn)
+        finally:
+            conn.close()
+
+    def converse(self, conn):
+        parser = XMLStreamParser()
+        state = {'authed': False, 'handled': 0, 'id': None}
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                return
+            self.bytes += len(data)
+            for event, xml in parser.feed(data):
+                if event == 'start':
+                    self.start(conn, state)
+                elif event == 'stanza':
+                    if xml.tag == '{jabber:client}message':
+                        if self.dropped is not None:
+                            self.arrived.set()
+                            return
+                        # The session is ready; drop the connection.
+                        self.dropped = time.time()
+                        conn.shutdown(socket.SHUT_RDWR)
+                        return
+                    if not self.stanza(conn, state, xml):
+                        # The client will restart the stream.
+                        parser.reset()
+                        break
+                else:
+                    return
+
+    def start(self, conn, state):
+        features = "<mechanisms xmlns='%s'>" % SASL_NS + \
+                   "<mechanism>PLAIN</mechanism></mechanisms>"
+        if state['authed']:
+            features = "<bind xmlns='%s' />" % BIND_NS + \
+                       "<session xmlns='%s' />" % SESSION_NS + \
+                       "<sm xmlns='%s' />" % SM_NS
+        self.reply(conn, HEADER % id(conn) + \
+                   "<stream:features>%s</stream:features>" % features)
+
+    def stanza(self, conn, state, xml):
+        """Answer a stanza. Returns False if the stream restarts."""
+        tag = xml.tag
+        if tag == '{%s}auth' % SASL_NS:
+            state['authed'] = True
+            self.reply(conn, "<success xmlns='%s' />" % SASL_NS)
+            return False
+        if tag == '{%s}enable' % SM_NS:
+            state['id'] = 'sm-%s' % id(conn)
+            self.sessions[state['id']] = state
+            self.reply(conn, "<enabled xmlns='%s' " % SM_NS + \
+                             "id='%s' resume='true' />" % state['id'])
+        elif tag == '{%s}resume' % SM_NS:
+            previous = self.sessions.get(xml.attrib['previd'], None)
+            if previous is None:
+                self.reply(conn, "<failed xmlns='%s' />" % SM_NS)
+            else:
+                state.update(previous)
+                self.reply(conn, "<resumed xmlns='%s' " % SM_NS + \
+                                 "previd='%s' " % state['id'] + \
+                                 "h='%s' />" % state['handled'])
+        elif tag == '{%s}r' % SM_NS:
+            self.reply(conn, "<a xmlns='%s' h='%s' />" % (SM_NS,
+                                                           state['handled']))
+        elif tag.startswith('{jabber:client}'):
+            state['handled'] += 1
+            if tag == '{jabber:client}iq':
+                self.iq(conn, xml)
+        return True
+
+    def iq(self, conn, xml):
+        payload = ''
+        if xml.find('{%s}bind' % BIND_NS) is not None:
+            payload = "<bind xmlns='%s'>" % BIND_NS + \
+                      "<jid>user@localhost/bench</jid></bind>"
+        elif xml.find('{jabber:iq:roster}query') is not None:
+            payload = "<query xmlns='jabber:iq:roster'>%s</query>" % (
+                    self.roster)
+        self.reply(conn, "<iq type='result' id='%s'>%s</iq>" % (
+                   xml.attrib.get('id', ''), payload))
+
+
+def run(resume, rtt, roster_size):
+    server = Server(rtt, roster_size)
+    xmpp = ClientXMPP('user@localhost/bench', 'secret')
+    if resume:
+        xmpp.register_plugin('xep_0198')
+
+    def ping(event=None):
+        msg = xmpp.Message()
+        msg['to'] = 'contact0@localhost'
+        msg['body'] = 'ping'
+        msg.send()
+
+    def session_start(event):
+        # A new session must fetch the roster and send presence.
+        xmpp.get_roster()
+        xmpp.Presence().send()
+        ping()
+
+    xmpp.add_event_handler('session_start', session_start)
+    xmpp.add_event_handler('session_resumed', ping)
+    xmpp.connect(('127.0.0.1', server.port))
+    xmpp.process(threaded=True)
+
+    ok = server.arrived.wait(30)
+    elapsed = time.time() - server.dropped if ok else float('nan')
+    requests, sent = server.requests, server.bytes
+    xmpp.disconnect()
+    return elapsed, requests, sent
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.CRITICAL)
+    rtt = 0.05
+    roster_size = 200
+    if len(sys.argv) > 1:
+        rtt = float(sys.argv[1]) / 1000.0
+    if len(sys.argv) > 2:
+        roster_size = int(sys.argv[2])
+    print("Round trip %.0f ms, roster of %s contacts" % (rtt * 1000,
+                                                         roster_size))
+    for name, resume in (('full reconnect', False), ('resume', True)):
+        elapsed, requests, sent = run(resume, rtt, roster_size)
+        print("%-15s %.3f s until the next message arrives " % (name,
+                                                               elapsed) + \
+              "(%s server replies, %s bytes in total)" % (requests, sent))
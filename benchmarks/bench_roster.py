@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+
+    Compare the memory used by a large roster held as nested
+    dictionaries, as BaseXMPP kept it before, against RosterItem and
+    ResourcePresence entries, and the time taken to scan each roster
+    for online contacts.
+
+    Every contact is loaded from a roster item and its resources from
+    presence stanzas, each parsed separately so that every string is
+    a new object, as when they arrive from the server.
+
+    Usage: python benchmarks/bench_roster.py [contacts] [resources]
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sleekxmpp.roster.item import RosterItem, ResourcePresence, intern_str
+from sleekxmpp.xmlstream import ET, JID
+
+
+SHOW = ('away', 'chat', 'dnd', 'xa')
+RESOURCES = ('home', 'mobile', 'work')
+
+
+def generate(contacts, resources):
+    """Return the roster item and presence XML for each contact."""
+    data = []
+    for i in range(contacts):
+        jid = 'contact%d@example.com' % i
+        item = "<item xmlns='jabber:iq:roster' jid='%s' name='Contact " \
+               "%d' subscription='both'><group>Friends</group></item>" % (
+                   jid, i)
+        presences = ["<presence from='%s/%s'><show>%s</show>" \
+                     "<status>Busy</status><priority>%d</priority>" \
+                     "</presence>" % (jid, RESOURCES[r % len(RESOURCES)],
+                                      SHOW[(i + r) % len(SHOW)], r) \
+                     for r in range(resources)]
+        data.append((item, presences))
+    return data
+
+
+def parse(item, presences):
+    """
+    Return the JID and values of a roster item, and the resource and
+    values of each presence, the way the roster and presence stanzas
+    provide them.
+    """
+    xml = ET.fromstring(item)
+    values = {'name': xml.get('name', ''),
+              'subscription': xml.get('subscription', ''),
+              'groups': [group.text for group in \
+                         xml.findall('{jabber:iq:roster}group')]}
+    states = []
+    for presence in presences:
+        presence = ET.fromstring(presence)
+        states.append((JID(presence.get('from')).resource,
+                       presence.findtext('show'),
+                       presence.findtext('status'),
+                       int(presence.findtext('priority'))))
+    return xml.get('jid'), values, states
+
+
+def build_dicts(data):
+    """Build a roster of nested dictionaries."""
+    roster = {}
+    for item, presences in data:
+        jid, values, states = parse(item, presences)
+        roster[jid] = {'groups': [],
+                       'name': '',
+                       'subscription': 'none',
+                       'presence': {},
+                       'in_roster': True}
+        roster[jid].update(values)
+        for resource, show, status, priority in states:
+            roster[jid]['presence'][resource] = {'show': show,
+                                                 'status': status,
+                                                 'priority': priority}
+    return roster
+
+
+def build_items(data):
+    """Build a roster of RosterItem and ResourcePresence entries."""
+    roster = {}
+    for item, presences in data:
+        jid, values, states = parse(item, presences)
+        entry = roster[intern_str(jid)] = RosterItem(in_roster=True)
+        entry.update(values)
+        for resource, show, status, priority in states:
+            entry.presence[intern_str(resource)] = ResourcePresence(
+                    show, status, priority)
+    return roster
+
+
+def scan_dicts(roster):
+    """Return the JIDs with an available resource."""
+    return [jid for jid, item in roster.items() \
+            if [r for r in item['presence'].values() \
+                if r['show'] != 'unavailable']]
+
+
+def scan_items(roster):
+    """Return the JIDs with an available resource."""
+    return [jid for jid, item in roster.items() \
+            if [r for r in item.presence.values() \
+                if r.show != 'unavailable']]
+
+
+def run(build, scan, data):
+    """
+    Build a roster, returning the memory it holds in bytes, the
+    build time, and the time taken by one scan for online contacts.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    roster = build(data)
+    elapsed = time.time() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.time()
+    online = scan(roster)
+    scanned = time.time() - start
+    return size, elapsed, scanned
+
+
+if __name__ == '__main__':
+    contacts, resources = 20000, 2
+    if len(sys.argv) > 1:
+        contacts = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        resources = int(sys.argv[2])
+
+    data = generate(contacts, resources)
+    print("Roster of %s contacts with %s resources each" % (contacts,
+                                                            resources))
+    results = []
+    for name, build, scan in (('nested dicts', build_dicts, scan_dicts),
+                              ('roster items', build_items, scan_items)):
+        size, elapsed, scanned = run(build, scan, data)
+        results.append(size)
+        print("%-13s %7.1f MB, %4d bytes per contact, " % (
+                  name, size / 1048576.0, size // contacts) + \
+              "built in %.2f s, scanned in %.1f ms" % (elapsed,
+                                                        scanned * 1000))
+    print("Memory saved: %.0f%%" % (100 - 100.0 * results[1] / results[0]))
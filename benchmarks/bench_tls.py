@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+
+    Compare TLS handshakes for a fleet of accounts reconnecting to the
+    same server, with a new TLS context for each connection, as when
+    every stream called ssl.wrap_socket, against the shared TLSContext,
+    which resumes the sessions of the previous connections.
+
+    The server runs in a separate process, and the CPU time spent by
+    the client and the server are reported separately.
+
+    Usage: python benchmarks/bench_tls.py [accounts]
+"""
+
+import multiprocessing
+import os
+import socket
+import ssl
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sleekxmpp.xmlstream.tls import TLSContext
+
+
+CERTFILE = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                        'localhost.pem')
+
+
+def serve(listener, server_cpu):
+    """Greet each TLS connection and wait for it to close."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERTFILE)
+    while True:
+        conn = listener.accept()[0]
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            conn = context.wrap_socket(conn, server_side=True)
+            conn.sendall(b'ok')
+            conn.recv(1024)
+        except (socket.error, ssl.SSLError):
+            pass
+        conn.close()
+        server_cpu.value = time.process_time()
+
+
+def connect(context, address):
+    """Connect an account, returning once the server has greeted it."""
+    sock = socket.create_connection(address)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock = context.wrap_socket(sock, address)
+    # Reading the greeting also receives any session ticket.
+    sock.recv(2)
+    context.save_session(sock, address)
+    sock.close()
+
+
+def run(shared, accounts, address, server_cpu):
+    """
+    Connect every account, then reconnect them all, timing the
+    reconnects. Returns the wall time, the client and server CPU
+    time taken, and the fraction of handshakes that resumed
+    a session.
+    """
+    if shared:
+        context = TLSContext()
+        contexts = [context] * accounts
+    else:
+        contexts = [TLSContext() for i in range(accounts)]
+    for context in contexts:
+        connect(context, address)
+
+    # The server restarts and every account reconnects.
+    for context in contexts:
+        context.stats.update(handshakes=0, resumed=0, handshake_time=0.0)
+    if not shared:
+        contexts = [TLSContext() for i in range(accounts)]
+    start, cpu = time.time(), time.process_time()
+    server_start = server_cpu.value
+    for context in contexts:
+        connect(context, address)
+    elapsed, cpu = time.time() - start, time.process_time() - cpu
+    # Wait for the server to finish with the last connection.
+    time.sleep(0.1)
+    server = server_cpu.value - server_start
+
+    handshakes = sum([c.stats['handshakes'] for c in set(contexts)])
+    resumed = sum([c.stats['resumed'] for c in set(contexts)])
+    return elapsed, cpu, server, float(resumed) / handshakes
+
+
+if __name__ == '__main__':
+    accounts = 200
+    if len(sys.argv) > 1:
+        accounts = int(sys.argv[1])
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    server_cpu = multiprocessing.Value('d', 0.0)
+    server = multiprocessing.Process(target=serve,
+                                     args=(listener, server_cpu))
+    server.daemon = True
+    server.start()
+    address = listener.getsockname()
+
+    print("Reconnecting %s accounts" % accounts)
+    for name, shared in (('context per stream', False),
+                         ('shared context', True)):
+        elapsed, cpu, server_cpu_time, hit_rate = run(shared, accounts,
+                                                       address, server_cpu)
+        print("%-18s %.3f s, CPU %.3f s client, %.3f s server, " % (
+                  name, elapsed, cpu, server_cpu_time) + \
+              "%.2f ms per handshake, %.0f%% resumed" % (
+                  elapsed * 1000 / accounts, hit_rate * 100))
+    server.terminate()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+
+    Compare compiled MatchXPath matchers with the previous implementation,
+    which wrapped the stanza in a new element and called find() for
+    every evaluation.
+
+    Usage: python benchmarks/bench_xpath.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sleekxmpp.xmlstream.stanzabase import ET
+from sleekxmpp.xmlstream.matcher import MatchXPath
+
+
+STANZA = ET.fromstring("""
+<iq xmlns="jabber:client" type="get" id="disco1" from="user@example.com/a">
+  <query xmlns="http://jabber.org/protocol/disco#info" node="x">
+    <identity category="client" type="pc" />
+    <feature var="http://jabber.org/protocol/disco#info" />
+  </query>
+</iq>
+""")
+
+EXPRESSIONS = [
+    '{jabber:client}iq',
+    '{jabber:client}iq/{http://jabber.org/protocol/disco#info}query',
+    '{jabber:client}iq/{http://jabber.org/protocol/disco#items}query',
+    '{jabber:client}message/{jabber:client}body',
+]
+
+
+def legacy_match(criteria, xml, ignore_ns=False):
+    """The MatchXPath.match implementation before compilation."""
+    x = ET.Element('x')
+    x.append(xml)
+    if not ignore_ns:
+        return x.find(criteria) is not None
+    criteria_tags = []
+    for ns_block in criteria.split('{'):
+        criteria_tags.extend(ns_block.split('}')[-1].split('/'))
+    xml = x
+    for tag in criteria_tags:
+        if not tag:
+            continue
+        children = [c.tag.split('}')[-1] for c in list(xml)]
+        try:
+            index = children.index(tag)
+        except ValueError:
+            return False
+        xml = list(xml)[index]
+    return True
+
+
+def run(iterations):
+    from sleekxmpp.xmlstream.matcher import xpath
+
+    for ignore_ns in (False, True):
+        xpath.IGNORE_NS = ignore_ns
+        matchers = [MatchXPath(expr) for expr in EXPRESSIONS]
+
+        def old():
+            for expr in EXPRESSIONS:
+                legacy_match(expr, STANZA, ignore_ns)
+
+        def new():
+            for matcher in matchers:
+                matcher.match(STANZA)
+
+        old_time = min(timeit.repeat(old, number=iterations, repeat=3))
+        new_time = min(timeit.repeat(new, number=iterations, repeat=3))
+        evaluations = iterations * len(EXPRESSIONS)
+        print("IGNORE_NS=%s: legacy %.2f us, compiled %.2f us " \
+              "per match (%.1fx)" % (ignore_ns,
+                                     old_time / evaluations * 1e6,
+                                     new_time / evaluations * 1e6,
+                                     old_time / new_time))
+    xpath.IGNORE_NS = False
+
+
+if __name__ == '__main__':
+    iterations = 20000
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+    run(iterations)
@@ -44,6 +44,7 @@ packages     = [ 'sleekxmpp',
                  'sleekxmpp/xmlstream',
                  'sleekxmpp/xmlstream/matcher',
                  'sleekxmpp/xmlstream/handler',
+                 'sleekxmpp/roster',
                  'sleekxmpp/thirdparty',
                  ]
 
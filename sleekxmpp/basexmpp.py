@@ -17,6 +17,7 @@ from sleekxmpp import plugins
 
 from sleekxmpp.stanza import Message, Presence, Iq, Error
 from sleekxmpp.stanza.roster import Roster
+from sleekxmpp.roster.item import RosterItem, ResourcePresence, intern_str
 from sleekxmpp.stanza.nick import Nick
 from sleekxmpp.stanza.htmlim import HTMLIM
 
@@ -53,8 +54,9 @@ class BaseXMPP(XMLStream):
        plugin_config    -- A dictionary of plugin configurations.
        plugin_whitelist -- A list of approved plugins.
        sentpresence     -- Indicates if an initial presence has been sent.
-       roster           -- A dictionary containing subscribed JIDs and
-                           their presence statuses.
+       roster           -- A dictionary of RosterItem entries, keyed by
+                           bare JID, for subscribed JIDs and their
+                           presence statuses.
 
     Methods:
        Iq                      -- Factory for creating an Iq stanzas.
@@ -548,35 +550,30 @@ class BaseXMPP(XMLStream):
 
         was_offline = False
         got_online = False
-        old_roster = self.roster.get(jid, {}).get(resource, {})
 
         # Create a new roster entry if needed.
-        if not jid in self.roster:
-            self.roster[jid] = {'groups': [],
-                                'name': '',
-                                'subscription': 'none',
-                                'presence': {},
-                                'in_roster': False}
+        item = self.roster.get(jid, None)
+        if item is None:
+            jid = intern_str(jid)
+            item = self.roster[jid] = RosterItem()
 
         # Alias to simplify some references.
-        connections = self.roster[jid]['presence']
+        connections = item.presence
 
         # Determine if the user has just come online.
-        if not resource in connections:
+        connection = connections.get(resource, None)
+        if connection is None:
+            resource = intern_str(resource)
             if show == 'available' or show in presence.showtypes:
                 got_online = True
             was_offline = True
-            connections[resource] = {}
-
-        if connections[resource].get('show', 'unavailable') == 'unavailable':
+        elif connection.show == 'unavailable':
             was_offline = True
 
         # Update the roster's state for this JID's resource.
-        connections[resource] = {'show': show,
-                                'status': status,
-                                'priority': priority}
+        connections[resource] = ResourcePresence(show, status, priority)
 
-        name = self.roster[jid].get('name', '')
+        name = item.name
 
         # Remove unneeded state information after a resource
         # disconnects. Determine if this was the last connection
@@ -585,7 +582,7 @@ class BaseXMPP(XMLStream):
             log.debug("%s %s got offline" % (jid, resource))
             del connections[resource]
 
-            if not connections and not self.roster[jid]['in_roster']:
+            if not connections and not item.in_roster:
                 del self.roster[jid]
             if not was_offline:
                 self.event("got_offline", presence)
@@ -12,24 +12,19 @@ import logging
 import base64
 import sys
 import hashlib
-import random
 import threading
 
 from sleekxmpp import plugins
+from sleekxmpp import sasl
 from sleekxmpp import stanza
 from sleekxmpp.basexmpp import BaseXMPP
+from sleekxmpp.roster.item import RosterItem, intern_str
 from sleekxmpp.stanza import Message, Presence, Iq
 from sleekxmpp.xmlstream import XMLStream, RestartStream
 from sleekxmpp.xmlstream import StanzaBase, ET
 from sleekxmpp.xmlstream.matcher import *
 from sleekxmpp.xmlstream.handler import *
-
-# Flag indicating if DNS SRV records are available for use.
-SRV_SUPPORT = True
-try:
-    import dns.resolver
-except:
-    SRV_SUPPORT = False
+from sleekxmpp.xmlstream.resolver import SRV_SUPPORT, SRV_CACHE, order_srv
 
 
 log = logging.getLogger(__name__)
@@ -43,12 +38,27 @@ class ClientXMPP(BaseXMPP):
     Use only for good, not for evil.
 
     Attributes:
+        roster_store    -- Optional RosterStore which keeps the roster
+                           and its version between sessions, so that
+                           only changes are requested from servers
+                           that support roster versioning.
+        roster_ver      -- The version of the roster held, or None.
+        roster_versioning -- Indicates if the server supports roster
+                             versioning.
+        sasl_mechanisms -- A dictionary of the SASL mechanism classes
+                           that may be used, by name. The offered
+                           mechanism with the highest priority is used.
+        srv_cache -- The SRVCache used to find the server's addresses.
+                     Shared by all clients in the process by default.
 
     Methods:
         connect          -- Overrides XMLStream.connect.
+        connect_targets  -- Overrides XMLStream.connect_targets.
         del_roster_item  -- Delete a roster item.
         get_roster       -- Retrieve the roster from the server.
         register_feature -- Register a stream feature.
+        register_sasl_mechanism -- Add a SASL mechanism.
+        tls_server_name  -- Overrides XMLStream.tls_server_name.
         update_roster    -- Update a roster item.
     """
 
@@ -74,6 +84,7 @@ class ClientXMPP(BaseXMPP):
         self.delRosterItem = self.del_roster_item
         self.getRoster = self.get_roster
         self.registerFeature = self.register_feature
+        self.registerSASLMechanism = self.register_sasl_mechanism
 
         self.set_jid(jid)
         self.password = password
@@ -81,6 +92,8 @@ class ClientXMPP(BaseXMPP):
         self.plugin_config = plugin_config
         self.plugin_whitelist = plugin_whitelist
         self.srv_support = SRV_SUPPORT
+        self.srv_cache = SRV_CACHE
+        self._srv_domain = None
 
         self.session_started_event = threading.Event()
         self.session_started_event.clear()
@@ -92,7 +105,14 @@ class ClientXMPP(BaseXMPP):
         self.stream_footer = "</stream:stream>"
 
         self.features = []
+        self.stream_features = None
         self.registered_features = []
+        self.sasl_mechanisms = dict(sasl.MECHANISMS)
+        self._sasl = None
+
+        self.roster_store = None
+        self.roster_ver = None
+        self.roster_versioning = False
 
         #TODO: Use stream state here
         self.authenticated = False
@@ -112,18 +132,32 @@ class ClientXMPP(BaseXMPP):
                              'jabber:iq:roster')),
                          self._handle_roster))
 
+        sasl_ns = 'urn:ietf:params:xml:ns:xmpp-sasl'
+        for name, tag, handler in (
+                ('Challenge', 'challenge', self._handle_sasl_challenge),
+                ('Success', 'success', self._handle_auth_success),
+                ('Failure', 'failure', self._handle_auth_fail)):
+            self.register_handler(
+                    Callback('SASL %s' % name,
+                             MatchXPath('{%s}%s' % (sasl_ns, tag)),
+                             handler,
+                             instream=True))
+
         self.register_feature(
             "<starttls xmlns='urn:ietf:params:xml:ns:xmpp-tls' />",
-            self._handle_starttls, True)
+            self._handle_starttls, True, order=0)
         self.register_feature(
             "<mechanisms xmlns='urn:ietf:params:xml:ns:xmpp-sasl' />",
-            self._handle_sasl_auth, True)
+            self._handle_sasl_auth, True, order=100)
         self.register_feature(
             "<bind xmlns='urn:ietf:params:xml:ns:xmpp-bind' />",
-            self._handle_bind_resource)
+            self._handle_bind_resource, order=10000)
         self.register_feature(
             "<session xmlns='urn:ietf:params:xml:ns:xmpp-session' />",
-            self._handle_start_session)
+            self._handle_start_session, order=10100)
+        self.register_feature(
+            "<ver xmlns='urn:xmpp:features:rosterver' />",
+            self._handle_roster_ver)
 
     def handle_connected(self, event=None):
         #TODO: Use stream state here
@@ -131,6 +165,7 @@ class ClientXMPP(BaseXMPP):
         self.sessionstarted = False
         self.bound = False
         self.bindfail = False
+        self.roster_versioning = False
         self.schedule("session timeout checker", 15,
                       self._session_timeout_check)
 
@@ -143,14 +178,16 @@ class ClientXMPP(BaseXMPP):
         """
         Connect to the XMPP server.
 
-        When no address is given, a SRV lookup for the server will
-        be attempted. If that fails, the server user in the JID
-        will be used.
+        When no address is given, the servers listed in the domain's
+        SRV records are tried in order of priority and weight, falling
+        back to the server in the JID. Resolved records are cached
+        and reused for reconnecting until their TTL expires.
 
         Arguments:
             address -- A tuple containing the server's host and port.
         """
         self.session_started_event.clear()
+        self._srv_domain = None
         if not address or len(address) < 2:
             if not self.srv_support:
                 log.debug("Did not supply (address, port) to connect" + \
@@ -161,50 +198,66 @@ class ClientXMPP(BaseXMPP):
             else:
                 log.debug("Since no address is supplied," + \
                               "attempting SRV lookup.")
-                try:
-                    xmpp_srv = "_xmpp-client._tcp.%s" % self.server
-                    answers = dns.resolver.query(xmpp_srv, dns.rdatatype.SRV)
-                except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-                    log.debug("No appropriate SRV record found." + \
-                                  " Using JID server name.")
-                else:
-                    # Pick a random server, weighted by priority.
-
-                    addresses = {}
-                    intmax = 0
-                    for answer in answers:
-                        intmax += answer.priority
-                        addresses[intmax] = (answer.target.to_text()[:-1],
-                                             answer.port)
-                    #python3 returns a generator for dictionary keys
-                    priorities = [x for x in addresses.keys()]
-                    priorities.sort()
-
-                    picked = random.randint(0, intmax)
-                    for priority in priorities:
-                        if picked <= priority:
-                            address = addresses[priority]
-                            break
-
-        if not address:
+                self._srv_domain = self.boundjid.host
             # If all else fails, use the server from the JID.
             address = (self.boundjid.host, 5222)
 
         return XMLStream.connect(self, address[0], address[1], use_tls=True)
 
-    def register_feature(self, mask, pointer, breaker=False):
+    def connect_targets(self):
+        """
+        Return the servers listed in the domain's SRV records, in
+        the order they should be tried, or the server given to
+        connect if there are none.
+
+        Overrides XMLStream.connect_targets.
+        """
+        if self._srv_domain is None:
+            return [self.address]
+        records = self.srv_cache.get("_xmpp-client._tcp.%s" % (
+                                     self._srv_domain))
+        targets = [(record[2], record[3]) for record in order_srv(records)]
+        if not targets:
+            log.debug("No appropriate SRV record found." + \
+                          " Using JID server name.")
+            return [(self.boundjid.host, 5222)]
+        return targets
+
+    def tls_server_name(self):
+        """
+        Return the XMPP domain, which the server's TLS certificate
+        must match, as required by RFC 6120, whichever host was
+        connected to.
+
+        Overrides XMLStream.tls_server_name.
+        """
+        return self.boundjid.host
+
+    def register_feature(self, mask, pointer, breaker=False, order=5000):
         """
         Register a stream feature.
 
+        Features offered by the server are processed by increasing
+        order, regardless of the order in which the server lists them.
+        The built in features use 0 for STARTTLS, 100 for SASL, 10000
+        for resource binding, and 10100 for session establishment.
+
         Arguments:
             mask    -- An XML string matching the feature's element.
             pointer -- The function to execute if the feature is received.
             breaker -- Indicates if feature processing should halt with
                        this feature. Defaults to False.
+            order   -- The feature's position in the processing order.
+                       Defaults to 5000, after authentication but before
+                       resource binding.
         """
         self.registered_features.append((MatchXMLMask(mask),
                                          pointer,
-                                         breaker))
+                                         breaker,
+                                         order))
+        # The sort is stable, so features with the same order
+        # are processed in the order they were registered.
+        self.registered_features.sort(key=lambda feature: feature[3])
 
     def update_roster(self, jid, name=None, subscription=None, groups=[]):
         """
@@ -236,8 +289,23 @@ class ClientXMPP(BaseXMPP):
         return self.update_roster(jid, subscription='remove')
 
     def get_roster(self):
-        """Request the roster from the server."""
+        """
+        Request the roster from the server.
+
+        If the server supports roster versioning, only the changes
+        since the version held, either from an earlier session or
+        from roster_store, are requested.
+        """
+        if self.roster_ver is None and self.roster_store is not None:
+            version, items = self.roster_store.load(self.boundjid.bare)
+            if version is not None:
+                for jid, item in items.items():
+                    self._update_roster_item(jid, item)
+                self.roster_ver = version
+
         iq = self.Iq()._set_stanza_values({'type': 'get'}).enable('roster')
+        if self.roster_versioning:
+            iq['roster']['ver'] = self.roster_ver or ''
         response = iq.send()
         self._handle_roster(response, request=True)
 
@@ -249,14 +317,15 @@ class ClientXMPP(BaseXMPP):
             features -- The features stanza.
         """
         # Record all of the features.
+        self.stream_features = features
         self.features = []
         for sub in features.xml:
             self.features.append(sub.tag)
 
         # Process the features.
-        for sub in features.xml:
-            for feature in self.registered_features:
-                mask, handler, halt = feature
+        for feature in self.registered_features:
+            mask, handler, halt, order = feature
+            for sub in features.xml:
                 if mask.match(sub):
                     if handler(sub) and halt:
                         # Don't continue if the feature was
@@ -293,6 +362,15 @@ class ClientXMPP(BaseXMPP):
         if self.start_tls():
             raise RestartStream()
 
+    def register_sasl_mechanism(self, mechanism):
+        """
+        Add a SASL mechanism, replacing any mechanism of the same name.
+
+        Arguments:
+            mechanism -- A subclass of sleekxmpp.sasl.Mechanism.
+        """
+        self.sasl_mechanisms[mechanism.name] = mechanism
+
     def _handle_sasl_auth(self, xml):
         """
         Handle authenticating using SASL.
@@ -305,42 +383,90 @@ class ClientXMPP(BaseXMPP):
 
         log.debug("Starting SASL Auth")
         sasl_ns = 'urn:ietf:params:xml:ns:xmpp-sasl'
-        self.add_handler("<success xmlns='%s' />" % sasl_ns,
-                         self._handle_auth_success,
-                         name='SASL Sucess',
-                         instream=True)
-        self.add_handler("<failure xmlns='%s' />" % sasl_ns,
-                         self._handle_auth_fail,
-                         name='SASL Failure',
-                         instream=True)
-
         sasl_mechs = xml.findall('{%s}mechanism' % sasl_ns)
         if sasl_mechs:
+            offered = []
             for sasl_mech in sasl_mechs:
                 self.features.append("sasl:%s" % sasl_mech.text)
-            if 'sasl:PLAIN' in self.features and self.boundjid.user:
-                if sys.version_info < (3, 0):
-                    user = bytes(self.boundjid.user)
-                    password = bytes(self.password)
-                else:
-                    user = bytes(self.boundjid.user, 'utf-8')
-                    password = bytes(self.password, 'utf-8')
-
-                auth = base64.b64encode(b'\x00' + user + \
-                                        b'\x00' + password).decode('utf-8')
-
-                self.send("<auth xmlns='%s' mechanism='PLAIN'>%s</auth>" % (
-                    sasl_ns,
-                    auth))
-            elif 'sasl:ANONYMOUS' in self.features and not self.boundjid.user:
-                self.send("<auth xmlns='%s' mechanism='%s' />" % (
-                    sasl_ns,
-                    'ANONYMOUS'))
-            else:
+                offered.append(sasl_mech.text)
+
+            mechanism = self._choose_sasl_mechanism(offered)
+            if mechanism is None:
                 log.error("No appropriate login method.")
                 self.disconnect()
+                return True
+
+            log.debug("Using SASL mechanism %s" % mechanism.name)
+            self._sasl = mechanism
+            response = mechanism.start()
+            if response is None:
+                self.send_raw("<auth xmlns='%s' mechanism='%s' />" % (
+                    sasl_ns, mechanism.name))
+            else:
+                self.send_raw("<auth xmlns='%s' mechanism='%s'>%s</auth>" % (
+                    sasl_ns, mechanism.name, self._sasl_encode(response)))
         return True
 
+    def _choose_sasl_mechanism(self, offered):
+        """
+        Return a new exchange for the offered SASL mechanism with
+        the highest priority, or None if none may be used.
+
+        Arguments:
+            offered -- The names of the mechanisms the server offers.
+        """
+        user = self.boundjid.user
+        usable = [self.sasl_mechanisms[name] for name in offered \
+                  if name in self.sasl_mechanisms and \
+                  self.sasl_mechanisms[name].available(user, self.password)]
+        if not usable:
+            return None
+        usable.sort(key=lambda mechanism: mechanism.priority, reverse=True)
+        return usable[0](user, self.password)
+
+    def _sasl_encode(self, data):
+        """
+        Return SASL data encoded for sending, where empty data
+        is sent as '='.
+
+        Arguments:
+            data -- The data, as bytes.
+        """
+        if not data:
+            return '='
+        return base64.b64encode(data).decode('utf-8')
+
+    def _sasl_decode(self, stanza):
+        """
+        Return the data sent in a SASL element.
+
+        Arguments:
+            stanza -- The SASL challenge or success stanza.
+        """
+        text = (stanza.xml.text or '').strip()
+        if text in ('', '='):
+            return b''
+        return base64.b64decode(text.encode('utf-8'))
+
+    def _handle_sasl_challenge(self, xml):
+        """
+        Answer a SASL challenge from the server.
+
+        Arguments:
+            xml -- The SASL challenge element.
+        """
+        sasl_ns = 'urn:ietf:params:xml:ns:xmpp-sasl'
+        try:
+            if self._sasl is None:
+                raise sasl.SASLError("Challenge without an exchange.")
+            response = self._sasl.challenge(self._sasl_decode(xml))
+        except (sasl.SASLError, TypeError, ValueError) as e:
+            log.error("SASL authentication failed: %s" % e)
+            self.send_raw("<abort xmlns='%s' />" % sasl_ns)
+            return
+        self.send_raw("<response xmlns='%s'>%s</response>" % (
+            sasl_ns, self._sasl_encode(response)))
+
     def _handle_auth_success(self, xml):
         """
         SASL authentication succeeded. Restart the stream.
@@ -348,6 +474,16 @@ class ClientXMPP(BaseXMPP):
         Arguments:
             xml -- The SASL authentication success element.
         """
+        mechanism, self._sasl = self._sasl, None
+        try:
+            if mechanism is not None:
+                mechanism.success(self._sasl_decode(xml))
+        except (sasl.SASLError, TypeError, ValueError) as e:
+            # The server could not prove that it knows the password.
+            log.error("SASL authentication failed: %s" % e)
+            self.event("failed_auth", direct=True)
+            self.disconnect()
+            return
         self.authenticated = True
         self.features = []
         raise RestartStream()
@@ -360,6 +496,7 @@ class ClientXMPP(BaseXMPP):
             xml -- The SASL authentication failure element.
         """
         log.info("Authentication failed.")
+        self._sasl = None
         self.event("failed_auth", direct=True)
         self.disconnect()
 
@@ -410,6 +547,65 @@ class ClientXMPP(BaseXMPP):
             # Bind probably hasn't happened yet.
             self.bindfail = True
 
+    def _handle_roster_ver(self, xml):
+        """
+        Note that the server supports roster versioning.
+
+        Arguments:
+            xml -- The roster versioning feature element.
+        """
+        self.roster_versioning = True
+        return False
+
+    def _update_roster_item(self, jid, item):
+        """
+        Add or change an item in the roster.
+
+        Arguments:
+            jid  -- The JID of the roster item.
+            item -- A dictionary of the item's name, subscription,
+                    and groups.
+        """
+        entry = self.roster.get(jid, None)
+        if entry is None:
+            jid = intern_str(jid)
+            entry = self.roster[jid] = RosterItem()
+        entry.update(item)
+        entry.in_roster = True
+
+    def _remove_roster_item(self, jid):
+        """
+        Remove an item from the roster, keeping any presence
+        information for the JID.
+
+        Arguments:
+            jid -- The JID of the roster item.
+        """
+        entry = self.roster.get(jid, None)
+        if entry is None:
+            return
+        if entry.presence:
+            entry.update(groups=[], name='', subscription='none',
+                         in_roster=False)
+        else:
+            del self.roster[jid]
+
+    def _handle_disconnected(self, event):
+        """
+        When disconnected, forget presence information. A versioned
+        roster is kept so that only changes need to be requested
+        after reconnecting.
+
+        Overrides BaseXMPP._handle_disconnected.
+        """
+        if self.roster_ver is None:
+            return BaseXMPP._handle_disconnected(self, event)
+        for jid, entry in list(self.roster.items()):
+            if entry.in_roster:
+                entry.presence = {}
+            else:
+                del self.roster[jid]
+
     def _handle_roster(self, iq, request=False):
         """
         Update the roster after receiving a roster stanza.
@@ -420,14 +616,33 @@ class ClientXMPP(BaseXMPP):
                        to a request for the roster.
         """
         if iq['type'] == 'set' or (iq['type'] == 'result' and request):
-            for jid in iq['roster']['items']:
-                if not jid in self.roster:
-                    self.roster[jid] = {'groups': [],
-                                        'name': '',
-                                        'subscription': 'none',
-                                        'presence': {},
-                                        'in_roster': True}
-                self.roster[jid].update(iq['roster']['items'][jid])
+            query = iq.xml.find('{jabber:iq:roster}query')
+            if query is None:
+                # The roster held is current, and any changes
+                # will follow as roster pushes.
+                log.debug("Roster version %s is current." % self.roster_ver)
+            else:
+                full = iq['type'] == 'result'
+                items = iq['roster']['items']
+                if full:
+                    for jid in list(self.roster.keys()):
+                        if jid not in items:
+                            self._remove_roster_item(jid)
+                for jid in items:
+                    if items[jid]['subscription'] == 'remove':
+                        self._remove_roster_item(jid)
+                    else:
+                        self._update_roster_item(jid, items[jid])
+
+                ver = query.get('ver', None)
+                if ver is not None:
+                    self.roster_ver = ver
+                    if self.roster_store is not None:
+                        owner = self.boundjid.bare
+                        if full:
+                            self.roster_store.save(owner, ver, items)
+                        else:
+                            self.roster_store.update(owner, ver, items)
 
         self.event("roster_update", iq)
         if iq['type'] == 'set':
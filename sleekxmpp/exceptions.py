@@ -47,3 +47,24 @@ class XMPPError(Exception):
         self.extension = extension
         self.extension_ns = extension_ns
         self.extension_args = extension_args
+
+
+class IqTimeout(Exception):
+
+    """
+    Raised, or set on a future, when no response to an <iq> stanza
+    sent without blocking was received before the timeout expired.
+
+    Attributes:
+        iq -- The <iq> stanza that did not receive a response.
+    """
+
+    def __init__(self, iq):
+        """
+        Create a new IqTimeout exception.
+
+        Arguments:
+            iq -- The <iq> stanza that did not receive a response.
+        """
+        Exception.__init__(self, 'No response to iq %s' % iq['id'])
+        self.iq = iq
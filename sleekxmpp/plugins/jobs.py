@@ -19,22 +19,22 @@ class jobs(base.base_plugin):
 	def createJobNode(self, host, jid, node, config=None):
 		pass
 
-	def createJob(self, host, node, jobid=None, payload=None):
-		return self.xmpp.plugin['xep_0060'].setItem(host, node, ((jobid, payload),))
+	def createJob(self, host, node, jobid=None, payload=None, callback=None):
+		return self.xmpp.plugin['xep_0060'].setItem(host, node, ((jobid, payload),), callback=callback)
 
-	def claimJob(self, host, node, jobid, ifrom=None):
-		return self._setState(host, node, jobid, ET.Element('{http://andyet.net/protocol/pubsubjob}claimed'))
+	def claimJob(self, host, node, jobid, ifrom=None, callback=None):
+		return self._setState(host, node, jobid, ET.Element('{http://andyet.net/protocol/pubsubjob}claimed'), callback=callback)
 
-	def unclaimJob(self, host, node, jobid):
-		return self._setState(host, node, jobid, ET.Element('{http://andyet.net/protocol/pubsubjob}unclaimed'))
+	def unclaimJob(self, host, node, jobid, callback=None):
+		return self._setState(host, node, jobid, ET.Element('{http://andyet.net/protocol/pubsubjob}unclaimed'), callback=callback)
 
-	def finishJob(self, host, node, jobid, payload=None):
+	def finishJob(self, host, node, jobid, payload=None, callback=None):
 		finished = ET.Element('{http://andyet.net/protocol/pubsubjob}finished')
 		if payload is not None:
 			finished.append(payload)
-		return self._setState(host, node, jobid, finished)
+		return self._setState(host, node, jobid, finished, callback=callback)
 
-	def _setState(self, host, node, jobid, state, ifrom=None):
+	def _setState(self, host, node, jobid, state, ifrom=None, callback=None):
 		iq = self.xmpp.Iq()
 		iq['to'] = host
 		if ifrom: iq['from'] = ifrom
@@ -42,9 +42,13 @@ class jobs(base.base_plugin):
 		iq['psstate']['node'] = node
 		iq['psstate']['item'] = jobid
 		iq['psstate']['payload'] = state
-		result = iq.send()
-		if result is None or type(result) == types.BooleanType or result['type'] != 'result':
-			log.error("Unable to change %s:%s to %s" % (node, jobid, state))
-			return False
-		return True
+		def changed(result):
+			if result is None or type(result) == types.BooleanType or result['type'] != 'result':
+				log.error("Unable to change %s:%s to %s" % (node, jobid, state))
+				return False
+			return True
+		if callback is not None:
+			iq.send(callback=lambda result: callback(changed(result)))
+			return None
+		return changed(iq.send())
 
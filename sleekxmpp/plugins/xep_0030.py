@@ -295,21 +295,47 @@ class xep_0030(base.base_plugin):
 
     # Older interface methods for backwards compatibility
 
-    def getInfo(self, jid, node='', dfrom=None):
+    def getInfo(self, jid, node='', dfrom=None, callback=None):
+        """
+        Query an entity for its disco#info.
+
+        Returns the response stanza, or False if no response was
+        received. If a callback is given, it is executed with that
+        value instead, and the query does not block.
+
+        Arguments:
+            jid      -- The JID of the entity to query.
+            node     -- Optional node to query.
+            dfrom    -- Optional JID to send the query from.
+            callback -- Optional function to execute with the result.
+        """
         iq = self.xmpp.Iq()
         iq['type'] = 'get'
         iq['to'] = jid
         iq['from'] = dfrom
         iq['disco_info']['node'] = node
-        return iq.send()
+        return iq.send(callback=callback)
 
-    def getItems(self, jid, node='', dfrom=None):
+    def getItems(self, jid, node='', dfrom=None, callback=None):
+        """
+        Query an entity for its disco#items.
+
+        Returns the response stanza, or False if no response was
+        received. If a callback is given, it is executed with that
+        value instead, and the query does not block.
+
+        Arguments:
+            jid      -- The JID of the entity to query.
+            node     -- Optional node to query.
+            dfrom    -- Optional JID to send the query from.
+            callback -- Optional function to execute with the result.
+        """
         iq = self.xmpp.Iq()
         iq['type'] = 'get'
         iq['to'] = jid
         iq['from'] = dfrom
         iq['disco_items']['node'] = node
-        return iq.send()
+        return iq.send(callback=callback)
 
     def add_feature(self, feature, node='main'):
         self.add_node(node)
@@ -173,15 +173,20 @@ class xep_0045(base.base_plugin):
 			if entry is not None and entry['jid'].full == jid:
 				return nick
 
-	def getRoomForm(self, room, ifrom=None):
+	def getRoomForm(self, room, ifrom=None, callback=None):
 		iq = self.xmpp.makeIqGet()
 		iq['to'] = room
 		if ifrom is not None:
 			iq['from'] = ifrom
 		query = ET.Element('{http://jabber.org/protocol/muc#owner}query')
 		iq.append(query)
-		result = iq.send()
-		if result['type'] == 'error':
+		if callback is not None:
+			iq.send(callback=lambda result: callback(self._roomForm(result)))
+			return None
+		return self._roomForm(iq.send())
+
+	def _roomForm(self, result):
+		if result is None or result is False or result['type'] == 'error':
 			return False
 		xform = result.xml.find('{http://jabber.org/protocol/muc#owner}query/{jabber:x:data}x')
 		if xform is None: return False
@@ -203,7 +203,7 @@ class xep_0060(base.base_plugin):
 			return False
 		return True
 
-	def setItem(self, jid, node, items=[]):
+	def setItem(self, jid, node, items=[], callback=None):
 		pubsub = ET.Element('{http://jabber.org/protocol/pubsub}pubsub')
 		publish = ET.Element('publish')
 		publish.attrib['node'] = node
@@ -219,14 +219,12 @@ class xep_0060(base.base_plugin):
 		iq.attrib['to'] = jid
 		iq.attrib['from'] = self.xmpp.fulljid
 		id = iq['id']
-		result = iq.send()
-		if result is None or result is False or result['type'] == 'error': return False
-		return True
+		return self._sendItemRequest(iq, callback)
 
-	def addItem(self, jid, node, items=[]):
-		return self.setItem(jid, node, items)
+	def addItem(self, jid, node, items=[], callback=None):
+		return self.setItem(jid, node, items, callback)
 
-	def deleteItem(self, jid, node, item):
+	def deleteItem(self, jid, node, item, callback=None):
 		pubsub = ET.Element('{http://jabber.org/protocol/pubsub}pubsub')
 		retract = ET.Element('retract')
 		retract.attrib['node'] = node
@@ -238,9 +236,21 @@ class xep_0060(base.base_plugin):
 		iq.attrib['to'] = jid
 		iq.attrib['from'] = self.xmpp.fulljid
 		id = iq['id']
-		result = iq.send()
-		if result is None or result is False or result['type'] == 'error': return False
-		return True
+		return self._sendItemRequest(iq, callback)
+
+	def _sendItemRequest(self, iq, callback=None):
+		"""
+		Send an item publish or retract request, returning True if
+		it succeeded. If a callback is given, it is executed with
+		that value instead, and the request does not block.
+		"""
+		def success(result):
+			if result is None or result is False or result['type'] == 'error': return False
+			return True
+		if callback is not None:
+			iq.send(callback=lambda result: callback(success(result)))
+			return None
+		return success(iq.send())
 
 	def getNodes(self, jid):
 		response = self.xmpp.plugin['xep_0030'].getItems(jid)
@@ -251,14 +261,20 @@ class xep_0060(base.base_plugin):
 				nodes[item.get('node')] = item.get('name')
 		return nodes
 
-	def getItems(self, jid, node):
-		response = self.xmpp.plugin['xep_0030'].getItems(jid, node)
-		items = response.findall('{http://jabber.org/protocol/disco#items}query/{http://jabber.org/protocol/disco#items}item')
-		nodeitems = []
-		if items is not None and items is not False:
-			for item in items:
-				nodeitems.append(item.get('node'))
-		return nodeitems
+	def getItems(self, jid, node, callback=None):
+		def nodeItems(response):
+			if response is None or response is False: return False
+			items = response.findall('{http://jabber.org/protocol/disco#items}query/{http://jabber.org/protocol/disco#items}item')
+			nodeitems = []
+			if items is not None and items is not False:
+				for item in items:
+					nodeitems.append(item.get('node'))
+			return nodeitems
+		if callback is not None:
+			self.xmpp.plugin['xep_0030'].getItems(jid, node,
+				callback=lambda response: callback(nodeItems(response)))
+			return None
+		return nodeItems(self.xmpp.plugin['xep_0030'].getItems(jid, node))
 
 	def addNodeToCollection(self, jid, child, parent=''):
 		config = self.getNodeConfig(jid, child)
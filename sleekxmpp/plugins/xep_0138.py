@@ -0,0 +1,365 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010 Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import ssl
+import zlib
+
+from . import base
+from .. xmlstream import RestartStream
+from .. xmlstream.handler.callback import Callback
+from .. xmlstream.matcher.xpath import MatchXPath
+
+
+log = logging.getLogger(__name__)
+
+
+FEATURE_NS = 'http://jabber.org/features/compress'
+PROTOCOL_NS = 'http://jabber.org/protocol/compress'
+
+# Flush modes for compressed writes. Every write is flushed so that
+# the peer can decompress each stanza as soon as it arrives. A full
+# flush also resets the compression history, at the cost of a lower
+# compression ratio.
+FLUSH_MODES = {'sync': zlib.Z_SYNC_FLUSH,
+               'full': zlib.Z_FULL_FLUSH}
+
+# Exceptions raised by non-blocking sockets when no data can be
+# written without blocking. Non-blocking streams require Python 3.
+try:
+    WOULD_BLOCK = (BlockingIOError, InterruptedError,
+                   ssl.SSLWantReadError, ssl.SSLWantWriteError)
+except (NameError, AttributeError):
+    WOULD_BLOCK = ()
+
+
+class ZlibSocket(object):
+
+    """
+    A socket wrapper which compresses data sent on the underlying
+    socket, and decompresses data received from it, using zlib.
+
+    Each write is compressed and flushed as a whole. On a blocking
+    socket, send writes all of it before returning. On a non-blocking
+    socket, compressed data that could not be written is kept and
+    written first by the next call to send. Until then, the last byte
+    of the data is reported as unsent, so that the caller will call
+    send again; that byte is already compressed, and is reported as
+    sent once the kept data has been written.
+
+    Decompressed data is produced at most one read size at a time.
+
+    Other socket methods, such as fileno and close, are passed
+    through to the underlying socket.
+
+    Attributes:
+        socket -- The underlying socket.
+        level  -- The zlib compression level.
+        flush  -- The flush mode used after each write,
+                  either 'sync' or 'full'.
+
+    Methods:
+        send      -- Compress and send data.
+        sendall   -- Compress and send data.
+        recv      -- Receive and decompress data.
+        recv_into -- Receive and decompress data into a buffer.
+        pending   -- Return the number of bytes ready to read.
+        stats     -- Return data counters and compression ratios.
+    """
+
+    def __init__(self, socket, level=zlib.Z_DEFAULT_COMPRESSION,
+                 flush='sync'):
+        """
+        Wrap a socket with zlib compression.
+
+        Arguments:
+            socket -- The socket to wrap.
+            level  -- The compression level, from 0 to 9.
+                      Defaults to zlib.Z_DEFAULT_COMPRESSION.
+            flush  -- Either 'sync' or 'full'. Defaults to 'sync'.
+        """
+        if flush not in FLUSH_MODES:
+            raise ValueError("Unknown flush mode: %s" % flush)
+        self.socket = socket
+        self.level = level
+        self.flush = flush
+        self._flush_mode = FLUSH_MODES[flush]
+        self._compress = zlib.compressobj(level)
+        self._decompress = zlib.decompressobj()
+        self._inbox = b''
+        self._outbox = b''
+        self._owed = 0
+        self._counters = {'sent': 0,
+                          'sent_compressed': 0,
+                          'received': 0,
+                          'received_compressed': 0}
+
+    def __getattr__(self, name):
+        """
+        Pass other attributes through to the underlying socket.
+
+        Arguments:
+            name -- Name of the attribute requested.
+        """
+        return getattr(self.socket, name)
+
+    def send(self, data, *args):
+        """
+        Compress and send data, returning the number of
+        uncompressed bytes sent.
+
+        Arguments:
+            data -- The data to send.
+        """
+        if self._outbox:
+            self._write_outbox()
+            if self._outbox:
+                return 0
+            if self._owed:
+                owed, self._owed = self._owed, 0
+                return owed
+        if not len(data):
+            return 0
+        self._outbox = self._deflate(data)
+        try:
+            self._write_outbox()
+        except WOULD_BLOCK:
+            pass
+        if self._outbox:
+            self._owed = 1
+            return len(data) - 1
+        return len(data)
+
+    def sendall(self, data, *args):
+        """
+        Compress and send data.
+
+        Arguments:
+            data -- The data to send.
+        """
+        if self._outbox:
+            self.socket.sendall(self._outbox)
+            self._outbox = b''
+        self.socket.sendall(self._deflate(data))
+
+    def recv(self, size, *args):
+        """
+        Receive and decompress up to size bytes of data.
+
+        Returns an empty value once the connection has closed.
+
+        Arguments:
+            size -- The maximum number of bytes to return.
+        """
+        if not self._fill(size):
+            return b''
+        data = self._inbox[:size]
+        self._inbox = self._inbox[size:]
+        return data
+
+    def recv_into(self, buffer, nbytes=0, *args):
+        """
+        Receive and decompress data into a buffer.
+
+        Returns the number of bytes received, or 0 once the
+        connection has closed.
+
+        Arguments:
+            buffer -- A writable buffer to receive into.
+            nbytes -- The maximum number of bytes to receive.
+                      Defaults to the size of the buffer.
+        """
+        data = self.recv(nbytes or len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def pending(self):
+        """
+        Return the number of bytes that may be read without waiting
+        for the underlying socket to become readable.
+        """
+        ready = len(self._inbox) + len(self._decompress.unconsumed_tail)
+        pending = getattr(self.socket, 'pending', None)
+        if pending is not None:
+            ready += pending()
+        return ready
+
+    def stats(self):
+        """
+        Return a dictionary of the number of bytes sent and received,
+        before and after compression, and the compression ratio in
+        each direction.
+        """
+        stats = dict(self._counters)
+        stats['send_ratio'] = self._ratio(stats['sent'],
+                                          stats['sent_compressed'])
+        stats['recv_ratio'] = self._ratio(stats['received'],
+                                          stats['received_compressed'])
+        return stats
+
+    def _ratio(self, raw, compressed):
+        """
+        Return the ratio of uncompressed to compressed sizes.
+
+        Arguments:
+            raw        -- The number of uncompressed bytes.
+            compressed -- The number of compressed bytes.
+        """
+        if not compressed:
+            return 1.0
+        return float(raw) / compressed
+
+    def _deflate(self, data):
+        """
+        Return compressed and flushed data.
+
+        Arguments:
+            data -- The data to compress.
+        """
+        compressed = self._compress.compress(bytes(data)) + \
+                     self._compress.flush(self._flush_mode)
+        self._counters['sent'] += len(data)
+        self._counters['sent_compressed'] += len(compressed)
+        return compressed
+
+    def _write_outbox(self):
+        """Write as much kept compressed data as the socket accepts."""
+        sent = self.socket.send(self._outbox)
+        self._outbox = self._outbox[sent:]
+
+    def _fill(self, size):
+        """
+        Decompress received data until some is ready to be read.
+
+        Returns False if the connection has closed.
+
+        Arguments:
+            size -- The maximum number of bytes to decompress at once.
+        """
+        while not self._inbox:
+            tail = self._decompress.unconsumed_tail
+            if not tail:
+                tail = self.socket.recv(size)
+                if not tail:
+                    return False
+                self._counters['received_compressed'] += len(tail)
+            self._inbox = self._decompress.decompress(tail, size)
+            self._counters['received'] += len(self._inbox)
+        return True
+
+
+class xep_0138(base.base_plugin):
+
+    """
+    XEP-0138: Stream Compression
+
+    Negotiates zlib compression when the server offers it, after
+    authentication and before resource binding, and restarts the
+    stream over a compressed socket.
+
+    Configuration:
+        level -- The zlib compression level. Defaults to
+                 zlib.Z_DEFAULT_COMPRESSION.
+        flush -- The flush mode after each write, either 'sync'
+                 or 'full'. Defaults to 'sync'.
+
+    Events:
+        stream_compressed  -- The stream is now compressed.
+        compression_failed -- The server refused to compress
+                              the stream.
+    """
+
+    def plugin_init(self):
+        self.description = "Stream Compression"
+        self.xep = "0138"
+        self.level = self.config.get('level', zlib.Z_DEFAULT_COMPRESSION)
+        self.flush = self.config.get('flush', 'sync')
+        self.compressed_socket = None
+        self.failed = False
+
+        self.xmpp.register_feature(
+                "<compression xmlns='%s' />" % FEATURE_NS,
+                self._handle_compression, True, order=200)
+        self.xmpp.register_handler(
+                Callback('Compression Success',
+                         MatchXPath('{%s}compressed' % PROTOCOL_NS),
+                         self._handle_compressed,
+                         instream=True))
+        self.xmpp.register_handler(
+                Callback('Compression Failure',
+                         MatchXPath('{%s}failure' % PROTOCOL_NS),
+                         self._handle_failure))
+        self.xmpp.add_event_handler('connected', self._reset)
+
+    def stats(self):
+        """
+        Return the compression statistics for the current connection,
+        or None if the stream is not compressed. See ZlibSocket.stats.
+        """
+        if self.compressed_socket is None:
+            return None
+        return self.compressed_socket.stats()
+
+    def _reset(self, event=None):
+        """Forget the compression state of the previous connection."""
+        self.compressed_socket = None
+        self.failed = False
+
+    def _handle_compression(self, xml):
+        """
+        Request compression if the server supports zlib.
+
+        Arguments:
+            xml -- The compression feature element.
+        """
+        if self.compressed_socket is not None or self.failed:
+            return False
+        methods = [method.text for method in \
+                   xml.findall('{%s}method' % FEATURE_NS)]
+        if 'zlib' not in methods:
+            return False
+        log.debug("Requesting stream compression")
+        self.xmpp.send_raw("<compress xmlns='%s'>" % PROTOCOL_NS + \
+                           "<method>zlib</method></compress>")
+        return True
+
+    def _handle_compressed(self, xml):
+        """
+        Wrap the socket with compression and restart the stream.
+
+        Arguments:
+            xml -- The compressed element.
+        """
+        log.debug("Starting stream compression")
+        xmpp = self.xmpp
+        if hasattr(xmpp.socket, 'socket'):
+            # We are using a testing socket, so preserve the top
+            # layer of wrapping.
+            self.compressed_socket = ZlibSocket(xmpp.socket.socket,
+                                                self.level, self.flush)
+            xmpp.socket.socket = self.compressed_socket
+        else:
+            self.compressed_socket = ZlibSocket(xmpp.socket,
+                                                self.level, self.flush)
+            xmpp.set_socket(self.compressed_socket)
+        xmpp.event('stream_compressed', direct=True)
+        raise RestartStream()
+
+    def _handle_failure(self, xml):
+        """
+        Continue negotiating the remaining stream features
+        without compression.
+
+        Arguments:
+            xml -- The failure element.
+        """
+        log.warning("Stream compression failed.")
+        self.failed = True
+        self.xmpp.event('compression_failed', xml)
+        if self.xmpp.stream_features is not None:
+            self.xmpp._handle_stream_features(self.xmpp.stream_features)
@@ -0,0 +1,362 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010 Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import logging
+import re
+import threading
+from collections import deque
+
+from . import base
+from .. xmlstream.handler.callback import Callback
+from .. xmlstream.matcher.xpath import MatchXPath
+
+
+log = logging.getLogger(__name__)
+
+
+SM_NS = 'urn:xmpp:sm:3'
+
+# Stanza counters wrap around at 2^32.
+MAX_SEQ = 2 ** 32
+
+# Sent data that begins with one of these elements is a stanza.
+STANZA_START = re.compile(r'\s*<(message|presence|iq)[\s/>]')
+
+
+class xep_0198(base.base_plugin):
+
+    """
+    XEP-0198: Stream Management
+
+    Counts the stanzas sent and received on the stream, requests and
+    answers acknowledgements, and keeps sent stanzas until the server
+    acknowledges them. When the connection is lost, the session is
+    resumed on the new connection if the server allows it, instead of
+    authenticating and binding a resource again, and the stanzas the
+    server did not receive are sent again.
+
+    Sent stanzas are counted as they are written to the socket, and
+    received stanzas as they are read, using stream filters.
+
+    Configuration:
+        window -- The number of stanzas to send before requesting
+                  an acknowledgement. Defaults to 5.
+        resume -- Flag indicating if session resumption should be
+                  requested. Defaults to True.
+
+    Attributes:
+        enabled  -- Indicates if stream management is active.
+        sm_id    -- The server's ID for the resumable session, or None.
+        handled  -- The number of stanzas received from the server.
+        seq      -- The number of stanzas sent to the server.
+        last_ack -- The number of sent stanzas acknowledged.
+        unacked  -- A queue of sent stanzas not yet acknowledged.
+
+    Events:
+        sm_enabled      -- Stream management was enabled.
+        session_resumed -- The previous session was resumed.
+        sm_failed       -- Enabling or resuming failed.
+
+    Methods:
+        request_ack -- Ask the server to acknowledge received stanzas.
+        stats       -- Return counters for the current session.
+    """
+
+    def plugin_init(self):
+        self.description = "Stream Management"
+        self.xep = "0198"
+        self.window = self.config.get('window', 5)
+        self.allow_resume = self.config.get('resume', True)
+
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.sm_id = None
+        self.handled = 0
+        self.seq = 0
+        self.last_ack = 0
+        self.unacked = deque()
+        self.counters = {'resumed': 0, 'resent': 0, 'acks': 0}
+        self._counting_in = False
+        self._counting_out = False
+        self._since_request = 0
+        self._resuming = False
+
+        self._enable_data = "<enable xmlns='%s' resume='%s' />" % (
+                SM_NS, 'true' if self.allow_resume else 'false')
+        self._request_data = "<r xmlns='%s' />" % SM_NS
+
+        # Resuming replaces resource binding, while enabling
+        # must follow it.
+        self.xmpp.register_feature("<sm xmlns='%s' />" % SM_NS,
+                                   self._handle_resume_feature, True,
+                                   order=9000)
+        self.xmpp.register_feature("<sm xmlns='%s' />" % SM_NS,
+                                   self._handle_enable_feature,
+                                   order=10050)
+
+        for name, tag, handler, instream in (
+                ('Enabled', 'enabled', self._handle_enabled, True),
+                ('Resumed', 'resumed', self._handle_resumed, False),
+                ('Failed', 'failed', self._handle_failed, False),
+                ('Ack Request', 'r', self._handle_request, True),
+                ('Ack Answer', 'a', self._handle_ack, True)):
+            self.xmpp.register_handler(
+                    Callback('Stream Management %s' % name,
+                             MatchXPath('{%s}%s' % (SM_NS, tag)),
+                             handler,
+                             instream=instream))
+
+        self.xmpp.add_filter('in', self._filter_in)
+        self.xmpp.add_filter('out', self._filter_out)
+        self.xmpp.add_event_handler('disconnected', self._disconnected)
+
+    def request_ack(self):
+        """Ask the server to acknowledge the stanzas it has received."""
+        if self.enabled:
+            self.xmpp.send_raw(self._request_data)
+
+    def stats(self):
+        """
+        Return a dictionary of stream management counters:
+            seq      -- Stanzas sent in this session.
+            handled  -- Stanzas received in this session.
+            unacked  -- Sent stanzas awaiting acknowledgement.
+            acks     -- Acknowledgements received.
+            resumed  -- Sessions resumed.
+            resent   -- Stanzas sent again after resuming.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['seq'] = self.seq
+            stats['handled'] = self.handled
+            stats['unacked'] = len(self.unacked)
+        return stats
+
+    def _reset(self):
+        """Forget the previous session's state."""
+        with self.lock:
+            self.enabled = False
+            self.sm_id = None
+            self.handled = 0
+            self.seq = 0
+            self.last_ack = 0
+            self.unacked.clear()
+            self._counting_in = False
+            self._counting_out = False
+            self._since_request = 0
+
+    # ------------------------------------------------------------------
+    # Stream filters
+
+    def _filter_in(self, xml):
+        """
+        Count stanzas received from the server.
+
+        Arguments:
+            xml -- The received XML object.
+        """
+        if self._counting_in and xml.tag in self._stanza_tags():
+            with self.lock:
+                self.handled = (self.handled + 1) % MAX_SEQ
+        return xml
+
+    def _filter_out(self, data):
+        """
+        Count and keep stanzas as they are written to the socket,
+        requesting an acknowledgement every window stanzas.
+
+        Arguments:
+            data -- The string being sent.
+        """
+        if data.startswith(self._enable_data):
+            # The server counts stanzas sent after the enable request.
+            with self.lock:
+                self.seq = 0
+                self.last_ack = 0
+                self.unacked.clear()
+                self._since_request = 0
+                self._counting_out = True
+            return data
+        if not self._counting_out or not STANZA_START.match(data):
+            return data
+        with self.lock:
+            self.seq = (self.seq + 1) % MAX_SEQ
+            self.unacked.append(data)
+            self._since_request += 1
+            if self._since_request < self.window:
+                return data
+            self._since_request = 0
+        return data + self._request_data
+
+    def _stanza_tags(self):
+        """Return the names of counted stanzas in the stream namespace."""
+        ns = self.xmpp.default_ns
+        return ('{%s}message' % ns, '{%s}presence' % ns, '{%s}iq' % ns)
+
+    # ------------------------------------------------------------------
+    # Negotiation
+
+    def _handle_resume_feature(self, xml):
+        """
+        Resume the previous session instead of binding a resource.
+
+        Arguments:
+            xml -- The stream management feature element.
+        """
+        if self.sm_id is None or not self.xmpp.authenticated:
+            return False
+        log.debug("Resuming session %s" % self.sm_id)
+        self._resuming = True
+        self.xmpp.send_raw("<resume xmlns='%s' h='%s' previd='%s' />" % (
+                SM_NS, self.handled, self.sm_id))
+        return True
+
+    def _handle_enable_feature(self, xml):
+        """
+        Enable stream management once a resource is bound.
+
+        Arguments:
+            xml -- The stream management feature element.
+        """
+        if self.enabled or not self.xmpp.bound:
+            return False
+        self.xmpp.send_raw(self._enable_data)
+        return False
+
+    def _handle_enabled(self, stanza):
+        """
+        Start counting received stanzas once the server has
+        enabled stream management.
+
+        Arguments:
+            stanza -- The enabled element.
+        """
+        resume = stanza.xml.attrib.get('resume', 'false') in ('true', '1')
+        with self.lock:
+            self.enabled = True
+            self.handled = 0
+            self._counting_in = True
+            if resume and self.allow_resume:
+                self.sm_id = stanza.xml.attrib.get('id', None)
+        log.debug("Stream management enabled, session %s" % self.sm_id)
+        self.xmpp.event('sm_enabled', stanza)
+
+    def _handle_resumed(self, stanza):
+        """
+        Restore the session and send the stanzas that the server
+        did not receive.
+
+        Arguments:
+            stanza -- The resumed element.
+        """
+        self._resuming = False
+        with self.lock:
+            self._acknowledge(int(stanza.xml.attrib.get('h', 0)))
+            resend = list(self.unacked)
+            self.unacked.clear()
+            self.seq = self.last_ack
+            self._since_request = 0
+            self.enabled = True
+            self._counting_out = True
+            self.counters['resumed'] += 1
+            self.counters['resent'] += len(resend)
+
+        xmpp = self.xmpp
+        xmpp.bound = True
+        xmpp.sessionstarted = True
+        xmpp.session_started_event.set()
+        log.debug("Resumed session %s, sending %s stanzas again" % (
+                  self.sm_id, len(resend)))
+        for data in resend:
+            xmpp.send_raw(data)
+        xmpp.event('session_resumed', stanza)
+
+    def _handle_failed(self, stanza):
+        """
+        Continue without stream management, negotiating a new
+        session if resuming failed.
+
+        Arguments:
+            stanza -- The failed element.
+        """
+        resuming = self._resuming
+        self._resuming = False
+        lost = len(self.unacked)
+        self._reset()
+        self.xmpp.event('sm_failed', stanza)
+        if not resuming:
+            log.warning("Could not enable stream management.")
+            return
+        log.warning("Could not resume session, %s stanzas lost." % lost)
+        if self.xmpp.stream_features is not None:
+            self.xmpp._handle_stream_features(self.xmpp.stream_features)
+
+    # ------------------------------------------------------------------
+    # Acknowledgements
+
+    def _handle_request(self, stanza):
+        """
+        Tell the server how many stanzas have been received.
+
+        Arguments:
+            stanza -- The ack request element.
+        """
+        self.xmpp.send_raw("<a xmlns='%s' h='%s' />" % (SM_NS, self.handled))
+
+    def _handle_ack(self, stanza):
+        """
+        Discard sent stanzas that the server has acknowledged.
+
+        Arguments:
+            stanza -- The ack element.
+        """
+        with self.lock:
+            self.counters['acks'] += 1
+            self._acknowledge(int(stanza.xml.attrib.get('h', 0)))
+
+    def _acknowledge(self, h):
+        """
+        Discard sent stanzas up to the server's count. Must be
+        called with the lock held.
+
+        Arguments:
+            h -- The number of stanzas the server has received.
+        """
+        count = (h - self.last_ack) % MAX_SEQ
+        if count > len(self.unacked):
+            log.warning("Server acknowledged %s stanzas, " % count + \
+                        "only %s were sent." % len(self.unacked))
+            count = len(self.unacked)
+        for i in range(count):
+            self.unacked.popleft()
+        self.last_ack = h % MAX_SEQ
+
+    def _disconnected(self, event=None):
+        """
+        Keep the stanzas still waiting to be sent so that they may
+        be sent again if the session is resumed.
+
+        Arguments:
+            event -- Unused data given by the disconnected event.
+        """
+        with self.lock:
+            self.enabled = False
+            self._counting_out = False
+            if self.sm_id is None or not self.xmpp.auto_reconnect:
+                return
+        pending = []
+        self.xmpp._drain_send_queue(pending)
+        while pending:
+            with self.lock:
+                for data in pending:
+                    if STANZA_START.match(data):
+                        self.unacked.append(data)
+            pending = []
+            self.xmpp._drain_send_queue(pending)
@@ -0,0 +1,13 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from sleekxmpp.roster.item import RosterItem, ResourcePresence
+from sleekxmpp.roster.store import RosterStore, SQLiteRosterStore
+
+__all__ = ['RosterItem', 'ResourcePresence',
+           'RosterStore', 'SQLiteRosterStore']
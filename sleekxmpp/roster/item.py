@@ -0,0 +1,204 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import sys
+
+if sys.version_info >= (3, 0):
+    from sys import intern
+
+
+def intern_str(value):
+    """
+    Return the interned copy of a string, so that equal strings
+    held in many places share one object.
+
+    Values which can not be interned, such as unicode objects in
+    Python 2.x, are returned unchanged.
+
+    Arguments:
+        value -- The string to intern.
+    """
+    try:
+        return intern(value)
+    except TypeError:
+        return value
+
+
+class SlotMapping(object):
+
+    """
+    A compact record which may also be used as a dictionary.
+
+    Values are kept in __slots__ instead of a per-object dictionary,
+    which saves memory when many records are held, while code that
+    expects a dictionary may still use item access, get, update,
+    keys, items, and comparison with dictionaries.
+
+    Only the keys named in __slots__ are allowed, and every key
+    always has a value.
+
+    Methods:
+        get    -- Return a value, or a default for unknown keys.
+        update -- Set values from a dictionary or keyword arguments.
+        keys   -- Return a list of the keys.
+        values -- Return a list of the values.
+        items  -- Return a list of (key, value) tuples.
+    """
+
+    __slots__ = ()
+    __hash__ = None
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, (SlotMapping, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, key, default=None):
+        """
+        Return the value for a key, or a default value if the
+        key is unknown.
+
+        Arguments:
+            key     -- The name of the value.
+            default -- The value to return for unknown keys.
+        """
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def update(self, values=None, **kwargs):
+        """
+        Set values from a dictionary, keyword arguments, or both.
+
+        Arguments:
+            values -- Optional dictionary of new values.
+        """
+        if values is not None:
+            for key in values:
+                self[key] = values[key]
+        for key in kwargs:
+            self[key] = kwargs[key]
+
+    def keys(self):
+        """Return a list of the keys."""
+        return list(self.__slots__)
+
+    def values(self):
+        """Return a list of the values."""
+        return [getattr(self, key) for key in self.__slots__]
+
+    def items(self):
+        """Return a list of (key, value) tuples."""
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+
+class ResourcePresence(SlotMapping):
+
+    """
+    The presence of one of a JID's connected resources.
+
+    Show values are interned, since only a few distinct values
+    are ever used.
+
+    Attributes:
+        show     -- The presence type, such as 'available' or 'away'.
+        status   -- The status message.
+        priority -- The resource's priority.
+    """
+
+    __slots__ = ('show', 'status', 'priority')
+
+    def __init__(self, show='unavailable', status='', priority=0):
+        """
+        Create a new resource presence entry.
+
+        Arguments:
+            show     -- The presence type. Defaults to 'unavailable'.
+            status   -- The status message.
+            priority -- The resource's priority.
+        """
+        self.show = intern_str(show)
+        self.status = status
+        self.priority = priority
+
+    def __setitem__(self, key, value):
+        if key == 'show':
+            value = intern_str(value)
+        SlotMapping.__setitem__(self, key, value)
+
+
+class RosterItem(SlotMapping):
+
+    """
+    A JID in the roster, or a JID that has sent presence, with the
+    presence of each of its connected resources.
+
+    Subscription states are interned, since only a few distinct
+    values are ever used.
+
+    Attributes:
+        name         -- An alias or nickname for the JID.
+        subscription -- The subscription type, such as 'both'.
+        groups       -- A list of group names for the JID.
+        presence     -- A dictionary of ResourcePresence entries,
+                        keyed by resource.
+        in_roster    -- Indicates if the JID is in the roster, or is
+                        only tracked because it sent presence.
+    """
+
+    __slots__ = ('groups', 'name', 'subscription', 'presence', 'in_roster')
+
+    def __init__(self, name='', subscription='none', groups=None,
+                 in_roster=False):
+        """
+        Create a new roster item.
+
+        Arguments:
+            name         -- An alias or nickname for the JID.
+            subscription -- The subscription type. Defaults to 'none'.
+            groups       -- A list of group names for the JID.
+            in_roster    -- Indicates if the JID is in the roster.
+        """
+        self.name = name
+        self.subscription = intern_str(subscription)
+        self.groups = groups if groups is not None else []
+        self.presence = {}
+        self.in_roster = in_roster
+
+    def __setitem__(self, key, value):
+        if key == 'subscription':
+            value = intern_str(value)
+        SlotMapping.__setitem__(self, key, value)
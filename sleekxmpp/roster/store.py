@@ -0,0 +1,189 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import copy
+import json
+import logging
+import threading
+
+# Flag indicating if SQLite is available for storing rosters.
+SQLITE_SUPPORT = True
+try:
+    import sqlite3
+except ImportError:
+    SQLITE_SUPPORT = False
+
+
+log = logging.getLogger(__name__)
+
+
+class RosterStore(object):
+
+    """
+    Keeps a copy of each account's roster and its roster version,
+    so that a client using roster versioning only needs to receive
+    the changes made since the version it has.
+
+    Rosters are stored as dictionaries keyed by JID, where each item
+    is a dictionary with the keys 'name', 'subscription', and 'groups',
+    as in the Roster stanza's items interface.
+
+    This class keeps rosters in memory for the life of the process.
+    Subclasses store them elsewhere by overriding load, save, and
+    update.
+
+    Methods:
+        load   -- Return the stored version and items of a roster.
+        save   -- Replace a stored roster.
+        update -- Apply changed items to a stored roster.
+    """
+
+    def __init__(self):
+        """Create a new, empty roster store."""
+        self._rosters = {}
+        self._lock = threading.Lock()
+
+    def load(self, owner):
+        """
+        Return a tuple of the roster version and a dictionary of
+        roster items. The version is None if nothing is stored.
+
+        Arguments:
+            owner -- The bare JID of the roster's owner.
+        """
+        with self._lock:
+            version, items = self._rosters.get(owner, (None, {}))
+            return (version, copy.deepcopy(items))
+
+    def save(self, owner, version, items):
+        """
+        Replace the stored roster with a full roster.
+
+        Arguments:
+            owner   -- The bare JID of the roster's owner.
+            version -- The roster version.
+            items   -- A dictionary of roster items.
+        """
+        with self._lock:
+            self._rosters[owner] = (version, copy.deepcopy(items))
+
+    def update(self, owner, version, items):
+        """
+        Apply changed roster items, such as from a roster push,
+        and record the new roster version. Items with a subscription
+        of 'remove' are deleted.
+
+        Arguments:
+            owner   -- The bare JID of the roster's owner.
+            version -- The new roster version.
+            items   -- A dictionary of changed roster items.
+        """
+        with self._lock:
+            stored = self._rosters.get(owner, (None, {}))[1]
+            for jid, item in items.items():
+                if item.get('subscription', '') == 'remove':
+                    stored.pop(jid, None)
+                else:
+                    stored[jid] = copy.deepcopy(item)
+            self._rosters[owner] = (version, stored)
+
+
+class SQLiteRosterStore(RosterStore):
+
+    """
+    Keeps rosters in an SQLite database, so that they outlast the
+    process and only the changes made while the client was offline
+    are sent by the server when it starts again.
+
+    Attributes:
+        path -- The database's file name.
+
+    Methods:
+        close -- Close the database.
+    """
+
+    def __init__(self, path):
+        """
+        Open, or create, a roster database.
+
+        Arguments:
+            path -- The database's file name.
+        """
+        if not SQLITE_SUPPORT:
+            raise ImportError("The sqlite3 module is not available.")
+        RosterStore.__init__(self)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS versions (" + \
+                                 "owner TEXT PRIMARY KEY, version TEXT)")
+                self._db.execute("CREATE TABLE IF NOT EXISTS items (" + \
+                                 "owner TEXT, jid TEXT, name TEXT, " + \
+                                 "subscription TEXT, groups TEXT, " + \
+                                 "PRIMARY KEY (owner, jid))")
+
+    def load(self, owner):
+        with self._lock:
+            row = self._db.execute("SELECT version FROM versions " + \
+                                   "WHERE owner = ?", (owner,)).fetchone()
+            if row is None:
+                return (None, {})
+            items = {}
+            for jid, name, subscription, groups in self._db.execute(
+                    "SELECT jid, name, subscription, groups FROM items " + \
+                    "WHERE owner = ?", (owner,)):
+                items[jid] = {'name': name,
+                              'subscription': subscription,
+                              'groups': json.loads(groups)}
+            return (row[0], items)
+
+    def save(self, owner, version, items):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM items WHERE owner = ?",
+                                 (owner,))
+                self._write(owner, version, items)
+
+    def update(self, owner, version, items):
+        with self._lock:
+            with self._db:
+                self._write(owner, version, items)
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+    def _write(self, owner, version, items):
+        """
+        Store roster items and the roster version. Must be called
+        with the lock held, inside a transaction.
+
+        Arguments:
+            owner   -- The bare JID of the roster's owner.
+            version -- The roster version.
+            items   -- A dictionary of roster items.
+        """
+        removed = []
+        rows = []
+        for jid, item in items.items():
+            subscription = item.get('subscription', '')
+            if subscription == 'remove':
+                removed.append((owner, jid))
+            else:
+                rows.append((owner, jid, item.get('name', ''), subscription,
+                             json.dumps(list(item.get('groups', [])))))
+        self._db.executemany("DELETE FROM items WHERE owner = ? " + \
+                             "AND jid = ?", removed)
+        self._db.executemany("INSERT OR REPLACE INTO items " + \
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+        self._db.execute("INSERT OR REPLACE INTO versions VALUES (?, ?)",
+                         (owner, version))
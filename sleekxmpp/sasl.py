@@ -0,0 +1,405 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import sys
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+# The largest number of derived SCRAM keys to keep.
+SCRAM_CACHE_SIZE = 1024
+
+
+class SASLError(Exception):
+    """
+    Exception raised when a SASL exchange can not continue, such as
+    when the server sends an invalid challenge or fails to prove
+    that it knows the password.
+    """
+
+
+def _to_bytes(text):
+    """Return text encoded as UTF-8, if it is not already bytes."""
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8')
+
+
+def _xor(a, b):
+    """Return the exclusive or of two byte strings of equal length."""
+    if sys.version_info < (3, 0):
+        return b''.join([chr(ord(x) ^ ord(y)) for x, y in zip(a, b)])
+    return bytes([x ^ y for x, y in zip(a, b)])
+
+
+def _equal(a, b):
+    """
+    Compare two byte strings in time that does not depend on
+    where they differ, so that a signature can not be guessed
+    one byte at a time.
+    """
+    if hasattr(hmac, 'compare_digest'):
+        return hmac.compare_digest(a, b)
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(bytearray(a), bytearray(b)):
+        result |= x ^ y
+    return result == 0
+
+
+def _hi(name, password, salt, iterations):
+    """
+    The Hi function of RFC 5802, which is PBKDF2 with HMAC
+    and an output the length of the hash.
+
+    Arguments:
+        name       -- The name of the hash function, such as 'sha1'.
+        password   -- The password, as bytes.
+        salt       -- The salt, as bytes.
+        iterations -- The iteration count.
+    """
+    if hasattr(hashlib, 'pbkdf2_hmac'):
+        return hashlib.pbkdf2_hmac(name, password, salt, iterations)
+    digest = getattr(hashlib, name)
+    mac = hmac.new(password, digestmod=digest)
+
+    def prf(data):
+        h = mac.copy()
+        h.update(data)
+        return h.digest()
+
+    u = prf(salt + b'\x00\x00\x00\x01')
+    result = u
+    for i in range(iterations - 1):
+        u = prf(u)
+        result = _xor(result, u)
+    return result
+
+
+class Mechanism(object):
+
+    """
+    A SASL mechanism, which produces the client's side of
+    an authentication exchange.
+
+    A new mechanism object is created for each exchange. Mechanisms
+    are chosen by ClientXMPP from those offered by the server,
+    preferring higher priorities.
+
+    Attributes:
+        name     -- The name of the mechanism, such as 'PLAIN'.
+        priority -- The preference for the mechanism over others.
+        username -- The user name to authenticate as.
+        password -- The password to authenticate with.
+
+    Methods:
+        available -- Return True if the mechanism may be used.
+        start     -- Return the initial response.
+        challenge -- Return the response to a server challenge.
+        success   -- Verify data sent with the server's success.
+    """
+
+    name = None
+    priority = 0
+
+    def __init__(self, username, password):
+        """
+        Create a new authentication exchange.
+
+        Arguments:
+            username -- The user name to authenticate as.
+            password -- The password to authenticate with.
+        """
+        self.username = username
+        self.password = password
+
+    @classmethod
+    def available(cls, username, password):
+        """
+        Return True if the mechanism may be used with the
+        given credentials.
+
+        Arguments:
+            username -- The user name to authenticate as.
+            password -- The password to authenticate with.
+        """
+        return True
+
+    def start(self):
+        """
+        Return the initial response as bytes, or None if there is
+        no initial response.
+        """
+        return None
+
+    def challenge(self, data):
+        """
+        Return the response to a server challenge as bytes.
+
+        Arguments:
+            data -- The decoded challenge.
+        """
+        raise SASLError("Unexpected challenge for %s." % self.name)
+
+    def success(self, data):
+        """
+        Verify any additional data sent with the server's success
+        element. Raises SASLError if the data is not valid.
+
+        Arguments:
+            data -- The decoded additional data, which may be empty.
+        """
+        pass
+
+
+class PLAIN(Mechanism):
+
+    """
+    The PLAIN mechanism of RFC 4616, which sends the password
+    to the server.
+    """
+
+    name = 'PLAIN'
+    priority = 10
+
+    @classmethod
+    def available(cls, username, password):
+        return bool(username)
+
+    def start(self):
+        return b'\x00' + _to_bytes(self.username) + \
+               b'\x00' + _to_bytes(self.password)
+
+
+class ANONYMOUS(Mechanism):
+
+    """
+    The ANONYMOUS mechanism of RFC 4505, used when no user
+    name is given.
+    """
+
+    name = 'ANONYMOUS'
+    priority = 0
+
+    @classmethod
+    def available(cls, username, password):
+        return not username
+
+
+class SCRAMKeyCache(object):
+
+    """
+    A cache of the keys SCRAM derives from a password.
+
+    Deriving the salted password takes thousands of hash iterations
+    by design. Servers keep the same salt and iteration count for an
+    account, so the keys derived for an account are reused on every
+    reconnect instead of being derived again.
+
+    Keys are stored per account, password, hash function, salt, and
+    iteration count, so changing any of these derives new keys.
+
+    Attributes:
+        max_size -- The largest number of keys to keep.
+        stats    -- A dictionary counting cache hits and misses.
+
+    Methods:
+        get   -- Return the client and server keys for an account.
+        clear -- Forget all cached keys.
+    """
+
+    def __init__(self, max_size=SCRAM_CACHE_SIZE):
+        """
+        Create a new key cache.
+
+        Arguments:
+            max_size -- The largest number of keys to keep.
+                        Defaults to SCRAM_CACHE_SIZE.
+        """
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, username, password, salt, iterations):
+        """
+        Return a tuple of the ClientKey and ServerKey for an account,
+        deriving them if they are not cached.
+
+        Arguments:
+            name       -- The name of the hash function, such as 'sha1'.
+            username   -- The account's user name.
+            password   -- The password, as bytes.
+            salt       -- The salt, as bytes.
+            iterations -- The iteration count.
+        """
+        key = (name, username, password, salt, iterations)
+        with self._lock:
+            keys = self._keys.get(key, None)
+            if keys is not None:
+                self.stats['hits'] += 1
+                return keys
+            self.stats['misses'] += 1
+
+        digest = getattr(hashlib, name)
+        salted = _hi(name, password, salt, iterations)
+        keys = (hmac.new(salted, b'Client Key', digest).digest(),
+                hmac.new(salted, b'Server Key', digest).digest())
+        with self._lock:
+            if len(self._keys) >= self.max_size:
+                del self._keys[next(iter(self._keys))]
+            self._keys[key] = keys
+        return keys
+
+    def clear(self):
+        """Forget all cached keys."""
+        with self._lock:
+            self._keys.clear()
+
+
+# The key cache shared by all clients in the process.
+SCRAM_KEYS = SCRAMKeyCache()
+
+
+class SCRAM(Mechanism):
+
+    """
+    The Salted Challenge Response Authentication Mechanism of
+    RFC 5802, without channel binding.
+
+    The password is never sent to the server, and the server proves
+    that it knows the password too. The keys derived from the
+    password are kept in a SCRAMKeyCache.
+
+    Attributes:
+        hash_name -- The name of the hash function in hashlib.
+        cache     -- The SCRAMKeyCache to use. Defaults to SCRAM_KEYS.
+        cnonce    -- Optional fixed client nonce, for testing.
+                     A random nonce is used by default.
+    """
+
+    hash_name = None
+    cache = SCRAM_KEYS
+    cnonce = None
+
+    @classmethod
+    def available(cls, username, password):
+        return bool(username) and password is not None
+
+    def start(self):
+        if self.cnonce is None:
+            self.cnonce = base64.b64encode(os.urandom(24)).decode('utf-8')
+        username = self.username.replace('=', '=3D').replace(',', '=2C')
+        self._client_first = 'n=%s,r=%s' % (username, self.cnonce)
+        self._server_signature = None
+        self._verified = False
+        return _to_bytes('n,,' + self._client_first)
+
+    def challenge(self, data):
+        if self._server_signature is not None:
+            # Some servers send their final message as a challenge,
+            # followed by a success without data.
+            self._verify(data)
+            return b''
+        server_first = data.decode('utf-8')
+        attributes = self._parse(server_first)
+        if 'm' in attributes:
+            raise SASLError("Unsupported SCRAM extension.")
+        try:
+            nonce = attributes['r']
+            salt = base64.b64decode(_to_bytes(attributes['s']))
+            iterations = int(attributes['i'])
+        except (KeyError, ValueError, TypeError):
+            raise SASLError("Invalid SCRAM challenge: %s" % server_first)
+        if not nonce.startswith(self.cnonce) or iterations < 1:
+            raise SASLError("Invalid SCRAM challenge: %s" % server_first)
+
+        digest = getattr(hashlib, self.hash_name)
+        client_key, server_key = self.cache.get(
+                self.hash_name, self.username, _to_bytes(self.password),
+                salt, iterations)
+        stored_key = digest(client_key).digest()
+
+        client_final = 'c=biws,r=%s' % nonce
+        auth_message = _to_bytes('%s,%s,%s' % (self._client_first,
+                                               server_first,
+                                               client_final))
+        signature = hmac.new(stored_key, auth_message, digest).digest()
+        proof = base64.b64encode(_xor(client_key, signature))
+        self._server_signature = hmac.new(server_key, auth_message,
+                                          digest).digest()
+        return _to_bytes(client_final) + b',p=' + proof
+
+    def success(self, data):
+        if self._verified and not data:
+            return
+        self._verify(data)
+
+    def _verify(self, data):
+        """
+        Check the server's proof that it knows the password.
+
+        Arguments:
+            data -- The server's final message.
+        """
+        if self._server_signature is None:
+            raise SASLError("Server skipped the SCRAM exchange.")
+        attributes = self._parse(data.decode('utf-8'))
+        if 'e' in attributes:
+            raise SASLError("SCRAM error: %s" % attributes['e'])
+        verifier = base64.b64decode(_to_bytes(attributes.get('v', '')))
+        if not _equal(verifier, self._server_signature):
+            raise SASLError("Server signature is not valid.")
+        self._verified = True
+
+    def _parse(self, message):
+        """
+        Return a dictionary of the attributes in a SCRAM message.
+
+        Arguments:
+            message -- The message, such as 'r=...,s=...,i=4096'.
+        """
+        attributes = {}
+        for item in message.split(','):
+            if '=' in item:
+                key, value = item.split('=', 1)
+                attributes[key] = value
+        return attributes
+
+
+class SCRAM_SHA_1(SCRAM):
+
+    """SCRAM with SHA-1, which all XMPP servers support."""
+
+    name = 'SCRAM-SHA-1'
+    priority = 20
+    hash_name = 'sha1'
+
+
+class SCRAM_SHA_256(SCRAM):
+
+    """SCRAM with SHA-256, as described in RFC 7677."""
+
+    name = 'SCRAM-SHA-256'
+    priority = 30
+    hash_name = 'sha256'
+
+
+# The mechanisms supported by default, by name.
+MECHANISMS = dict([(mech.name, mech) for mech in \
+                   (SCRAM_SHA_256, SCRAM_SHA_1, PLAIN, ANONYMOUS)])
@@ -6,12 +6,20 @@
     See the file LICENSE for copying permission.
 """
 
+from sleekxmpp.exceptions import IqTimeout
 from sleekxmpp.stanza import Error
 from sleekxmpp.stanza.rootstanza import RootStanza
 from sleekxmpp.xmlstream import RESPONSE_TIMEOUT, StanzaBase, ET
-from sleekxmpp.xmlstream.handler import Waiter
+from sleekxmpp.xmlstream.handler import Callback, Waiter
 from sleekxmpp.xmlstream.matcher import MatcherId
 
+# Futures are only available on Python 2 when the futures
+# backport package is installed.
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
 
 class Iq(RootStanza):
 
@@ -60,6 +68,7 @@ class Iq(RootStanza):
         del_query   -- Remove the <query> element.
         reply       -- Overrides StanzaBase.reply
         send        -- Overrides StanzaBase.send
+        send_future -- Send without blocking and return a future.
     """
 
     namespace = 'jabber:client'
@@ -157,7 +166,7 @@ class Iq(RootStanza):
         StanzaBase.reply(self)
         return self
 
-    def send(self, block=True, timeout=RESPONSE_TIMEOUT):
+    def send(self, block=True, timeout=RESPONSE_TIMEOUT, callback=None):
         """
         Send an <iq> stanza over the XML stream.
 
@@ -165,19 +174,81 @@ class Iq(RootStanza):
         a timeout occurs. Be aware that using blocking in non-threaded event
         handlers can drastically impact performance.
 
+        Instead of blocking, a callback may be given to process the
+        response. The send call then returns immediately, so that many
+        requests may await responses at once.
+
+        If the stanza is dropped because the send queue is full, False
+        is returned without waiting for a response, and any callback
+        is given False.
+
         Overrides StanzaBase.send
 
         Arguments:
-            block   -- Specify if the send call will block until a response
-                       is received, or a timeout occurs. Defaults to True.
-            timeout -- The length of time (in seconds) to wait for a response
-                       before exiting the send call if blocking is used.
-                       Defaults to sleekxmpp.xmlstream.RESPONSE_TIMEOUT
+            block    -- Specify if the send call will block until a response
+                        is received, or a timeout occurs. Defaults to True.
+            timeout  -- The length of time (in seconds) to wait for a response
+                        before exiting the send call if blocking is used.
+                        Defaults to sleekxmpp.xmlstream.RESPONSE_TIMEOUT
+            callback -- Optional function to execute with the response
+                        stanza instead of blocking. The function is given
+                        False if the timeout expires first or the stanza
+                        is dropped.
         """
-        if block and self['type'] in ('get', 'set'):
+        if callback is not None and self['type'] in ('get', 'set'):
+            handler = Callback('IqCallback_%s' % self['id'],
+                               MatcherId(self['id']),
+                               callback,
+                               once=True)
+            self.stream.register_response(self['id'], handler, timeout,
+                                          lambda: callback(False))
+            if not StanzaBase.send(self):
+                if self.stream.remove_response(self['id'], handler):
+                    callback(False)
+                return False
+            return True
+        elif block and self['type'] in ('get', 'set'):
             waitfor = Waiter('IqWait_%s' % self['id'], MatcherId(self['id']))
-            self.stream.registerHandler(waitfor)
-            StanzaBase.send(self)
+            self.stream.register_response(self['id'], waitfor, timeout)
+            if not StanzaBase.send(self):
+                self.stream.remove_response(self['id'], waitfor)
+                return False
             return waitfor.wait(timeout)
         else:
             return StanzaBase.send(self)
+
+    def send_future(self, timeout=RESPONSE_TIMEOUT):
+        """
+        Send an <iq> stanza over the XML stream without blocking, and
+        return a concurrent.futures.Future for the response stanza.
+
+        The future's result is the response stanza, which may be of
+        type 'error'. If no response is received before the timeout,
+        the future's exception is set to IqTimeout. Stanzas that do
+        not expect a response complete the future with None.
+
+        Futures may be awaited in asyncio code by using
+        asyncio.wrap_future.
+
+        Arguments:
+            timeout -- The length of time (in seconds) to wait for a
+                       response. Defaults to
+                       sleekxmpp.xmlstream.RESPONSE_TIMEOUT
+        """
+        if Future is None:
+            raise ImportError("Iq.send_future requires concurrent.futures." + \
+                              " On Python 2, install the futures package.")
+        future = Future()
+        if self['type'] not in ('get', 'set'):
+            StanzaBase.send(self)
+            future.set_result(None)
+            return future
+
+        def resolve(stanza):
+            if stanza is False:
+                future.set_exception(IqTimeout(self))
+            else:
+                future.set_result(stanza)
+
+        self.send(timeout=timeout, callback=resolve)
+        return future
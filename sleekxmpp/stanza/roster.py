@@ -26,17 +26,20 @@ class Roster(ElementBase):
     Stanza Inteface:
         items -- A dictionary of roster entries contained
                  in the stanza.
+        ver   -- The roster version, for roster versioning.
 
     Methods:
         get_items -- Return a dictionary of roster entries.
         set_items -- Add <item> elements.
         del_items -- Remove all <item> elements.
+        get_ver   -- Return the roster version.
+        set_ver   -- Set the roster version.
     """
 
     namespace = 'jabber:iq:roster'
     name = 'query'
     plugin_attrib = 'roster'
-    interfaces = set(('items',))
+    interfaces = set(('items', 'ver'))
 
     def setup(self, xml=None):
         """
@@ -55,6 +58,26 @@ class Roster(ElementBase):
 
         return ElementBase.setup(self, xml)
 
+    def get_ver(self):
+        """
+        Return the roster version, or None if the stanza has
+        no version, so that an empty version can be told apart.
+        """
+        return self.xml.attrib.get('ver', None)
+
+    def set_ver(self, ver):
+        """
+        Set the roster version.
+
+        An empty version is kept, since requesting the roster with
+        an empty version asks for the full roster while indicating
+        that roster versioning is supported.
+
+        Arguments:
+            ver -- The roster version.
+        """
+        self.xml.attrib['ver'] = ver
+
     def set_items(self, items):
         """
         Set the roster entries in the <roster> stanza.
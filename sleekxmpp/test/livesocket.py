@@ -24,7 +24,9 @@ class TestLiveSocket(object):
         next_recv -- Return the next received stanza.
         recv_data -- Dummy method to have same interface as TestSocket.
         recv      -- Read the next stanza from the socket.
+        recv_into -- Read data from the socket into a buffer.
         send      -- Write a stanza to the socket.
+        sendall   -- Write a stanza to the socket.
         makefile  -- Dummy call, returns self.
         read      -- Read the next stanza from the socket.
     """
@@ -111,6 +113,20 @@ class TestLiveSocket(object):
         self.recv_queue.put(data)
         return data
 
+    def recv_into(self, buffer, *args, **kwargs):
+        """
+        Read data from the socket into a buffer.
+
+        Store a copy in the receive queue.
+
+        Arguments:
+            buffer -- A writable buffer to read into.
+            Other arguments are the same as for socket.recv_into.
+        """
+        size = self.socket.recv_into(buffer, *args, **kwargs)
+        self.recv_queue.put(bytes(buffer[:size]))
+        return size
+
     def send(self, data):
         """
         Send data on the socket.
@@ -123,6 +139,18 @@ class TestLiveSocket(object):
         self.send_queue.put(data)
         self.socket.send(data)
 
+    def sendall(self, data):
+        """
+        Send all of the data on the socket.
+
+        Store a copy in the send queue.
+
+        Arguments:
+            data -- String value to write.
+        """
+        self.send_queue.put(data)
+        self.socket.sendall(data)
+
     # ------------------------------------------------------------------
     # File Socket
 
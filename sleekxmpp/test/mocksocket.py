@@ -23,7 +23,9 @@ class TestSocket(object):
         next_sent -- Return the next sent stanza.
         recv_data -- Make a stanza available to read next.
         recv      -- Read the next stanza from the socket.
+        recv_into -- Read the next stanza into a buffer.
         send      -- Write a stanza to the socket.
+        sendall   -- Write a stanza to the socket.
         makefile  -- Dummy call, returns self.
         read      -- Read the next stanza from the socket.
     """
@@ -38,6 +40,7 @@ class TestSocket(object):
         self.socket = socket.socket(*args, **kwargs)
         self.recv_queue = queue.Queue()
         self.send_queue = queue.Queue()
+        self.recv_pending = b''
         self.is_live = False
 
     def __getattr__(self, name):
@@ -101,6 +104,32 @@ class TestSocket(object):
         """
         return self.read(block=True)
 
+    def recv_into(self, buffer, nbytes=0, *args, **kwargs):
+        """
+        Read a value from the received queue into a buffer. Data that
+        does not fit is kept for the next read.
+
+        Returns the number of bytes read.
+
+        Arguments:
+            buffer -- A writable buffer to read into.
+            nbytes -- The maximum number of bytes to read. Defaults
+                      to the size of the buffer.
+        """
+        if not nbytes:
+            nbytes = len(buffer)
+        if not self.recv_pending:
+            data = self.read(block=True)
+            if data is None:
+                return 0
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            self.recv_pending = data
+        data = self.recv_pending[:nbytes]
+        self.recv_pending = self.recv_pending[nbytes:]
+        buffer[:len(data)] = data
+        return len(data)
+
     def send(self, data):
         """
         Send data by placing it in the send queue.
@@ -110,6 +139,15 @@ class TestSocket(object):
         """
         self.send_queue.put(data)
 
+    def sendall(self, data):
+        """
+        Send all of the data by placing it in the send queue.
+
+        Arguments:
+            data -- String value to write.
+        """
+        self.send_queue.put(data)
+
     # ------------------------------------------------------------------
     # File Socket
 
@@ -275,6 +275,10 @@ class SleekTest(unittest.TestCase):
         else:
             raise ValueError("Unknown socket type.")
 
+        # Send each stanza in its own write so that sent
+        # stanzas can be checked one at a time.
+        self.xmpp.send_batch_max = 1
+
         self.xmpp.register_plugins()
         self.xmpp.process(threaded=True)
         if skip:
@@ -0,0 +1,409 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import asyncio
+import logging
+import socket as Socket
+import ssl
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from sleekxmpp.xmlstream.recvbuffer import RecvBuffer
+from sleekxmpp.xmlstream.xmlstream import RestartStream
+
+
+log = logging.getLogger(__name__)
+
+
+# Exceptions raised by non-blocking sockets when no data can be
+# read or written without blocking.
+WOULD_BLOCK_READ = (BlockingIOError, InterruptedError, ssl.SSLWantReadError)
+WOULD_BLOCK_WRITE = (BlockingIOError, InterruptedError,
+                     ssl.SSLWantWriteError)
+
+
+class AsyncRunner(object):
+
+    """
+    Drive an XMLStream from an asyncio event loop instead of from the
+    stream's own reader, sender, event runner, and scheduler threads.
+
+    Reading, parsing, matching stanzas to handlers, sending, and running
+    scheduled tasks are all done by coroutines on the given event loop,
+    so many streams can share a single thread.
+
+    Stream and event handlers are still ordinary blocking functions
+    (Iq.send() will block waiting for a response, for example), so they
+    are executed one at a time, in order, using the given executor. By
+    default, that is the event loop's default executor, which is shared
+    by every stream using the loop. Handlers that run during stream
+    processing (instream=True) execute directly on the event loop and
+    must not block. TLS handshakes started by XMLStream.start_tls are
+    completed by the runner, without blocking the loop, before the
+    stream restarts.
+
+    Attributes:
+        stream   -- The XMLStream being driven.
+        loop     -- The asyncio event loop.
+        executor -- The concurrent.futures executor used for handlers.
+                    None selects the loop's default executor.
+
+    Methods:
+        start        -- Begin processing the stream.
+        interrupt    -- Abort any pending socket read.
+        run_threaded -- Execute a threaded event handler.
+        in_io_thread -- Check if running on the event loop's thread.
+    """
+
+    def __init__(self, stream, loop, executor=None):
+        """
+        Create a new runner for a stream.
+
+        Arguments:
+            stream   -- The XMLStream to process.
+            loop     -- The asyncio event loop to use.
+            executor -- Optional executor for running handlers.
+        """
+        self.stream = stream
+        self.loop = loop
+        self.executor = executor
+        self._event_ready = None
+        self._send_ready = None
+        self._schedule_ready = None
+        self._tls_ready = None
+        self._reading = None
+        self._thread = None
+        self._limits = {}
+        self._tasks = []
+
+    def start(self):
+        """
+        Begin processing the stream on the event loop.
+
+        May be called from any thread, whether or not the event loop
+        is running yet.
+        """
+        self.loop.call_soon_threadsafe(self._start)
+
+    def _start(self):
+        """Create the processing coroutines. Runs on the event loop."""
+        self._thread = threading.current_thread()
+        self._event_ready = asyncio.Event()
+        self._send_ready = asyncio.Event()
+        self._schedule_ready = asyncio.Event()
+        self._tls_ready = asyncio.Event()
+        self._tls_ready.set()
+
+        self.stream.event_queue.notify = self._wake(self._event_ready)
+        self.stream.send_queue.notify = self._wake(self._send_ready)
+        self.stream.scheduler.addq.notify = self._wake(self._schedule_ready)
+
+        for coro in (self._read(), self._send(),
+                     self._run_events(), self._run_scheduler()):
+            self._tasks.append(self.loop.create_task(coro))
+
+    def _wake(self, event):
+        """
+        Return a thread safe function that sets an asyncio.Event.
+
+        Arguments:
+            event -- The asyncio.Event to set.
+        """
+        def notify():
+            self.loop.call_soon_threadsafe(event.set)
+        return notify
+
+    def _blocking(self, func, *args):
+        """
+        Execute a blocking function in the executor.
+
+        Arguments:
+            func -- The function to execute.
+            args -- Arguments for the function.
+        """
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def run_threaded(self, func, args, concurrency=None):
+        """
+        Execute an event handler marked as threaded without waiting
+        for it to finish, instead of spawning a new thread.
+
+        Arguments:
+            func        -- The event handler.
+            args        -- Arguments for the event handler.
+            concurrency -- Optional limit on the number of copies of
+                           the handler that may run at once.
+        """
+        if concurrency is None:
+            self.loop.call_soon_threadsafe(
+                    self._blocking, self.stream._threaded_event_wrapper,
+                    func, args)
+        else:
+            self.loop.call_soon_threadsafe(
+                    self._run_limited, func, args, concurrency)
+
+    def _run_limited(self, func, args, concurrency):
+        """
+        Start a threaded event handler once fewer than the given
+        number of copies of it are running. Runs on the event loop.
+
+        Arguments:
+            func        -- The event handler.
+            args        -- Arguments for the event handler.
+            concurrency -- The number of copies that may run at once.
+        """
+        if func not in self._limits:
+            self._limits[func] = asyncio.Semaphore(concurrency)
+        self.loop.create_task(self._limited(self._limits[func], func, args))
+
+    async def _limited(self, limit, func, args):
+        """
+        Execute a threaded event handler while holding a semaphore.
+
+        Arguments:
+            limit -- The handler's asyncio.Semaphore.
+            func  -- The event handler.
+            args  -- Arguments for the event handler.
+        """
+        async with limit:
+            await self._blocking(self.stream._threaded_event_wrapper,
+                                 func, args)
+
+    def in_io_thread(self):
+        """Return True if called from the event loop's thread."""
+        return threading.current_thread() is self._thread
+
+    def interrupt(self):
+        """
+        Abort any pending wait for socket data, such as when the
+        socket is about to be closed.
+        """
+        def cancel():
+            if self._reading is not None and not self._reading.done():
+                self._reading.set_exception(
+                        ConnectionAbortedError('Stream interrupted'))
+        self.loop.call_soon_threadsafe(cancel)
+
+    # ------------------------------------------------------------------
+    # Socket I/O
+
+    def _wait_fd(self, add, remove, fd):
+        """
+        Wait for a file descriptor to become readable or writable.
+
+        Arguments:
+            add    -- Either loop.add_reader or loop.add_writer.
+            remove -- The matching loop.remove_* method.
+            fd     -- The file descriptor to watch.
+        """
+        future = self.loop.create_future()
+
+        def ready():
+            if not future.done():
+                future.set_result(None)
+
+        add(fd, ready)
+        future.add_done_callback(lambda f: remove(fd))
+        return future
+
+    async def _recv(self, buffer):
+        """
+        Read data from the stream's socket without blocking the loop.
+
+        Returns a view of the data read into the buffer, which is
+        empty once the connection has closed.
+
+        Arguments:
+            buffer -- The RecvBuffer to read into.
+        """
+        while True:
+            sock = self.stream.socket
+            try:
+                return buffer.recv(sock)
+            except WOULD_BLOCK_READ:
+                self._reading = self._wait_fd(self.loop.add_reader,
+                                              self.loop.remove_reader,
+                                              sock.fileno())
+                await self._reading
+
+    async def _sendall(self, data):
+        """
+        Write all of the given data to the stream's socket without
+        blocking the loop.
+
+        Arguments:
+            data -- The bytes to send.
+        """
+        view = memoryview(data)
+        while view:
+            if self.stream._tls_pending:
+                await self._tls_ready.wait()
+            sock = self.stream.socket
+            try:
+                sent = sock.send(view)
+            except WOULD_BLOCK_WRITE:
+                await self._wait_fd(self.loop.add_writer,
+                                    self.loop.remove_writer,
+                                    sock.fileno())
+            else:
+                view = view[sent:]
+
+    async def _handshake(self):
+        """
+        Perform the TLS handshake for a socket wrapped by
+        XMLStream.start_tls without blocking the loop.
+
+        Sending waits until the handshake has completed.
+        """
+        stream = self.stream
+        sock = stream.socket
+        sock.setblocking(False)
+        self._tls_ready.clear()
+        start = time.time()
+        try:
+            while True:
+                try:
+                    sock.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    self._reading = self._wait_fd(self.loop.add_reader,
+                                                  self.loop.remove_reader,
+                                                  sock.fileno())
+                    await self._reading
+                except ssl.SSLWantWriteError:
+                    await self._wait_fd(self.loop.add_writer,
+                                        self.loop.remove_writer,
+                                        sock.fileno())
+        finally:
+            stream._tls_pending = False
+            self._tls_ready.set()
+        stream.ssl_context.record_handshake(sock, stream.address,
+                                            time.time() - start)
+
+    # ------------------------------------------------------------------
+    # Processing coroutines
+
+    async def _read(self):
+        """
+        Read and parse the incoming XML stream, dispatching stanzas as
+        they are completed.
+
+        Mirrors XMLStream._process, including reconnecting after errors
+        if the stream allows it.
+        """
+        stream = self.stream
+        firstrun = True
+        while firstrun or (stream.auto_reconnect and not stream.stop.is_set()):
+            firstrun = False
+            try:
+                stream.socket.setblocking(False)
+                while not stream.stop.is_set() and await self._read_xml():
+                    # The stream was restarted, such as after TLS or
+                    # SASL negotiation.
+                    if stream._tls_pending:
+                        await self._handshake()
+                    stream.socket.setblocking(False)
+            except (KeyboardInterrupt, SystemExit):
+                stream.stop.set()
+            except (Socket.error, ConnectionError):
+                if not stream.stop.is_set():
+                    log.exception('Socket Error')
+            except Exception:
+                if not stream.stop.is_set():
+                    log.exception('Connection error.')
+            if not stream.stop.is_set() and stream.auto_reconnect:
+                await self._blocking(stream.reconnect,
+                                     stream.stream_end_event.is_set())
+            else:
+                await self._blocking(stream.disconnect)
+                stream.event_queue.put(('quit', None, None))
+        stream.scheduler.run = False
+        self._schedule_ready.set()
+        self._send_ready.set()
+
+    async def _read_xml(self):
+        """
+        Parse a single XML stream. Returns True if the stream should
+        be restarted, or False if it has ended.
+        """
+        stream = self.stream
+        if stream.is_client:
+            stream.send_raw(stream.stream_header)
+
+        stream.parser.reset()
+        if stream.recv_buffer is None:
+            stream.recv_buffer = RecvBuffer(stream.recv_size,
+                                            stream.recv_max_size)
+        while not stream.stop.is_set():
+            data = await self._recv(stream.recv_buffer)
+            if not data:
+                return False
+            try:
+                if not stream._feed(data):
+                    return False
+            except RestartStream:
+                return True
+        return False
+
+    async def _send(self):
+        """Send queued data on the stream's socket."""
+        stream = self.stream
+        while not stream.stop.is_set():
+            try:
+                data = stream.send_queue.get(False)
+            except queue.Empty:
+                self._send_ready.clear()
+                if stream.send_queue.empty():
+                    await self._send_ready.wait()
+                continue
+            batch = [data]
+            if stream.send_batch_delay and stream.send_batch_max > 1:
+                await asyncio.sleep(stream.send_batch_delay)
+            stream._drain_send_queue(batch)
+            try:
+                await self._sendall(stream._encode_send_batch(batch))
+            except Exception:
+                log.warning("Failed to send %s" % ''.join(batch))
+                await self._blocking(stream.disconnect,
+                                     stream.auto_reconnect)
+
+    async def _run_events(self):
+        """
+        Execute queued stream, custom, and scheduled events in order
+        using the executor.
+        """
+        stream = self.stream
+        while not stream.stop.is_set():
+            try:
+                event = stream.event_queue.get(False)
+            except queue.Empty:
+                self._event_ready.clear()
+                if stream.event_queue.empty():
+                    await self._event_ready.wait()
+                continue
+            if event[0] == 'quit':
+                log.debug("Quitting event runner")
+                return
+            await self._blocking(stream._run_event, event)
+
+    async def _run_scheduler(self):
+        """Execute scheduled tasks as they become due."""
+        scheduler = self.stream.scheduler
+        scheduler.run = True
+        while scheduler.run and not self.stream.stop.is_set():
+            self._schedule_ready.clear()
+            wait = scheduler.run_pending()
+            try:
+                await asyncio.wait_for(self._schedule_ready.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
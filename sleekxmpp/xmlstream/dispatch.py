@@ -0,0 +1,172 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import threading
+
+
+def local_name(tag):
+    """
+    Return an element tag without its namespace.
+
+    Arguments:
+        tag -- A tag name, such as {jabber:client}message.
+    """
+    return tag.split('}', 1)[-1]
+
+
+def split_path(xpath):
+    """
+    Split an XPath expression into its steps, ignoring any slashes
+    inside namespace names.
+
+    Arguments:
+        xpath -- An XPath expression, such as {jabber:client}iq/{ns}query.
+    """
+    steps = []
+    step = []
+    in_ns = False
+    for char in xpath:
+        if char == '{':
+            in_ns = True
+        elif char == '}':
+            in_ns = False
+        elif char == '/' and not in_ns:
+            steps.append(''.join(step))
+            step = []
+            continue
+        step.append(char)
+    steps.append(''.join(step))
+    return steps
+
+
+def stanza_keys(xml):
+    """
+    Return the index keys describing a received stanza.
+
+    The keys are:
+        ('tag', name)              -- The root element's name, without
+                                      its namespace.
+        ('type', name, type)       -- The root element's name and its
+                                      'type' attribute.
+        ('child', name, childtag)  -- The root element's name and the
+                                      namespaced tag of one of its
+                                      direct children.
+        ('id', id)                 -- The root element's 'id' attribute.
+
+    Arguments:
+        xml -- The stanza's XML object.
+    """
+    name = local_name(xml.tag)
+    keys = [('tag', name)]
+    stype = xml.attrib.get('type', None)
+    if stype is not None:
+        keys.append(('type', name, stype))
+    sid = xml.attrib.get('id', None)
+    if sid is not None:
+        keys.append(('id', sid))
+    for child in xml:
+        keys.append(('child', name, child.tag))
+    return keys
+
+
+class HandlerIndex(object):
+
+    """
+    Index stream handlers by the keys their matchers declare so that
+    only a small set of candidate handlers must be checked against
+    each received stanza.
+
+    A handler's index keys (see BaseHandler.index_keys) list stanza
+    keys, any one of which a stanza must have for the handler to match
+    it. Handlers that can not be indexed, because their matchers do not
+    declare keys, are checked against every stanza.
+
+    Candidates are always returned in the order in which the handlers
+    were added, just as if every handler was checked in turn.
+
+    Methods:
+        add        -- Index a new handler.
+        remove     -- Remove a handler from the index.
+        candidates -- Return the handlers that may match a stanza.
+    """
+
+    def __init__(self):
+        """Create a new, empty handler index."""
+        self._seq = 0
+        self._index = {}
+        self._fallback = []
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, handler):
+        """
+        Index a new handler.
+
+        Arguments:
+            handler -- The stream handler to add.
+        """
+        index_keys = getattr(handler, 'index_keys', None)
+        keys = index_keys() if index_keys is not None else None
+        with self._lock:
+            self._seq += 1
+            entry = (self._seq, handler)
+            self._entries[id(handler)] = (entry, keys)
+            # Lists are replaced instead of modified so that stanzas
+            # may be dispatched while handlers are being changed.
+            if keys is None:
+                self._fallback = self._fallback + [entry]
+            else:
+                for key in set(keys):
+                    self._index[key] = self._index.get(key, []) + [entry]
+
+    def remove(self, handler):
+        """
+        Remove a handler from the index.
+
+        Arguments:
+            handler -- The stream handler to remove.
+        """
+        with self._lock:
+            entry, keys = self._entries.pop(id(handler), (None, None))
+            if entry is None:
+                return
+            if keys is None:
+                self._fallback = [e for e in self._fallback if e is not entry]
+                return
+            for key in set(keys):
+                entries = [e for e in self._index.get(key, ()) \
+                           if e is not entry]
+                if entries:
+                    self._index[key] = entries
+                else:
+                    self._index.pop(key, None)
+
+    def candidates(self, xml):
+        """
+        Return the handlers that may match a stanza, in the order
+        in which they were added.
+
+        Arguments:
+            xml -- The stanza's XML object.
+        """
+        found = list(self._fallback)
+        index = self._index
+        for key in stanza_keys(xml):
+            entries = index.get(key, None)
+            if entries:
+                found.extend(entries)
+        if not found:
+            return []
+        found.sort(key=lambda entry: entry[0])
+        handlers = []
+        last = None
+        for entry in found:
+            if entry is not last:
+                handlers.append(entry[1])
+                last = entry
+        return handlers
@@ -20,17 +20,28 @@ class BaseHandler(object):
     for execution during stream processing, and the run method is used
     during the main event loop.
 
+    Class Attributes:
+        share_payload -- Indicates if the handler may be given a stanza
+                         object that shares its XML with other handlers
+                         when the stream's copy_on_write mode is used.
+                         Handlers given raw XML objects must set this
+                         to False, since changes to raw XML can not be
+                         detected.
+
     Attributes:
         name   -- The name of the handler.
         stream -- The stream this handler is assigned to.
 
     Methods:
         match        -- Compare a stanza with the handler's matcher.
+        index_keys   -- Return the matcher's keys for dispatch indexing.
         prerun       -- Handler execution during stream processing.
         run          -- Handler execution during the main event loop.
         check_delete -- Indicate if the handler may be removed from use.
     """
 
+    share_payload = True
+
     def __init__(self, name, matcher, stream=None):
         """
         Create a new stream handler.
@@ -61,6 +72,17 @@ class BaseHandler(object):
         """
         return self._matcher.match(xml)
 
+    def index_keys(self):
+        """
+        Return the stanza keys used to index the handler for dispatch,
+        as declared by the handler's matcher, or None if the handler
+        must be checked against every stanza.
+        """
+        index_keys = getattr(self._matcher, 'index_keys', None)
+        if index_keys is None:
+            return None
+        return index_keys()
+
     def prerun(self, payload):
         """
         Prepare the handler for execution while the XML stream is being
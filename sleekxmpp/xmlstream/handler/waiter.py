@@ -46,6 +46,7 @@ class Waiter(BaseHandler):
         """
         BaseHandler.__init__(self, name, matcher, stream=stream)
         self._payload = queue.Queue()
+        self._response_id = None
 
     def prerun(self, payload):
         """
@@ -89,7 +90,10 @@ class Waiter(BaseHandler):
         except queue.Empty:
             stanza = False
             log.warning("Timed out waiting for %s" % self.name)
-        self.stream.removeHandler(self.name)
+        if self._response_id is not None:
+            self.stream.remove_response(self._response_id, self)
+        else:
+            self.stream.removeHandler(self.name)
         return stanza
 
     def check_delete(self):
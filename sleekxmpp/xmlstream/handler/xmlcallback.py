@@ -20,6 +20,9 @@ class XMLCallback(Callback):
         run -- Overrides Callback.run
     """
 
+    # See BaseHandler.share_payload.
+    share_payload = False
+
     def run(self, payload, instream=False):
         """
         Execute the callback function with the matched stanza's
@@ -20,6 +20,9 @@ class XMLWaiter(Waiter):
         prerun -- Overrides Waiter.prerun
     """
 
+    # See BaseHandler.share_payload.
+    share_payload = False
+
     def prerun(self, payload):
         """
         Store the XML contents of the stanza to return to the
@@ -0,0 +1,613 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import logging
+import socket as Socket
+import ssl
+import threading
+import time
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# The selectors module is only available in Python 3.4 and later.
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+from sleekxmpp.xmlstream.recvbuffer import RecvBuffer
+from sleekxmpp.xmlstream.scheduler import Scheduler
+from sleekxmpp.xmlstream.workerpool import WorkerPool
+from sleekxmpp.xmlstream.xmlstream import RestartStream
+
+
+log = logging.getLogger(__name__)
+
+
+if selectors is not None:
+    # Exceptions raised by non-blocking sockets when no data can be
+    # read or written without blocking.
+    WOULD_BLOCK = (BlockingIOError, InterruptedError,
+                   ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+
+class StreamManager(object):
+
+    """
+    Drive many XML streams from a single selector thread, instead of
+    each stream starting its own reader, sender, event runner, and
+    scheduler threads.
+
+    Streams added to a manager share:
+        - One I/O thread, which reads, parses, and matches stanzas for
+          every stream, and writes their queued data, using a selector.
+        - One WorkerPool, which executes each stream's events in order,
+          while events for different streams run in parallel. Threaded
+          event handlers use the same pool.
+        - One Scheduler thread. Scheduled task names are kept separate
+          for each stream.
+
+    Handler and plugin semantics are unchanged. A stream's stream and
+    custom event handlers execute one at a time, in the order they were
+    queued. Handlers created with instream=True run on the I/O thread
+    and must not block. Until a stream's session has started, its
+    socket is put in blocking mode while stanzas are processed so that
+    handlers may perform TLS handshakes; this may briefly delay other
+    streams.
+
+    Streams must be connected before they are added, just as for
+    XMLStream.process. Requires Python 3.4 or later.
+
+    Example:
+        manager = StreamManager()
+        manager.start()
+        for account in accounts:
+            xmpp = ClientXMPP(account.jid, account.password)
+            if xmpp.connect():
+                xmpp.process(manager=manager)
+
+    Attributes:
+        selector  -- The selector used to wait for socket events.
+        pool      -- The WorkerPool executing event handlers.
+        scheduler -- The Scheduler shared by all streams.
+        recv_buffer -- The RecvBuffer that the I/O thread reads into
+                       for every stream, since each read is parsed
+                       before the next.
+        streams   -- A dictionary mapping each managed stream to
+                     its ManagedStream state.
+
+    Methods:
+        start  -- Start the I/O and scheduler threads.
+        add    -- Begin processing a connected stream.
+        remove -- Stop processing a stream.
+        stop   -- Stop the I/O and scheduler threads.
+    """
+
+    def __init__(self, max_workers=32):
+        """
+        Create a new stream manager.
+
+        Arguments:
+            max_workers -- The maximum number of threads for executing
+                           event handlers. Defaults to 32.
+        """
+        if selectors is None:
+            raise RuntimeError("StreamManager requires the selectors " + \
+                               "module from Python 3.4 or later.")
+        self.selector = selectors.DefaultSelector()
+        # The backlog must not be limited since jobs are submitted
+        # while holding a stream's event queue lock.
+        self.pool = WorkerPool(max_workers, name='stream_manager')
+        self.scheduler = Scheduler()
+        self.recv_buffer = RecvBuffer()
+        self.streams = {}
+        self.thread = None
+        self.running = False
+
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self._woken = False
+        self._wake_recv, self._wake_send = Socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        self.selector.register(self._wake_recv, selectors.EVENT_READ, None)
+
+    def start(self):
+        """Start the I/O and scheduler threads."""
+        self.running = True
+        self.scheduler.process(threaded=True)
+        self.thread = threading.Thread(name='stream_manager',
+                                       target=self._run)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the I/O and scheduler threads. Streams should be
+        disconnected first.
+        """
+        self.running = False
+        self._wake()
+        if self.thread is not None and \
+           self.thread is not threading.current_thread():
+            self.thread.join()
+        self.scheduler.quit()
+        self.pool.shutdown()
+
+    def add(self, stream):
+        """
+        Begin processing a connected stream.
+
+        Arguments:
+            stream -- The XMLStream to process.
+        """
+        managed = ManagedStream(self, stream)
+        stream._async = managed
+        stream.handler_pool = self.pool
+        stream.scheduler = StreamScheduler(self.scheduler, managed)
+        stream.event_queue.notify = managed.event_ready
+        stream.send_queue.notify = managed.write_ready
+        stream.add_event_handler('session_start', managed.session_started)
+        with self._lock:
+            self.streams[stream] = managed
+        self.call(managed.start)
+        return managed
+
+    def remove(self, stream):
+        """
+        Stop processing a stream and cancel its scheduled tasks.
+        The stream's connection is not closed.
+
+        Arguments:
+            stream -- The XMLStream to remove.
+        """
+        with self._lock:
+            managed = self.streams.pop(stream, None)
+        if managed is None:
+            return
+        stream.scheduler.quit()
+        self.call(managed.detach)
+
+    def call(self, func, *args):
+        """
+        Execute a function on the I/O thread.
+
+        Arguments:
+            func -- The function to execute.
+            args -- Arguments for the function.
+        """
+        with self._lock:
+            self._calls.append((func, args))
+        self._wake()
+
+    def _wake(self):
+        """Interrupt the I/O thread's wait for socket events."""
+        with self._lock:
+            if self._woken:
+                return
+            self._woken = True
+        try:
+            self._wake_send.send(b'x')
+        except WOULD_BLOCK:
+            pass
+
+    def _run(self):
+        """Wait for and handle socket events until stopped."""
+        while self.running:
+            for key, mask in self.selector.select():
+                managed = key.data
+                if managed is None:
+                    self._drain_wakeup()
+                    continue
+                try:
+                    if mask & selectors.EVENT_READ:
+                        managed.on_readable()
+                    if mask & selectors.EVENT_WRITE and \
+                       managed.sock is not None:
+                        managed.flush()
+                except:
+                    log.exception('Error processing stream events')
+            self._run_calls()
+        log.debug("Quitting stream manager thread")
+
+    def _drain_wakeup(self):
+        """Clear the wakeup socket."""
+        with self._lock:
+            self._woken = False
+        try:
+            while self._wake_recv.recv(4096):
+                pass
+        except WOULD_BLOCK:
+            pass
+
+    def _run_calls(self):
+        """Execute the functions passed to call."""
+        while True:
+            with self._lock:
+                if not self._calls:
+                    return
+                func, args = self._calls.popleft()
+            try:
+                func(*args)
+            except:
+                log.exception('Error in stream manager call')
+
+
+class ManagedStream(object):
+
+    """
+    The state kept by a StreamManager for one of its streams.
+
+    Takes the place of an AsyncRunner as the stream's _async driver,
+    so the stream passes it threaded event handlers and socket
+    interruptions.
+
+    Attributes:
+        manager    -- The StreamManager processing the stream.
+        stream     -- The XMLStream being processed.
+        sock       -- The socket registered with the selector, or None.
+        negotiated -- True once the stream's session has started.
+
+    Methods:
+        start           -- Register the stream's socket and begin
+                           processing the stream.
+        detach          -- Unregister the stream's socket.
+        on_readable     -- Read and process data from the socket.
+        flush           -- Write queued data to the socket.
+        event_ready     -- Schedule processing of queued events.
+        write_ready     -- Schedule writing of queued data.
+        session_started -- Record that stream negotiation is done.
+        run_threaded    -- Execute a threaded event handler.
+        in_io_thread    -- Check if running on the I/O thread.
+        interrupt       -- Prepare for the socket to be closed.
+    """
+
+    def __init__(self, manager, stream):
+        """
+        Create the manager's state for a stream.
+
+        Arguments:
+            manager -- The StreamManager processing the stream.
+            stream  -- The XMLStream to process.
+        """
+        self.manager = manager
+        self.stream = stream
+        self.sock = None
+        self.negotiated = False
+        self._mask = 0
+        self._out = bytearray()
+        self._closing = False
+        self._events_pending = False
+        self._write_pending = False
+
+    # ------------------------------------------------------------------
+    # Called on the I/O thread
+
+    def start(self):
+        """Register the stream's socket and begin a new stream."""
+        stream = self.stream
+        self._closing = False
+        self.negotiated = False
+        self._out = bytearray()
+        stream.parser.reset()
+        self._register(stream.socket)
+        if stream.is_client:
+            self._write_header()
+        self.flush()
+
+    def detach(self):
+        """Unregister the stream's socket from the selector."""
+        if self.sock is None:
+            return
+        try:
+            self.manager.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock = None
+        self._mask = 0
+
+    def on_readable(self):
+        """Read and process data from the stream's socket."""
+        while self.sock is not None:
+            try:
+                data = self.manager.recv_buffer.recv(self.sock)
+            except WOULD_BLOCK:
+                return
+            except (Socket.error, ValueError):
+                if not self.stream.stop.isSet():
+                    log.exception('Socket Error')
+                self._lost()
+                return
+            if not data:
+                # The connection has been closed.
+                self._lost()
+                return
+            if not self._feed(data):
+                return
+            # Data may be buffered within an SSL socket without
+            # the underlying socket becoming readable again.
+            pending = getattr(self.sock, 'pending', None)
+            if pending is None or not pending():
+                return
+
+    def flush(self):
+        """Write as much queued data to the socket as possible."""
+        self._write_pending = False
+        if self.sock is None:
+            return
+        stream = self.stream
+        while True:
+            if not self._out:
+                batch = []
+                stream._drain_send_queue(batch)
+                if not batch:
+                    break
+                self._out += stream._encode_send_batch(batch)
+            try:
+                sent = self.sock.send(self._out)
+            except WOULD_BLOCK:
+                break
+            except (Socket.error, ValueError):
+                log.warning("Failed to send on stream %s" % stream)
+                self._lost()
+                return
+            del self._out[:sent]
+            if self._out:
+                break
+        mask = selectors.EVENT_READ
+        if self._out:
+            mask |= selectors.EVENT_WRITE
+        if mask != self._mask:
+            self.manager.selector.modify(self.sock, mask, self)
+            self._mask = mask
+
+    def _register(self, sock):
+        """
+        Register a socket with the selector, replacing any socket
+        registered before, such as after negotiating TLS.
+
+        Arguments:
+            sock -- The stream's socket.
+        """
+        if self.sock is not sock:
+            self.detach()
+        sock.setblocking(False)
+        if self.sock is None:
+            self.manager.selector.register(sock, selectors.EVENT_READ, self)
+            self.sock = sock
+            self._mask = selectors.EVENT_READ
+
+    def _write_header(self):
+        """Queue the stream header ahead of any other data."""
+        header = self.stream.stream_header.encode('utf-8')
+        self._out = bytearray(header) + self._out
+
+    def _feed(self, data):
+        """
+        Parse data received from the stream.
+
+        Returns True if reading may continue.
+
+        Arguments:
+            data -- The data read from the socket.
+        """
+        stream = self.stream
+        sock = self.sock
+        blocking = not self.negotiated
+        if blocking:
+            # Stream negotiation handlers may need to perform
+            # blocking operations on the socket, such as TLS.
+            sock.setblocking(True)
+        try:
+            if not stream._feed(data):
+                # The stream's root element has closed.
+                self._lost()
+                return False
+        except RestartStream:
+            # Discard the rest of the data and begin a new stream,
+            # possibly on a new socket.
+            stream.parser.reset()
+            self._register(stream.socket)
+            if stream.is_client:
+                self._write_header()
+            self.flush()
+            return True
+        except:
+            if not stream.stop.isSet():
+                log.exception('Connection error.')
+            self._lost()
+            return False
+        finally:
+            if blocking and self.sock is sock:
+                sock.setblocking(False)
+        return True
+
+    def _lost(self):
+        """
+        Handle the end of the stream's connection by reconnecting
+        if allowed, or else disconnecting the stream.
+        """
+        self.detach()
+        if self._closing:
+            return
+        self._closing = True
+        stream = self.stream
+        if not stream.stop.isSet() and stream.auto_reconnect:
+            self.manager.pool.submit(self._reconnect)
+        else:
+            self.manager.pool.submit(self._disconnect)
+
+    # ------------------------------------------------------------------
+    # Called from the worker pool
+
+    def _reconnect(self):
+        """Reconnect the stream and resume processing it."""
+        stream = self.stream
+        while not stream.stop.isSet():
+            if stream.reconnect(stream.stream_end_event.isSet()):
+                self.manager.call(self.start)
+                return
+            time.sleep(1)
+
+    def _disconnect(self):
+        """Disconnect the stream and stop managing it."""
+        self.stream.disconnect()
+        self.manager.remove(self.stream)
+
+    def _run_events(self):
+        """Execute the stream's queued events in order."""
+        self._events_pending = False
+        stream = self.stream
+        while True:
+            try:
+                event = stream.event_queue.get(False)
+            except queue.Empty:
+                return
+            if event[0] == 'quit':
+                continue
+            stream._run_event(event)
+
+    # ------------------------------------------------------------------
+    # Called from any thread
+
+    def event_ready(self):
+        """
+        Schedule processing of the stream's queued events. Called
+        with the event queue's lock held.
+        """
+        if not self._events_pending:
+            self._events_pending = True
+            self.manager.pool.submit(self._run_events, key=self, limit=1)
+
+    def write_ready(self):
+        """
+        Schedule writing of the stream's queued data. Called with
+        the send queue's lock held.
+        """
+        if not self._write_pending:
+            self._write_pending = True
+            self.manager.call(self.flush)
+
+    def session_started(self, data=None):
+        """
+        Record that stream negotiation has finished, so the socket
+        may stay in non-blocking mode.
+
+        Arguments:
+            data -- Unused data given by the session_start event.
+        """
+        self.negotiated = True
+
+    def run_threaded(self, func, args, concurrency=None):
+        """
+        Execute an event handler marked as threaded using the
+        manager's worker pool.
+
+        Arguments:
+            func        -- The event handler.
+            args        -- Arguments for the event handler.
+            concurrency -- Optional limit on the number of copies of
+                           the handler that may run at once.
+        """
+        self.manager.pool.submit(self.stream._threaded_event_wrapper,
+                                 (func, args), key=func, limit=concurrency)
+
+    def in_io_thread(self):
+        """Return True if called from the manager's I/O thread."""
+        return threading.current_thread() is self.manager.thread
+
+    def interrupt(self):
+        """
+        Prepare for the stream's socket to be closed by the stream,
+        such as when disconnecting or reconnecting.
+        """
+        self._closing = True
+        self.manager.call(self._interrupted)
+
+    def _interrupted(self):
+        """Unregister a socket being closed, on the I/O thread."""
+        self.detach()
+        if self.stream.stop.isSet():
+            self.manager.remove(self.stream)
+
+
+class StreamScheduler(object):
+
+    """
+    A stream's view of a Scheduler shared by many streams, keeping
+    the names of each stream's tasks separate.
+
+    Attributes:
+        scheduler -- The shared Scheduler.
+        owner     -- The object that tasks are scoped to.
+        run       -- Indicates if the shared scheduler is running.
+
+    Methods:
+        add        -- Add a new task to the schedule.
+        cancel     -- Remove a task from the schedule.
+        reschedule -- Change the delay before a task executes.
+        process    -- Does nothing; the shared scheduler has
+                      its own thread.
+        quit       -- Cancel all of the stream's tasks.
+    """
+
+    def __init__(self, scheduler, owner):
+        """
+        Create a scoped view of a scheduler.
+
+        Arguments:
+            scheduler -- The shared Scheduler.
+            owner     -- The object that tasks are scoped to.
+        """
+        self.scheduler = scheduler
+        self.owner = owner
+
+    @property
+    def run(self):
+        return self.scheduler.run
+
+    def add(self, name, *args, **kwargs):
+        """
+        Schedule a new task. Accepts the same arguments
+        as Scheduler.add.
+        """
+        self.scheduler.add((self.owner, name), *args, **kwargs)
+
+    def cancel(self, name):
+        """
+        Remove a pending task from the schedule.
+
+        Arguments:
+            name -- The name of the task.
+        """
+        return self.scheduler.cancel((self.owner, name))
+
+    def reschedule(self, name, seconds):
+        """
+        Change the delay before a pending task executes.
+
+        Arguments:
+            name    -- The name of the task.
+            seconds -- The new number of seconds to wait.
+        """
+        return self.scheduler.reschedule((self.owner, name), seconds)
+
+    def process(self, threaded=True):
+        """The shared scheduler is run by its owner."""
+        pass
+
+    def quit(self):
+        """Cancel all of the stream's pending tasks."""
+        for name in list(self.scheduler.tasks.keys()):
+            if isinstance(name, tuple) and name[0] is self.owner:
+                self.scheduler.cancel(name)
@@ -13,6 +13,10 @@ class MatcherBase(object):
     Base class for stanza matchers. Stanza matchers are used to pick
     stanzas out of the XML stream and pass them to the appropriate
     stream handlers.
+
+    Methods:
+        match      -- Compare a stanza against the criteria.
+        index_keys -- Return keys for indexing the matcher.
     """
 
     def __init__(self, criteria):
@@ -32,3 +36,16 @@ class MatcherBase(object):
         Meant to be overridden.
         """
         return False
+
+    def index_keys(self):
+        """
+        Return a list of stanza keys, one of which any matching stanza
+        must have, for use in dispatch indexing. See stanza_keys in
+        sleekxmpp.xmlstream.dispatch for the available keys.
+
+        Returns None if the matcher can not be indexed, in which case
+        it will be checked against every stanza.
+
+        Meant to be overridden.
+        """
+        return None
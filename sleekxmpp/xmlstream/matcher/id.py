@@ -16,7 +16,8 @@ class MatcherId(MatcherBase):
     interface value as the desired ID.
 
     Methods:
-        match -- Overrides MatcherBase.match.
+        match      -- Overrides MatcherBase.match.
+        index_keys -- Overrides MatcherBase.index_keys.
     """
 
     def match(self, xml):
@@ -30,3 +31,13 @@ class MatcherId(MatcherBase):
             xml -- The stanza to compare against.
         """
         return xml['id'] == self._criteria
+
+    def index_keys(self):
+        """
+        Index the matcher by the desired ID.
+
+        Overrides MatcherBase.index_keys.
+        """
+        if not self._criteria:
+            return None
+        return [('id', self._criteria)]
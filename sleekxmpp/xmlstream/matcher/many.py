@@ -19,7 +19,8 @@ class MatchMany(MatcherBase):
     Each of the criteria must implement a match() method.
 
     Methods:
-        match -- Overrides MatcherBase.match.
+        match      -- Overrides MatcherBase.match.
+        index_keys -- Overrides MatcherBase.index_keys.
     """
 
     def match(self, xml):
@@ -38,3 +39,18 @@ class MatchMany(MatcherBase):
             if m.match(xml):
                 return True
         return False
+
+    def index_keys(self):
+        """
+        Combine the index keys of each of the criteria. The matcher can
+        not be indexed if any of the criteria can not be indexed.
+
+        Overrides MatcherBase.index_keys.
+        """
+        keys = []
+        for m in self._criteria:
+            m_keys = getattr(m, 'index_keys', lambda: None)()
+            if m_keys is None:
+                return None
+            keys.extend(m_keys)
+        return keys
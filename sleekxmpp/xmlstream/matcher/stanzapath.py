@@ -6,6 +6,7 @@
     See the file LICENSE for copying permission.
 """
 
+from sleekxmpp.xmlstream.dispatch import local_name, split_path
 from sleekxmpp.xmlstream.matcher.base import MatcherBase
 
 
@@ -20,7 +21,8 @@ class StanzaPath(MatcherBase):
     aware that differences may occur.
 
     Methods:
-        match -- Overrides MatcherBase.match.
+        match      -- Overrides MatcherBase.match.
+        index_keys -- Overrides MatcherBase.index_keys.
     """
 
     def match(self, stanza):
@@ -36,3 +38,19 @@ class StanzaPath(MatcherBase):
             stanza -- The stanza object to compare against.
         """
         return stanza.match(self._criteria)
+
+    def index_keys(self):
+        """
+        Index the matcher by the name of the root stanza, given by the
+        first step of the stanza path.
+
+        Overrides MatcherBase.index_keys.
+        """
+        if isinstance(self._criteria, (list, tuple)):
+            root = self._criteria[0]
+        else:
+            root = split_path(self._criteria)[0]
+        name = local_name(root.split('@')[0])
+        if not name:
+            return None
+        return [('tag', name)]
@@ -8,9 +8,8 @@
 
 import logging
 
-from xml.parsers.expat import ExpatError
-
 from sleekxmpp.xmlstream.stanzabase import ET
+from sleekxmpp.xmlstream.dispatch import local_name
 from sleekxmpp.xmlstream.matcher.base import MatcherBase
 
 
@@ -22,6 +21,97 @@ IGNORE_NS = False
 
 log = logging.getLogger(__name__)
 
+# Compiled masks, shared by all matchers with identical masks.
+_COMPILED = {}
+
+
+def compile_mask(mask, default_ns, ignore_ns=False, key=None):
+    """
+    Compile an XML mask into a function that accepts an XML object and
+    returns True if it matches the mask, using these rules:
+        - The root tag must equal the mask's tag, or the mask's tag in
+          the default namespace.
+        - Text in the mask must equal the element's text.
+        - Attributes in the mask must be present with equal values.
+        - For each child in the mask, the first child of the element
+          with the same tag must match it.
+
+    When ignore_ns is True, tags are compared without namespaces.
+
+    Compiled masks are cached when a key, such as the serialized
+    mask, is given.
+
+    Arguments:
+        mask       -- The XML object serving as the mask.
+        default_ns -- The default namespace for the mask's root tag.
+        ignore_ns  -- Indicates if namespaces should be ignored.
+        key        -- Optional cache key identifying the mask.
+    """
+    if key is not None:
+        cache_key = (key, default_ns, ignore_ns)
+        try:
+            return _COMPILED[cache_key]
+        except KeyError:
+            pass
+
+    check = _compile_node(mask, ignore_ns)
+    if ignore_ns:
+        name = local_name(mask.tag)
+
+        def match(xml):
+            return local_name(xml.tag) == name and check(xml)
+    else:
+        tags = (mask.tag, "{%s}%s" % (default_ns, mask.tag))
+
+        def match(xml):
+            return xml.tag in tags and check(xml)
+
+    if key is not None:
+        _COMPILED[cache_key] = match
+    return match
+
+
+def _compile_node(mask, ignore_ns):
+    """
+    Compile the text, attribute, and child checks for a mask element.
+
+    The element's tag is checked by the caller.
+
+    Arguments:
+        mask      -- The mask element.
+        ignore_ns -- Indicates if namespaces should be ignored.
+    """
+    text = mask.text or None
+    attrs = tuple(mask.attrib.items())
+    children = []
+    for child in mask:
+        if ignore_ns:
+            children.append((local_name(child.tag), True,
+                             _compile_node(child, ignore_ns)))
+        else:
+            children.append((child.tag, False,
+                             _compile_node(child, ignore_ns)))
+    children = tuple(children)
+
+    def check(xml):
+        if text is not None and xml.text != text:
+            return False
+        get = xml.attrib.get
+        for name, value in attrs:
+            if get(name, "__None__") != value:
+                return False
+        for tag, local, child_check in children:
+            for sub in xml:
+                sub_tag = local_name(sub.tag) if local else sub.tag
+                if sub_tag == tag:
+                    break
+            else:
+                return False
+            if not child_check(sub):
+                return False
+        return True
+    return check
+
 
 class MatchXMLMask(MatcherBase):
 
@@ -39,8 +129,13 @@ class MatchXMLMask(MatcherBase):
     IGNORE_NS. Setting IGNORE_NS to True will disable namespace based matching
     for ALL XMLMask matchers.
 
+    Masks are compiled into predicate functions, using compile_mask,
+    the first time they are used. Identical masks share the same
+    compiled function.
+
     Methods:
         match        -- Overrides MatcherBase.match.
+        index_keys   -- Overrides MatcherBase.index_keys.
         setDefaultNS -- Set the default namespace for the mask.
     """
 
@@ -52,9 +147,14 @@ class MatchXMLMask(MatcherBase):
             criteria -- Either an XML object or XML string to use as a mask.
         """
         MatcherBase.__init__(self, criteria)
-        if isinstance(criteria, str):
+        if not hasattr(criteria, 'attrib'):
+            self._mask_key = criteria
             self._criteria = ET.fromstring(self._criteria)
+        else:
+            self._mask_key = ET.tostring(criteria)
         self.default_ns = 'jabber:client'
+        self._compiled = None
+        self._compiled_for = None
 
     def setDefaultNS(self, ns):
         """
@@ -76,84 +176,30 @@ class MatchXMLMask(MatcherBase):
         """
         if hasattr(xml, 'xml'):
             xml = xml.xml
-        return self._mask_cmp(xml, self._criteria, True)
-
-    def _mask_cmp(self, source, mask, use_ns=False, default_ns='__no_ns__'):
+        options = (self.default_ns, IGNORE_NS)
+        if self._compiled_for != options:
+            self._compiled = compile_mask(self._criteria,
+                                          self.default_ns,
+                                          IGNORE_NS,
+                                          key=self._mask_key)
+            self._compiled_for = options
+        return self._compiled(xml)
+
+    def index_keys(self):
         """
-        Compare an XML object against an XML mask.
+        Index the matcher by the mask's root element name, along with
+        either its first child or its 'type' attribute.
 
-        Arguments:
-            source     -- The XML object to compare against the mask.
-            mask       -- The XML object serving as the mask.
-            use_ns     -- Indicates if namespaces should be respected during
-                          the comparison.
-            default_ns -- The default namespace to apply to elements that
-                          do not have a specified namespace.
-                          Defaults to "__no_ns__".
+        Overrides MatcherBase.index_keys.
         """
-        use_ns = not IGNORE_NS
-
-        if source is None:
-            # If the element was not found. May happend during recursive calls.
-            return False
-
-        # Convert the mask to an XML object if it is a string.
+        mask = self._criteria
         if not hasattr(mask, 'attrib'):
-            try:
-                mask = ET.fromstring(mask)
-            except ExpatError:
-                log.warning("Expat error: %s\nIn parsing: %s" % ('', mask))
-
-        if not use_ns:
-            # Compare the element without using namespaces.
-            source_tag = source.tag.split('}', 1)[-1]
-            mask_tag = mask.tag.split('}', 1)[-1]
-            if source_tag != mask_tag:
-                return False
-        else:
-            # Compare the element using namespaces
-            mask_ns_tag = "{%s}%s" % (self.default_ns, mask.tag)
-            if source.tag not in [mask.tag, mask_ns_tag]:
-                return False
-
-        # If the mask includes text, compare it.
-        if mask.text and source.text != mask.text:
-            return False
-
-        # Compare attributes. The stanza must include the attributes
-        # defined by the mask, but may include others.
-        for name, value in mask.attrib.items():
-            if source.attrib.get(name, "__None__") != value:
-                return False
-
-        # Recursively check subelements.
-        for subelement in mask:
-            if use_ns:
-                if not self._mask_cmp(source.find(subelement.tag),
-                                      subelement, use_ns):
-                    return False
-            else:
-                if not self._mask_cmp(self._get_child(source, subelement.tag),
-                                      subelement, use_ns):
-                    return False
-
-        # Everything matches.
-        return True
-
-    def _get_child(self, xml, tag):
-        """
-        Return a child element given its tag, ignoring namespace values.
-
-        Returns None if the child was not found.
-
-        Arguments:
-            xml -- The XML object to search for the given child tag.
-            tag -- The name of the subelement to find.
-        """
-        tag = tag.split('}')[-1]
-        try:
-            children = [c.tag.split('}')[-1] for c in xml.getchildren()]
-            index = children.index(tag)
-        except ValueError:
             return None
-        return xml.getchildren()[index]
+        name = local_name(mask.tag)
+        if IGNORE_NS:
+            return [('tag', name)]
+        if len(mask):
+            return [('child', name, mask[0].tag)]
+        if 'type' in mask.attrib:
+            return [('type', name, mask.attrib['type'])]
+        return [('tag', name)]
@@ -6,7 +6,10 @@
     See the file LICENSE for copying permission.
 """
 
+import re
+
 from sleekxmpp.xmlstream.stanzabase import ET
+from sleekxmpp.xmlstream.dispatch import local_name, split_path
 from sleekxmpp.xmlstream.matcher.base import MatcherBase
 
 
@@ -15,6 +18,78 @@ from sleekxmpp.xmlstream.matcher.base import MatcherBase
 # Changing this will affect ALL XPath matchers.
 IGNORE_NS = False
 
+# Compiled XPath expressions, shared by all matchers and streams.
+_COMPILED = {}
+
+# A single XPath step: an optionally namespaced element name followed
+# by any number of attribute predicates.
+_STEP = re.compile(r"^((?:\{[^}]*\})?[^\[\]{}*./@()]+)((?:\[[^\]]*\])*)$")
+_PREDICATE = re.compile(r"""\[@([^\]='"]+)(?:=(?:"([^"]*)"|'([^']*)'))?\]""")
+
+
+def compile_xpath(xpath):
+    """
+    Compile an XPath expression into a tuple of steps that can be
+    evaluated directly against a stanza's XML.
+
+    Each step is a (tag, name, predicates) tuple, where name is the
+    tag without its namespace and predicates is a tuple of
+    (attribute, value) pairs. A value of None only requires that
+    the attribute exists.
+
+    Returns None if the expression uses features other than element
+    names and attribute predicates, such as wildcards.
+
+    Compiled expressions are cached.
+
+    Arguments:
+        xpath -- The XPath expression to compile.
+    """
+    try:
+        return _COMPILED[xpath]
+    except KeyError:
+        pass
+
+    steps = []
+    for step in split_path(xpath):
+        parsed = _STEP.match(step)
+        if parsed is None:
+            steps = None
+            break
+        tag, predicates = parsed.groups()
+        checks = []
+        for pred in re.findall(r'\[[^\]]*\]', predicates):
+            pred_match = _PREDICATE.match(pred)
+            if pred_match is None or pred_match.end() != len(pred):
+                steps = None
+                break
+            name, dquoted, squoted = pred_match.groups()
+            value = dquoted if dquoted is not None else squoted
+            checks.append((name, value))
+        if steps is None:
+            break
+        steps.append((tag, local_name(tag), tuple(checks)))
+
+    if steps is not None:
+        steps = tuple(steps)
+    _COMPILED[xpath] = steps
+    return steps
+
+
+def _check_attrs(xml, predicates):
+    """
+    Check an element's attributes against a step's predicates.
+
+    Arguments:
+        xml        -- The element to check.
+        predicates -- A tuple of (attribute, value) pairs.
+    """
+    for name, value in predicates:
+        found = xml.attrib.get(name, None)
+        if found is None or (value is not None and found != value):
+            return False
+    return True
+
 
 class MatchXPath(MatcherBase):
 
@@ -30,10 +105,25 @@ class MatchXPath(MatcherBase):
     If the value of IGNORE_NS is set to true, then XPath expressions will
     be matched without using namespaces.
 
+    Expressions are compiled once, using compile_xpath, and evaluated
+    directly against the stanza's XML. Expressions that can not be
+    compiled fall back to using the ElementTree find method.
+
     Methods:
-        match -- Overrides MatcherBase.match.
+        match      -- Overrides MatcherBase.match.
+        index_keys -- Overrides MatcherBase.index_keys.
     """
 
+    def __init__(self, criteria):
+        """
+        Create a new XPath matcher.
+
+        Arguments:
+            criteria -- The XPath expression to match.
+        """
+        MatcherBase.__init__(self, criteria)
+        self._path = compile_xpath(criteria)
+
     def match(self, xml):
         """
         Compare a stanza's XML contents to an XPath expression.
@@ -49,6 +139,13 @@ class MatchXPath(MatcherBase):
         """
         if hasattr(xml, 'xml'):
             xml = xml.xml
+
+        path = self._path
+        if path is not None:
+            if IGNORE_NS:
+                return self._match_names(xml, path)
+            return self._match_tags(xml, path)
+
         x = ET.Element('x')
         x.append(xml)
 
@@ -77,3 +174,65 @@ class MatchXPath(MatcherBase):
                     return False
                 xml = xml.getchildren()[index]
             return True
+
+    def _match_tags(self, xml, path):
+        """
+        Evaluate a compiled XPath expression using namespaced tags.
+
+        Like the ElementTree find method, the expression matches if any
+        path through the XML satisfies every step.
+
+        Arguments:
+            xml  -- The stanza's XML object.
+            path -- The compiled expression.
+        """
+        tag, name, predicates = path[0]
+        if xml.tag != tag or not _check_attrs(xml, predicates):
+            return False
+        level = [xml]
+        for tag, name, predicates in path[1:]:
+            level = [child for parent in level for child in parent \
+                     if child.tag == tag and _check_attrs(child, predicates)]
+            if not level:
+                return False
+        return True
+
+    def _match_names(self, xml, path):
+        """
+        Evaluate a compiled XPath expression ignoring namespaces.
+
+        Each step follows the first child with a matching name.
+
+        Arguments:
+            xml  -- The stanza's XML object.
+            path -- The compiled expression.
+        """
+        tag, name, predicates = path[0]
+        if local_name(xml.tag) != name or not _check_attrs(xml, predicates):
+            return False
+        for tag, name, predicates in path[1:]:
+            for child in xml:
+                if local_name(child.tag) == name and \
+                   _check_attrs(child, predicates):
+                    xml = child
+                    break
+            else:
+                return False
+        return True
+
+    def index_keys(self):
+        """
+        Index the matcher by the root element's name and, if the
+        expression names one, the root's first child.
+
+        Expressions that can not be compiled are not indexed.
+
+        Overrides MatcherBase.index_keys.
+        """
+        path = self._path
+        if path is None:
+            return None
+        name = path[0][1]
+        if len(path) > 1 and not IGNORE_NS:
+            return [('child', name, path[1][0])]
+        return [('tag', name)]
@@ -0,0 +1,118 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from sleekxmpp.xmlstream.stanzabase import ET
+
+
+class XMLStreamParser(object):
+
+    """
+    An incremental, push style parser for XML streams.
+
+    Data is fed to the parser as it is received, in chunks of any size,
+    and the parser returns the stream events completed by that data.
+    Since the parser never reads on its own, it can be used with
+    blocking sockets, non-blocking sockets, and event loops alike.
+
+    Only the stream's root element and its direct children (stanzas)
+    are reported. Each stanza is built as a standalone element, so the
+    root element never accumulates children.
+
+    Events are (event, xml) tuples, where event is one of:
+        start  -- The stream's root element was opened. The XML object
+                  is the root element, with no children.
+        stanza -- A direct child of the root element was completed.
+        end    -- The stream's root element was closed.
+
+    Attributes:
+        depth -- The current element nesting level.
+        root  -- The stream's root element, if it has been received.
+
+    Methods:
+        feed  -- Parse data, returning completed stream events.
+        reset -- Prepare to parse a new stream.
+    """
+
+    def __init__(self):
+        """Create a new stream parser."""
+        self.reset()
+
+    def reset(self):
+        """
+        Discard any parsing state and prepare to parse a new stream,
+        such as after a stream restart for TLS or SASL.
+        """
+        self.depth = 0
+        self.root = None
+        self._builder = None
+        self._events = []
+        self._parser = ET.XMLParser(target=self)
+
+    def feed(self, data):
+        """
+        Parse a chunk of stream data.
+
+        Returns a list of the stream events completed by the data.
+
+        Arguments:
+            data -- The data received from the stream.
+        """
+        self._parser.feed(data)
+        events = self._events
+        self._events = []
+        return events
+
+    # ------------------------------------------------------------------
+    # Parser Target Interface
+
+    def start(self, tag, attrib):
+        """
+        Handle the start of an element.
+
+        Arguments:
+            tag    -- The element's namespaced tag name.
+            attrib -- The element's attributes.
+        """
+        self.depth += 1
+        if self.depth == 1:
+            self.root = ET.Element(tag, attrib)
+            self._events.append(('start', self.root))
+            return
+        if self.depth == 2:
+            self._builder = ET.TreeBuilder()
+        self._builder.start(tag, attrib)
+
+    def end(self, tag):
+        """
+        Handle the end of an element.
+
+        Arguments:
+            tag -- The element's namespaced tag name.
+        """
+        self.depth -= 1
+        if self.depth == 0:
+            self._events.append(('end', self.root))
+            return
+        self._builder.end(tag)
+        if self.depth == 1:
+            self._events.append(('stanza', self._builder.close()))
+            self._builder = None
+
+    def data(self, data):
+        """
+        Handle character data. Text between stanzas is ignored.
+
+        Arguments:
+            data -- The character data.
+        """
+        if self._builder is not None:
+            self._builder.data(data)
+
+    def close(self):
+        """Handle the end of input."""
+        return self.root
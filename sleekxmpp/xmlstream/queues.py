@@ -0,0 +1,240 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class NotifyQueue(queue.Queue):
+
+    """
+    A thread safe queue that can wake an external event loop whenever
+    a new item is added.
+
+    Threaded consumers block on get() as usual. Consumers that live on
+    an event loop, and so can not block, set the notify attribute to a
+    function that schedules a wakeup; it is called after every put.
+
+    Producers may use wait_below to pause until consumers have
+    caught up, without giving the queue a maxsize that would also
+    block other producers.
+
+    Attributes:
+        notify -- Optional function to call after an item is added.
+                  Must be thread safe and must not block.
+
+    Methods:
+        wait_below -- Block until the queue holds fewer items
+                      than a given size.
+    """
+
+    def __init__(self, maxsize=0):
+        """
+        Create a new notifying queue.
+
+        Arguments:
+            maxsize -- Same as for queue.Queue.
+        """
+        queue.Queue.__init__(self, maxsize)
+        self.notify = None
+
+    def _put(self, item):
+        """
+        Add an item to the queue and run the notify callback.
+
+        Overrides queue.Queue._put. Called with the queue's lock held.
+
+        Arguments:
+            item -- The item to add.
+        """
+        queue.Queue._put(self, item)
+        if self.notify is not None:
+            self.notify()
+
+    def wait_below(self, size, timeout=None):
+        """
+        Block until fewer than the given number of items are queued.
+
+        Returns True if the queue is below the size, or False if the
+        timeout expired first.
+
+        Only meant for queues without a maxsize, whose not_full
+        condition is otherwise unused.
+
+        Arguments:
+            size    -- The number of items to wait for the queue
+                       to drop below.
+            timeout -- Optional time in seconds to wait.
+        """
+        with self.not_full:
+            if timeout is None:
+                while self._qsize() >= size:
+                    self.not_full.wait()
+                return True
+            end = time.time() + timeout
+            while self._qsize() >= size:
+                remaining = end - time.time()
+                if remaining <= 0.0:
+                    return False
+                self.not_full.wait(remaining)
+            return True
+
+
+class SendQueue(NotifyQueue):
+
+    """
+    A queue of outgoing data that may be limited by both the number
+    of items and their total size.
+
+    Putting an item into a full queue blocks, or raises queue.Full if
+    not blocking, just as for a queue.Queue with a maxsize. A single
+    item larger than max_bytes is still accepted by an empty queue.
+
+    Once the queue fills past its high watermark, on_high is called.
+    After that, on_drained is called once the queue empties below its
+    low watermark. The watermarks are fractions of the limits that are
+    set; without limits, neither is ever called. Both callbacks run
+    with the queue's lock held, so they must not block or use the
+    queue.
+
+    Attributes:
+        max_items   -- The maximum number of queued items, or 0.
+        max_bytes   -- The maximum total length of queued items, or 0.
+        high_water  -- The fraction of a limit at which the queue is
+                       considered full. Defaults to 1.0.
+        low_water   -- The fraction of the limits below which the queue
+                       is considered drained. Defaults to 0.5.
+        bytes       -- The total length of the queued items.
+        high        -- True while the queue is above its high watermark
+                       and has not yet drained.
+        on_high     -- Optional function called when the high
+                       watermark is reached.
+        on_drained  -- Optional function called when the queue drains
+                       below the low watermark.
+
+    Methods:
+        put -- Overrides queue.Queue.put
+    """
+
+    def __init__(self, max_items=0, max_bytes=0):
+        """
+        Create a new send queue.
+
+        Arguments:
+            max_items -- The maximum number of queued items.
+                         Defaults to 0 for no limit.
+            max_bytes -- The maximum total length of queued items.
+                         Defaults to 0 for no limit.
+        """
+        NotifyQueue.__init__(self)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.high_water = 1.0
+        self.low_water = 0.5
+        self.bytes = 0
+        self.high = False
+        self.on_high = None
+        self.on_drained = None
+
+    def put(self, item, block=True, timeout=None, force=False):
+        """
+        Add an item to the queue, waiting for room if the queue is full.
+
+        Overrides queue.Queue.put
+
+        Arguments:
+            item    -- The string to queue.
+            block   -- If False, raise queue.Full instead of waiting
+                       when the queue is full. Defaults to True.
+            timeout -- Optional time in seconds to wait for room before
+                       raising queue.Full.
+            force   -- If True, add the item even if the queue is
+                       full, for callers that must not wait.
+                       Defaults to False.
+        """
+        size = len(item)
+        with self.not_full:
+            if not force and self._over(size):
+                if not block:
+                    raise queue.Full
+                if timeout is None:
+                    while self._over(size):
+                        self.not_full.wait()
+                else:
+                    end = time.time() + timeout
+                    while self._over(size):
+                        remaining = end - time.time()
+                        if remaining <= 0.0:
+                            raise queue.Full
+                        self.not_full.wait(remaining)
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _over(self, size):
+        """
+        Return True if an item of the given size does not fit.
+        Called with the queue's lock held.
+
+        Arguments:
+            size -- The length of the new item.
+        """
+        if self.max_items and self._qsize() >= self.max_items:
+            return True
+        if self.max_bytes and self.bytes and \
+           self.bytes + size > self.max_bytes:
+            return True
+        return False
+
+    def _fill(self):
+        """
+        Return how full the queue is, as the largest fraction of its
+        limits. Called with the queue's lock held.
+        """
+        fill = 0.0
+        if self.max_items:
+            fill = float(self._qsize()) / self.max_items
+        if self.max_bytes:
+            fill = max(fill, float(self.bytes) / self.max_bytes)
+        return fill
+
+    def _put(self, item):
+        """
+        Add an item and check the high watermark.
+
+        Overrides NotifyQueue._put. Called with the queue's lock held.
+
+        Arguments:
+            item -- The item to add.
+        """
+        self.bytes += len(item)
+        NotifyQueue._put(self, item)
+        if not self.high and (self.max_items or self.max_bytes) and \
+           self._fill() >= self.high_water:
+            self.high = True
+            if self.on_high is not None:
+                self.on_high()
+
+    def _get(self):
+        """
+        Remove an item and check the low watermark.
+
+        Overrides queue.Queue._get. Called with the queue's lock held.
+        """
+        item = NotifyQueue._get(self)
+        self.bytes -= len(item)
+        # Removing a large item may make room for several waiting ones.
+        self.not_full.notify_all()
+        if self.high and self._fill() < self.low_water:
+            self.high = False
+            if self.on_drained is not None:
+                self.on_drained()
+        return item
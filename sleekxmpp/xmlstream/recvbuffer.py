@@ -0,0 +1,90 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+try:
+    # Python 2 parsers only accept objects with the old buffer
+    # interface, which memoryview does not provide.
+    _window = buffer
+except NameError:
+    _window = None
+
+
+class RecvBuffer(object):
+
+    """
+    A reusable receive buffer which reads from a socket using recv_into,
+    instead of allocating a new string for every read.
+
+    Each read returns a view of the buffer's contents, which may be fed
+    directly to the stream parser. The view is only valid until the
+    next read, since the same memory is reused.
+
+    Whenever a read fills the entire buffer, more data is likely to be
+    waiting, so the buffer doubles in size, up to max_size, to reduce
+    the number of reads needed for busy streams.
+
+    Attributes:
+        size     -- The current number of bytes read at once.
+        max_size -- The largest size the buffer may grow to.
+        stats    -- A dictionary counting reads, bytes received,
+                    and the number of times the buffer has grown.
+
+    Methods:
+        recv -- Read data from a socket into the buffer.
+    """
+
+    def __init__(self, size=4096, max_size=65536):
+        """
+        Create a new receive buffer.
+
+        Arguments:
+            size     -- The initial number of bytes to read at once.
+                        Defaults to 4096.
+            max_size -- The largest size the buffer may grow to.
+                        Defaults to 65536.
+        """
+        self.max_size = max(size, max_size)
+        self.stats = {'reads': 0, 'bytes': 0, 'grown': 0}
+        self._allocate(size)
+
+    def recv(self, sock):
+        """
+        Read available data from a socket into the buffer.
+
+        Returns a view of the data read, which is empty once the
+        connection has been closed. Socket errors are passed on
+        to the caller.
+
+        Arguments:
+            sock -- The socket to read from.
+        """
+        size = self.size
+        received = sock.recv_into(self._buffer, size)
+        stats = self.stats
+        stats['reads'] += 1
+        stats['bytes'] += received
+        if _window is not None:
+            data = _window(self._buffer, 0, received)
+        else:
+            data = self._view[:received]
+        if received == size and size < self.max_size:
+            # The old buffer is left to the returned view.
+            stats['grown'] += 1
+            self._allocate(min(size * 2, self.max_size))
+        return data
+
+    def _allocate(self, size):
+        """
+        Replace the buffer with a new one of the given size.
+
+        Arguments:
+            size -- The number of bytes to allocate.
+        """
+        self.size = size
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
@@ -0,0 +1,363 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import logging
+import random
+import socket as Socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Flag indicating if DNS SRV records are available for use.
+SRV_SUPPORT = True
+try:
+    import dns.resolver
+    import dns.rdatatype
+except ImportError:
+    SRV_SUPPORT = False
+
+
+log = logging.getLogger(__name__)
+
+
+# The time in seconds to wait for a connection attempt to complete
+# before starting an attempt to the next address.
+CONNECT_DELAY = 0.25
+
+# The time in seconds before giving up on a single connection attempt.
+CONNECT_TIMEOUT = 30
+
+# Bounds on the time in seconds that resolved SRV records are kept,
+# regardless of the TTL given by the DNS server.
+SRV_MIN_TTL = 30
+SRV_MAX_TTL = 86400
+
+# The time in seconds to remember that a domain has no SRV records.
+SRV_NEGATIVE_TTL = 300
+
+
+def lookup_srv(name):
+    """
+    Query DNS for the SRV records of a service.
+
+    Returns a tuple of a list of (priority, weight, host, port)
+    tuples and the TTL of the answer. The TTL is None if the name
+    has no SRV records, and the list is None if the lookup failed
+    and should not be cached.
+
+    Arguments:
+        name -- The service name, such as _xmpp-client._tcp.example.com.
+    """
+    if not SRV_SUPPORT:
+        return ([], None)
+    try:
+        answers = dns.resolver.query(name, dns.rdatatype.SRV)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        return ([], None)
+    except Exception as e:
+        log.debug("SRV lookup for %s failed: %s" % (name, e))
+        return (None, None)
+    records = [(answer.priority, answer.weight,
+                answer.target.to_text().rstrip('.'), answer.port)
+               for answer in answers]
+    return (records, answers.rrset.ttl)
+
+
+class SRVCache(object):
+
+    """
+    A cache of resolved SRV records, shared by every stream in the
+    process, so that reconnecting does not wait for a new DNS query.
+
+    Records are kept for the TTL given with the DNS answer, within
+    the bounds of min_ttl and max_ttl. Names without any SRV records
+    are remembered for negative_ttl seconds.
+
+    Attributes:
+        lookup       -- The function used to query DNS. See lookup_srv.
+        min_ttl      -- The shortest time to keep records.
+        max_ttl      -- The longest time to keep records.
+        negative_ttl -- The time to remember names without records.
+        stats        -- A dictionary counting cache hits and misses.
+
+    Methods:
+        get   -- Return the SRV records for a service name.
+        clear -- Forget cached records.
+    """
+
+    def __init__(self, lookup=lookup_srv, min_ttl=SRV_MIN_TTL,
+                 max_ttl=SRV_MAX_TTL, negative_ttl=SRV_NEGATIVE_TTL):
+        """
+        Create a new SRV record cache.
+
+        Arguments:
+            lookup       -- The function used to query DNS.
+                            Defaults to lookup_srv.
+            min_ttl      -- The shortest time to keep records.
+            max_ttl      -- The longest time to keep records.
+            negative_ttl -- The time to remember names without records.
+        """
+        self.lookup = lookup
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        Return a list of (priority, weight, host, port) tuples for
+        a service name, querying DNS if the cached records have
+        expired.
+
+        Arguments:
+            name -- The service name.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(name, None)
+            if entry is not None and entry[0] > now:
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+
+        records, ttl = self.lookup(name)
+        if records is None:
+            # Keep using stale records rather than none at all.
+            if entry is not None:
+                return entry[1]
+            return []
+        if ttl is None:
+            ttl = self.negative_ttl
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        with self._lock:
+            self._entries[name] = (time.time() + ttl, records)
+        return records
+
+    def clear(self, name=None):
+        """
+        Forget the cached records for a service name, or
+        for all names.
+
+        Arguments:
+            name -- Optional service name to forget.
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+
+# The cache shared by all streams in the process.
+SRV_CACHE = SRVCache()
+
+
+def order_srv(records):
+    """
+    Return SRV records in the order they should be tried, as
+    described in RFC 2782: by increasing priority, and in a
+    weighted random order among records of the same priority.
+
+    Records with a target of '.' mean that the service is not
+    available, and are left out.
+
+    Arguments:
+        records -- A list of (priority, weight, host, port) tuples.
+    """
+    ordered = []
+    priorities = {}
+    for record in records:
+        if record[2] in ('', '.'):
+            continue
+        priorities.setdefault(record[0], []).append(record)
+    for priority in sorted(priorities):
+        group = priorities[priority]
+        # Zero weight records are placed first so that they
+        # have a small chance of being picked early.
+        group.sort(key=lambda record: record[1] != 0)
+        while group:
+            total = sum([record[1] for record in group])
+            picked = random.randint(0, total)
+            running = 0
+            for i, record in enumerate(group):
+                running += record[1]
+                if running >= picked:
+                    ordered.append(group.pop(i))
+                    break
+    return ordered
+
+
+def resolve_addresses(targets):
+    """
+    Yield (target, family, sockaddr) tuples for each address of
+    each target host, in the order they should be tried.
+
+    Hosts are resolved only when their addresses are needed, and
+    the addresses of each host alternate between address families,
+    starting with the family the system prefers.
+
+    Arguments:
+        targets -- A list of (host, port) tuples.
+    """
+    for target in targets:
+        try:
+            infos = Socket.getaddrinfo(target[0], target[1], 0,
+                                       Socket.SOCK_STREAM)
+        except Socket.error as e:
+            log.debug("Could not resolve %s: %s" % (target[0], e))
+            continue
+        families = []
+        by_family = {}
+        for family, socktype, proto, name, sockaddr in infos:
+            if family not in by_family:
+                families.append(family)
+                by_family[family] = []
+            if sockaddr not in by_family[family]:
+                by_family[family].append(sockaddr)
+        while families:
+            for family in list(families):
+                addresses = by_family[family]
+                yield (target, family, addresses.pop(0))
+                if not addresses:
+                    families.remove(family)
+
+
+class _Race(object):
+
+    """
+    The state shared by concurrent connection attempts, which
+    closes any socket that connects after another has won.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.results = queue.Queue()
+        self.done = False
+        self.lock = threading.Lock()
+
+    def attempt(self, target, family, sockaddr):
+        """
+        Connect to a single address, reporting the result.
+
+        Arguments:
+            target   -- The (host, port) the address belongs to.
+            family   -- The socket's address family.
+            sockaddr -- The address to connect to.
+        """
+        sock = None
+        try:
+            sock = Socket.socket(family, Socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(sockaddr)
+        except Socket.error as e:
+            if sock is not None:
+                sock.close()
+            self.results.put((None, target, sockaddr, e))
+            return
+        with self.lock:
+            if self.done:
+                sock.close()
+                return
+            # Queued with the lock held, so that finish can not miss
+            # the socket and leave it open.
+            self.results.put((sock, target, sockaddr, None))
+
+    def finish(self, winner):
+        """
+        End the race, closing connected sockets other than the winner.
+
+        Arguments:
+            winner -- The socket that will be used.
+        """
+        with self.lock:
+            self.done = True
+        while True:
+            try:
+                sock = self.results.get(block=False)[0]
+            except queue.Empty:
+                return
+            if sock is not None and sock is not winner:
+                sock.close()
+
+
+def connect_first(addresses, delay=CONNECT_DELAY, timeout=CONNECT_TIMEOUT,
+                  stats=None):
+    """
+    Connect to the first address that accepts a connection.
+
+    Addresses are tried in order, starting a new attempt whenever
+    the previous one fails or has not completed within delay
+    seconds, so that an unreachable address does not hold up the
+    rest. The first socket to connect is used, and the others
+    are closed.
+
+    Returns a tuple of the connected socket, which is in blocking
+    mode, and the (host, port) target it was connected to. Raises
+    socket.error if no address could be reached.
+
+    Arguments:
+        addresses -- An iterable of (target, family, sockaddr) tuples,
+                     such as returned by resolve_addresses.
+        delay     -- The time in seconds before starting the next
+                     attempt. Defaults to CONNECT_DELAY.
+        timeout   -- The time in seconds before abandoning a single
+                     attempt. Defaults to CONNECT_TIMEOUT.
+        stats     -- Optional dictionary in which to count the
+                     attempts made.
+    """
+    race = _Race(timeout)
+    addresses = iter(addresses)
+    exhausted = False
+    running = 0
+    error = None
+    while True:
+        if not exhausted:
+            try:
+                target, family, sockaddr = next(addresses)
+            except StopIteration:
+                exhausted = True
+            else:
+                log.debug("Connecting to %s:%s at %s" % (target[0],
+                                                         target[1],
+                                                         sockaddr[0]))
+                thread = threading.Thread(name='connect',
+                                          target=race.attempt,
+                                          args=(target, family, sockaddr))
+                thread.daemon = True
+                thread.start()
+                running += 1
+                if stats is not None:
+                    stats['attempts'] = stats.get('attempts', 0) + 1
+        if not running:
+            if exhausted:
+                break
+            continue
+        try:
+            sock, target, sockaddr, e = race.results.get(
+                    timeout=None if exhausted else delay)
+        except queue.Empty:
+            continue
+        running -= 1
+        if sock is not None:
+            race.finish(sock)
+            sock.settimeout(None)
+            return (sock, target)
+        log.debug("Could not connect to %s: %s" % (sockaddr[0], e))
+        error = e
+
+    race.finish(None)
+    if error is None:
+        error = Socket.error("No addresses to connect to.")
+    raise error
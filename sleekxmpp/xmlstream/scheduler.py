@@ -6,6 +6,7 @@
     See the file LICENSE for copying permission.
 """
 
+import heapq
 import time
 import threading
 import logging
@@ -14,10 +15,18 @@ try:
 except ImportError:
     import Queue as queue
 
+from sleekxmpp.xmlstream.queues import NotifyQueue
+
 
 log = logging.getLogger(__name__)
 
 
+# Rebuild the schedule heap once it holds more than this many
+# entries for cancelled or rescheduled tasks, and they make up
+# over half of the heap.
+COMPACT_THRESHOLD = 1024
+
+
 class Task(object):
 
     """
@@ -25,15 +34,16 @@ class Task(object):
     after a given time interval has passed.
 
     Attributes:
-        name     -- The name of the task.
-        seconds  -- The number of seconds to wait before executing.
-        callback -- The function to execute.
-        args     -- The arguments to pass to the callback.
-        kwargs   -- The keyword arguments to pass to the callback.
-        repeat   -- Indicates if the task should repeat.
-                    Defaults to False.
-        qpointer -- A pointer to an event queue for queuing callback
-                    execution instead of executing immediately.
+        name      -- The name of the task.
+        seconds   -- The number of seconds to wait before executing.
+        callback  -- The function to execute.
+        args      -- The arguments to pass to the callback.
+        kwargs    -- The keyword arguments to pass to the callback.
+        repeat    -- Indicates if the task should repeat.
+                     Defaults to False.
+        qpointer  -- A pointer to an event queue for queuing callback
+                     execution instead of executing immediately.
+        cancelled -- Indicates if the task was cancelled.
 
     Methods:
         run   -- Either queue or execute the callback.
@@ -64,6 +74,9 @@ class Task(object):
         self.repeat = repeat
         self.next = time.time() + self.seconds
         self.qpointer = qpointer
+        self.cancelled = False
+        # The sequence number of the task's current schedule entry.
+        self._seq = None
 
     def run(self):
         """
@@ -94,17 +107,33 @@ class Scheduler(object):
 
     http://docs.python.org/library/sched.html#module-sched
 
+    Tasks are kept in a heap ordered by execution time, so adding a
+    task costs O(log n) regardless of how many tasks are pending.
+    Cancelling or rescheduling a task only marks its heap entry as
+    stale; stale entries are skipped when they reach the top of the
+    heap, and the heap is compacted if too many accumulate.
+
+    Task names are unique: adding a task with the name of a pending
+    task replaces the pending task.
+
+    The scheduler's thread sleeps until the next task is due, and is
+    woken early only when a task is added or rescheduled.
+
     Attributes:
-        addq        -- A queue storing added tasks.
-        schedule    -- A list of tasks in order of execution times.
+        addq        -- A queue storing added and rescheduled tasks.
+        schedule    -- A heap of (time, sequence, task) entries.
+        tasks       -- A dictionary of pending tasks, keyed by name.
         thread      -- If threaded, the thread processing the schedule.
         run         -- Indicates if the scheduler is running.
         parentqueue -- A parent event queue in control of this scheduler.
 
     Methods:
-        add     -- Add a new task to the schedule.
-        process -- Process and schedule tasks.
-        quit    -- Stop the scheduler.
+        add         -- Add a new task to the schedule.
+        cancel      -- Remove a task from the schedule.
+        reschedule  -- Change the delay before a task executes.
+        process     -- Process and schedule tasks.
+        run_pending -- Execute due tasks without the scheduler's thread.
+        quit        -- Stop the scheduler.
     """
 
     def __init__(self, parentqueue=None, parentstop=None):
@@ -114,12 +143,16 @@ class Scheduler(object):
         Arguments:
             parentqueue -- A separate event queue controlling this scheduler.
         """
-        self.addq = queue.Queue()
+        self.addq = NotifyQueue()
         self.schedule = []
+        self.tasks = {}
         self.thread = None
         self.run = False
         self.parentqueue = parentqueue
         self.parentstop = parentstop
+        self.lock = threading.Lock()
+        self._seq = 0
+        self._stale = 0
 
     def process(self, threaded=True):
         """
@@ -129,6 +162,9 @@ class Scheduler(object):
             threaded -- Indicates if the scheduler should execute in its own
                         thread. Defaults to True.
         """
+        # Set before the thread starts, so that an early call to
+        # quit is not overridden.
+        self.run = True
         if threaded:
             self.thread = threading.Thread(name='sheduler_process',
                                            target=self._process)
@@ -138,38 +174,16 @@ class Scheduler(object):
 
     def _process(self):
         """Process scheduled tasks."""
-        self.run = True
         try:
             while self.run and (self.parentstop is None or not self.parentstop.isSet()):
-                    wait = 1
-                    updated = False
-                    if self.schedule:
-                        wait = self.schedule[0].next - time.time()
-                    try:
-                        if wait <= 0.0:
-                            newtask = self.addq.get(False)
-                        else:
-                            if wait >= 3.0:
-                                wait = 3.0
-                            newtask = self.addq.get(True, wait)
-                    except queue.Empty:
-                        cleanup = []
-                        for task in self.schedule:
-                            if time.time() >= task.next:
-                                updated = True
-                                if not task.run():
-                                    cleanup.append(task)
-                            else:
-                                break
-                        for task in cleanup:
-                            x = self.schedule.pop(self.schedule.index(task))
-                    else:
-                        updated = True
-                        self.schedule.append(newtask)
-                    finally:
-                        if updated:
-                            self.schedule = sorted(self.schedule,
-                                                   key=lambda task: task.next)
+                wait = self.run_pending()
+                if not self.run:
+                    break
+                try:
+                    if wait is None or wait > 0.0:
+                        self._accept(self.addq.get(True, wait))
+                except queue.Empty:
+                    pass
         except KeyboardInterrupt:
             self.run = False
             if self.parentstop is not None:
@@ -183,10 +197,87 @@ class Scheduler(object):
         if self.parentqueue is not None:
             self.parentqueue.put(('quit', None, None))
 
+    def run_pending(self):
+        """
+        Accept newly added tasks and execute any tasks that are due.
+
+        Used by the scheduler's thread, and to drive the scheduler from
+        an external event loop instead. Set addq.notify to be told when
+        new tasks arrive.
+
+        Returns the number of seconds until the next task is due, or
+        None if there are no scheduled tasks.
+        """
+        while True:
+            try:
+                self._accept(self.addq.get(False))
+            except queue.Empty:
+                break
+
+        # Rescheduling a repeating task may compact the schedule into
+        # a new list, so self.schedule is read again on each pass.
+        while self.schedule:
+            when, seq, task = self.schedule[0]
+            if seq != task._seq:
+                heapq.heappop(self.schedule)
+                self._stale -= 1
+                continue
+            if when > time.time():
+                return max(0.0, when - time.time())
+            heapq.heappop(self.schedule)
+            with self.lock:
+                if task._seq != seq:
+                    # Cancelled or rescheduled while being checked.
+                    self._stale -= 1
+                    continue
+                task._seq = None
+            repeat = task.run()
+            with self.lock:
+                if repeat and not task.cancelled and task._seq is None:
+                    self._push(task)
+                elif task._seq is None and self.tasks.get(task.name) is task:
+                    del self.tasks[task.name]
+        return None
+
+    def _accept(self, task):
+        """
+        Move an added or rescheduled task into the schedule heap.
+
+        Arguments:
+            task -- The task to schedule, or None to only wake
+                    the scheduler.
+        """
+        if task is None:
+            return
+        with self.lock:
+            if not task.cancelled and self.tasks.get(task.name) is task:
+                self._push(task)
+
+    def _push(self, task):
+        """
+        Add a heap entry for a task, marking any previous entry
+        as stale. Must be called with the lock held.
+
+        Arguments:
+            task -- The task to schedule.
+        """
+        if task._seq is not None:
+            self._stale += 1
+        self._seq += 1
+        task._seq = self._seq
+        heapq.heappush(self.schedule, (task.next, task._seq, task))
+        if self._stale > COMPACT_THRESHOLD and \
+           self._stale * 2 > len(self.schedule):
+            self.schedule = [entry for entry in self.schedule \
+                             if entry[1] == entry[2]._seq]
+            heapq.heapify(self.schedule)
+            self._stale = 0
+
     def add(self, name, seconds, callback, args=None,
             kwargs=None, repeat=False, qpointer=None):
         """
-        Schedule a new task.
+        Schedule a new task, replacing any pending task
+        with the same name.
 
         Arguments:
             name     -- The name of the task.
@@ -199,9 +290,70 @@ class Scheduler(object):
             qpointer -- A pointer to an event queue for queuing callback
                         execution instead of executing immediately.
         """
-        self.addq.put(Task(name, seconds, callback, args,
-                           kwargs, repeat, qpointer))
+        task = Task(name, seconds, callback, args,
+                    kwargs, repeat, qpointer)
+        with self.lock:
+            previous = self.tasks.get(name, None)
+            if previous is not None:
+                self._cancel(previous)
+            self.tasks[name] = task
+        self.addq.put(task)
+
+    def cancel(self, name):
+        """
+        Remove a pending task from the schedule.
+
+        Returns True if a task was cancelled.
+
+        Arguments:
+            name -- The name of the task.
+        """
+        with self.lock:
+            task = self.tasks.get(name, None)
+            if task is None:
+                return False
+            self._cancel(task)
+            return True
+
+    def _cancel(self, task):
+        """
+        Mark a task as cancelled. Must be called with the lock held.
+
+        Arguments:
+            task -- The task to cancel.
+        """
+        task.cancelled = True
+        if task._seq is not None:
+            task._seq = None
+            self._stale += 1
+        if self.tasks.get(task.name) is task:
+            del self.tasks[task.name]
+
+    def reschedule(self, name, seconds):
+        """
+        Change the delay before a pending task executes, measured
+        from now. For repeating tasks, the new delay is also used
+        for later repetitions.
+
+        Returns True if the task was found.
+
+        Arguments:
+            name    -- The name of the task.
+            seconds -- The new number of seconds to wait.
+        """
+        with self.lock:
+            task = self.tasks.get(name, None)
+            if task is None:
+                return False
+            task.seconds = seconds
+            task.reset()
+            if task._seq is not None:
+                task._seq = None
+                self._stale += 1
+        self.addq.put(task)
+        return True
 
     def quit(self):
         """Shutdown the scheduler."""
         self.run = False
+        self.addq.put(None)
@@ -124,6 +124,9 @@ class ElementBase(object):
                              initialized plugin stanza objects.
         values            -- A dictionary of the stanza's interfaces
                              and interface values, including plugins.
+        _shared           -- Indicates if the stanza's XML is shared with
+                             other stanza objects, and must be copied
+                             before it is modified.
 
     Methods:
         setup              -- Initialize the stanza's XML contents.
@@ -159,6 +162,10 @@ class ElementBase(object):
         next               -- Return the next iterable substanza.
         _fix_ns            -- Apply the stanza's namespace to non-namespaced
                               elements in an XPath expression.
+        _share             -- Return a stanza object sharing this
+                              stanza's XML.
+        _cow               -- Copy shared XML before modifying it.
+        _unshare           -- Replace shared XML with a private copy.
     """
 
     name = 'stanza'
@@ -170,6 +177,7 @@ class ElementBase(object):
     plugin_attrib_map = {}
     plugin_tag_map = {}
     subitem = None
+    _shared = False
 
     def __init__(self, xml=None, parent=None):
         """
@@ -242,6 +250,7 @@ class ElementBase(object):
                     last_xml.append(new)
                 last_xml = new
             if self.parent is not None:
+                self.parent()._cow()
                 self.parent().xml.append(self.xml)
 
             # We had to generate XML
@@ -399,6 +408,7 @@ class ElementBase(object):
             attrib -- The name of the stanza interface to modify.
             value  -- The new value of the stanza interface.
         """
+        self._cow()
         if attrib in self.interfaces:
             if value is not None:
                 set_method = "set_%s" % attrib.lower()
@@ -448,6 +458,7 @@ class ElementBase(object):
         Arguments:
             attrib -- The name of the affected stanza interface.
         """
+        self._cow()
         if attrib in self.interfaces:
             del_method = "del_%s" % attrib.lower()
             del_method2 = "del%s" % attrib.title()
@@ -482,6 +493,7 @@ class ElementBase(object):
         if value is None or value == '':
             self.__delitem__(name)
         else:
+            self._cow()
             self.xml.attrib[name] = value
 
     def _del_attr(self, name):
@@ -492,6 +504,7 @@ class ElementBase(object):
             name -- The name of the attribute.
         """
         if name in self.xml.attrib:
+            self._cow()
             del self.xml.attrib[name]
 
     def _get_attr(self, name, default=''):
@@ -548,12 +561,13 @@ class ElementBase(object):
             keep -- Indicates if the element should be kept if its text is
                     removed. Defaults to False.
         """
-        path = self._fix_ns(name, split=True)
-        element = self.xml.find(name)
-
         if not text and not keep:
             return self._del_sub(name)
 
+        self._cow()
+        path = self._fix_ns(name, split=True)
+        element = self.xml.find(name)
+
         if element is None:
             # We need to add the element. If the provided name was
             # an XPath expression, some of the intermediate elements
@@ -586,6 +600,7 @@ class ElementBase(object):
             all  -- If True, remove all empty elements in the path to the
                     deleted element. Defaults to False.
         """
+        self._cow()
         path = self._fix_ns(name, split=True)
         original_target = path[-1]
 
@@ -749,6 +764,7 @@ class ElementBase(object):
                 return self.appendxml(item)
             else:
                 raise TypeError
+        self._cow()
         self.xml.append(item.xml)
         self.iterables.append(item)
         return self
@@ -763,6 +779,7 @@ class ElementBase(object):
         Arguments:
             xml -- The XML object to add to the stanza.
         """
+        self._cow()
         self.xml.append(xml)
         return self
 
@@ -776,6 +793,7 @@ class ElementBase(object):
         Arguments:
             index -- The index of the substanza to remove.
         """
+        self._cow()
         substanza = self.iterables.pop(index)
         self.xml.remove(substanza.xml)
         return substanza
@@ -934,6 +952,57 @@ class ElementBase(object):
         """
         return self.__class__(xml=copy.deepcopy(self.xml), parent=self.parent)
 
+    def _share(self):
+        """
+        Return a new stanza object that shares this stanza's underlying
+        XML object instead of copying it.
+
+        Both stanza objects will make a private copy of the XML before
+        modifying it through the stanza interfaces, so neither will see
+        the other's changes. Modifying the XML object directly bypasses
+        this protection.
+        """
+        self._shared = True
+        stanza = self.__class__(xml=self.xml)
+        stanza._shared = True
+        return stanza
+
+    def _cow(self):
+        """
+        Copy the stanza's XML before it is modified if it is shared
+        with other stanza objects. Plugin and substanza objects check
+        the stanza that contains them.
+        """
+        stanza = self
+        while stanza is not None:
+            if stanza._shared:
+                stanza._unshare()
+                return
+            if stanza.parent is None:
+                return
+            stanza = stanza.parent()
+
+    def _unshare(self):
+        """
+        Replace the stanza's shared XML with a private copy, updating
+        any plugins and substanzas to use the copied elements.
+        """
+        shared = self.xml
+        self.xml = copy.deepcopy(shared)
+        if hasattr(shared, 'iter'):
+            copies = dict(zip(shared.iter(), self.xml.iter()))
+        else:
+            copies = dict(zip(shared.getiterator(),
+                              self.xml.getiterator()))
+
+        def remap(stanza):
+            for child in list(stanza.plugins.values()) + stanza.iterables:
+                child.xml = copies.get(child.xml, child.xml)
+                remap(child)
+
+        remap(self)
+        self._shared = False
+
     def __str__(self):
         """
         Return a string serialization of the underlying XML object.
@@ -1042,6 +1111,7 @@ class StanzaBase(ElementBase):
             value -- One of the values contained in StanzaBase.types
         """
         if value in self.types:
+            self._cow()
             self.xml.attrib['type'] = value
         return self
 
@@ -1100,6 +1170,7 @@ class StanzaBase(ElementBase):
 
         Any attribute values will be preserved.
         """
+        self._cow()
         for child in self.xml.getchildren():
             self.xml.remove(child)
         for plugin in list(self.plugins.keys()):
@@ -1147,8 +1218,13 @@ class StanzaBase(ElementBase):
                                                             self.name))
 
     def send(self):
-        """Queue the stanza to be sent on the XML stream."""
-        self.stream.sendRaw(self.__str__())
+        """
+        Queue the stanza to be sent on the XML stream.
+
+        Returns False if the stanza was dropped because the send
+        queue is full.
+        """
+        return self.stream.sendRaw(self.__str__())
 
     def __copy__(self):
         """
@@ -1158,6 +1234,18 @@ class StanzaBase(ElementBase):
         return self.__class__(xml=copy.deepcopy(self.xml),
                               stream=self.stream)
 
+    def _share(self):
+        """
+        Return a new stanza object that shares this stanza's underlying
+        XML object and XML stream.
+
+        Overrides ElementBase._share
+        """
+        self._shared = True
+        stanza = self.__class__(xml=self.xml, stream=self.stream)
+        stanza._shared = True
+        return stanza
+
     def __str__(self):
         """Serialize the stanza's XML to a string."""
         return tostring(self.xml, xmlns='',
@@ -0,0 +1,223 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import logging
+import ssl
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+# Cipher suites for TLS 1.2 and earlier, preferring forward secret
+# AEAD ciphers. TLS 1.3 suites are always AEAD and are chosen by
+# the ssl library.
+CIPHERS = 'ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:DHE+CHACHA20:' + \
+          'ECDHE+AES:DHE+AES:!aNULL:!eNULL:!MD5:!DSS:!RC4:!3DES'
+
+# The largest number of servers to keep TLS sessions for.
+MAX_SESSIONS = 1024
+
+# Flag indicating if the ssl module supports contexts and sessions.
+CONTEXT_SUPPORT = hasattr(ssl, 'SSLContext') and hasattr(ssl, 'SSLSession')
+
+
+class TLSContext(object):
+
+    """
+    TLS settings and a cache of TLS sessions, shared by streams so
+    that reconnecting to a server, or connecting another account to
+    it, may resume an earlier session instead of performing a full
+    handshake.
+
+    Sessions are cached per server address and server name. Resuming
+    a session skips checking the server's certificate, so a session
+    is only resumed for the name it was checked against. With TLS 1.3
+    the server sends its session ticket after the handshake, so the
+    session of a connection is saved again before the connection is
+    closed.
+
+    When the ssl module lacks SSLContext, sockets are wrapped with
+    ssl.wrap_socket and sessions are not resumed.
+
+    Attributes:
+        ciphers     -- The cipher suites to offer, in OpenSSL format.
+        ssl_version -- The SSL protocol version to use, or None for
+                       the highest version both sides support.
+        ca_certs    -- Optional file of CA certificates with which to
+                       verify the server's certificate. Certificates
+                       are not verified if not given.
+        context     -- The ssl.SSLContext, if supported.
+        stats       -- A dictionary counting handshakes, resumed
+                       sessions, and the time spent in handshakes.
+
+    Methods:
+        wrap_socket      -- Wrap a socket with TLS and perform a handshake.
+        record_handshake -- Count a completed handshake.
+        save_session     -- Remember a connection's session for resumption.
+        clear            -- Forget cached sessions.
+        hit_rate         -- Return the fraction of handshakes resumed.
+    """
+
+    def __init__(self, ciphers=CIPHERS, ssl_version=None, ca_certs=None,
+                 max_sessions=MAX_SESSIONS):
+        """
+        Create a new TLS context.
+
+        Arguments:
+            ciphers      -- The cipher suites to offer.
+                            Defaults to CIPHERS.
+            ssl_version  -- Optional SSL protocol version.
+            ca_certs     -- Optional file of CA certificates.
+            max_sessions -- The largest number of servers to cache
+                            sessions for. Defaults to MAX_SESSIONS.
+        """
+        self.ciphers = ciphers
+        self.ssl_version = ssl_version
+        self.ca_certs = ca_certs
+        self.max_sessions = max_sessions
+        self.stats = {'handshakes': 0,
+                      'resumed': 0,
+                      'handshake_time': 0.0}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.context = None
+        if CONTEXT_SUPPORT:
+            self.context = self._create_context()
+
+    def _create_context(self):
+        """Create the ssl.SSLContext used for client connections."""
+        if self.ssl_version is None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        else:
+            context = ssl.SSLContext(self.ssl_version)
+        if self.ca_certs:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.check_hostname = True
+            context.load_verify_locations(self.ca_certs)
+        else:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if self.ciphers:
+            context.set_ciphers(self.ciphers)
+        return context
+
+    def wrap_socket(self, sock, address=None, handshake=True,
+                    server_hostname=None):
+        """
+        Wrap a connected socket with TLS and perform the handshake,
+        resuming the last session with the same server if possible.
+
+        Returns the wrapped socket.
+
+        Arguments:
+            sock      -- The connected socket.
+            address   -- The (host, port) of the server, used to find
+                         a session to resume.
+            handshake -- If False, the handshake is left to the caller,
+                         which must call do_handshake on the returned
+                         socket and then record_handshake, such as
+                         when the socket is non-blocking.
+                         Defaults to True.
+            server_hostname -- The name the server's certificate must
+                               match when ca_certs is given, which is
+                               also sent to the server using SNI.
+        """
+        start = time.time()
+        if self.context is None:
+            kwargs = {'do_handshake_on_connect': False}
+            if self.ssl_version is not None:
+                kwargs['ssl_version'] = self.ssl_version
+            if self.ca_certs:
+                kwargs['cert_reqs'] = ssl.CERT_REQUIRED
+                kwargs['ca_certs'] = self.ca_certs
+            ssl_socket = ssl.wrap_socket(sock, **kwargs)
+        else:
+            with self._lock:
+                session = self._sessions.get((address, server_hostname),
+                                             None)
+            ssl_socket = self.context.wrap_socket(
+                    sock, do_handshake_on_connect=False, session=session,
+                    server_hostname=server_hostname)
+        if handshake:
+            ssl_socket.do_handshake()
+            self.record_handshake(ssl_socket, address, time.time() - start)
+        return ssl_socket
+
+    def record_handshake(self, ssl_socket, address, elapsed):
+        """
+        Count a completed handshake, and remember its session so that
+        the next connection to the server may resume it.
+
+        Arguments:
+            ssl_socket -- The TLS socket.
+            address    -- The (host, port) of the server.
+            elapsed    -- The time taken by the handshake, in seconds.
+        """
+        resumed = getattr(ssl_socket, 'session_reused', False)
+        with self._lock:
+            self.stats['handshakes'] += 1
+            self.stats['handshake_time'] += elapsed
+            if resumed:
+                self.stats['resumed'] += 1
+        log.debug("TLS handshake with %s took %.3f seconds%s" % (
+                  address, elapsed, ', session resumed' if resumed else ''))
+        self.save_session(ssl_socket, address)
+
+    def save_session(self, sock, address):
+        """
+        Remember the TLS session of a connection so that the next
+        connection to the same server may resume it.
+
+        Arguments:
+            sock    -- The TLS socket.
+            address -- The (host, port) of the server.
+        """
+        if self.context is None or address is None:
+            return
+        try:
+            session = sock.session
+        except (AttributeError, ValueError, ssl.SSLError):
+            return
+        if not isinstance(session, ssl.SSLSession):
+            return
+        key = (address, getattr(sock, 'server_hostname', None))
+        with self._lock:
+            if key not in self._sessions and \
+               len(self._sessions) >= self.max_sessions:
+                del self._sessions[next(iter(self._sessions))]
+            self._sessions[key] = session
+
+    def clear(self, address=None):
+        """
+        Forget the cached session for a server, or for all servers.
+
+        Arguments:
+            address -- Optional (host, port) of the server.
+        """
+        with self._lock:
+            if address is None:
+                self._sessions.clear()
+            else:
+                for key in [key for key in self._sessions \
+                            if key[0] == address]:
+                    del self._sessions[key]
+
+    def hit_rate(self):
+        """Return the fraction of handshakes that resumed a session."""
+        with self._lock:
+            if not self.stats['handshakes']:
+                return 0.0
+            return float(self.stats['resumed']) / self.stats['handshakes']
+
+
+# The context shared by all streams in the process.
+TLS_CONTEXT = TLSContext()
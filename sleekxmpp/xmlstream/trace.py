@@ -0,0 +1,160 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import time
+from collections import deque
+
+from sleekxmpp.xmlstream.tostring import tostring
+
+
+log = logging.getLogger(__name__)
+
+# Traffic is logged where XMLStream has always logged it, so that
+# existing logging configurations keep showing it.
+wire_log = logging.getLogger('sleekxmpp.xmlstream.xmlstream')
+
+
+def log_sink(direction, data, when):
+    """
+    Default wire trace sink that writes traffic to the debug log
+    of the sleekxmpp.xmlstream.xmlstream logger.
+
+    Arguments:
+        direction -- Either 'RECV' or 'SEND'.
+        data      -- The traced text.
+        when      -- The time the data was traced.
+    """
+    wire_log.debug("%s: %s" % (direction, data))
+
+
+class WireTrace(object):
+
+    """
+    Trace the raw traffic sent and received on an XML stream.
+
+    Tracing is checked with a single call to active() before anything
+    is serialized or formatted, so a disabled trace costs nothing
+    beyond that check.
+
+    By default, tracing follows the debug log level: traffic is traced
+    to the log only when the sleekxmpp.xmlstream.xmlstream logger
+    would emit debug messages. Calling enable() or disable()
+    overrides that.
+
+    Attributes:
+        enabled -- True or False to turn tracing on or off, or None
+                   to trace only when debug logging is enabled.
+        sample  -- Trace only one of every N items. Defaults to 1.
+        history -- A bounded buffer of recently traced items, as
+                   (time, direction, data) tuples, or None.
+        sinks   -- Functions called with (direction, data, time)
+                   for every traced item.
+
+    Methods:
+        active   -- Return True if traffic should be traced.
+        enable   -- Turn tracing on.
+        disable  -- Turn tracing off.
+        add_sink -- Add a function to receive traced items.
+        del_sink -- Remove a trace sink.
+        record   -- Trace an item sent or received.
+        recent   -- Return the items held in the history buffer.
+    """
+
+    def __init__(self, enabled=None, sample=1, history=0):
+        """
+        Create a new wire trace.
+
+        Arguments:
+            enabled -- True, False, or None to follow the debug log level.
+            sample  -- Trace one of every N items. Defaults to 1.
+            history -- Number of recent items to keep in memory.
+                       Defaults to 0 to keep none.
+        """
+        self.enabled = enabled
+        self.sample = sample
+        self.history = deque(maxlen=history) if history else None
+        self.sinks = [log_sink]
+        self._count = 0
+
+    def active(self):
+        """Return True if traffic should be traced."""
+        if self.enabled is None:
+            return wire_log.isEnabledFor(logging.DEBUG)
+        return self.enabled
+
+    def enable(self, sample=1, history=None):
+        """
+        Turn tracing on.
+
+        Arguments:
+            sample  -- Trace one of every N items. Defaults to 1.
+            history -- Optional number of recent items to keep in
+                       memory. Any existing history is kept if
+                       not given.
+        """
+        self.sample = sample
+        if history is not None:
+            self.history = deque(maxlen=history) if history else None
+        self.enabled = True
+
+    def disable(self):
+        """Turn tracing off. The history buffer is kept."""
+        self.enabled = False
+
+    def add_sink(self, sink):
+        """
+        Add a function to receive traced items.
+
+        Arguments:
+            sink -- A function accepting (direction, data, time).
+        """
+        self.sinks = self.sinks + [sink]
+
+    def del_sink(self, sink):
+        """
+        Remove a trace sink, such as the default log_sink.
+
+        Arguments:
+            sink -- The function to remove.
+        """
+        self.sinks = [s for s in self.sinks if s is not sink]
+
+    def record(self, direction, data, stream=None):
+        """
+        Trace an item of traffic, subject to sampling.
+
+        Callers should check active() first.
+
+        Arguments:
+            direction -- Either 'RECV' or 'SEND'.
+            data      -- The raw text, or an XML object if a
+                         stream is given.
+            stream    -- Optional XMLStream used to serialize
+                         an XML object.
+        """
+        if self.sample > 1:
+            self._count += 1
+            if self._count % self.sample:
+                return
+        if stream is not None:
+            data = tostring(data, xmlns=stream.default_ns, stream=stream)
+        when = time.time()
+        if self.history is not None:
+            self.history.append((when, direction, data))
+        for sink in self.sinks:
+            try:
+                sink(direction, data, when)
+            except Exception:
+                log.exception('Error in wire trace sink %s' % str(sink))
+
+    def recent(self):
+        """Return a list of the items held in the history buffer."""
+        if self.history is None:
+            return []
+        return list(self.history)
@@ -0,0 +1,303 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from __future__ import with_statement
+
+import logging
+import threading
+import time
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+
+# Policies for handling a new job when the backlog is full.
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+REJECT = 'reject'
+
+
+class WorkerPool(object):
+
+    """
+    A bounded pool of worker threads, used to execute threaded event
+    handlers without starting a new thread for every event.
+
+    Workers are started as jobs arrive, up to max_workers, and exit
+    once they have been idle for idle_timeout seconds. Jobs that can
+    not start right away wait in a backlog. If the backlog is limited
+    and full, the overflow policy decides what happens to a new job:
+        block       -- Wait until there is room in the backlog.
+        drop_oldest -- Discard the oldest waiting job.
+        reject      -- Discard the new job.
+
+    A job may be submitted with a key and a concurrency limit, such as
+    an event handler and the number of copies of it that may run at
+    once. Jobs beyond the limit wait, in order, for a running job with
+    the same key to finish.
+
+    Attributes:
+        max_workers  -- The maximum number of worker threads.
+        backlog      -- The maximum number of waiting jobs, or 0
+                        for no limit.
+        overflow     -- The policy for a full backlog: one of
+                        'block', 'drop_oldest', or 'reject'.
+        idle_timeout -- Seconds an idle worker waits for a new
+                        job before exiting.
+        name         -- A prefix for the worker threads' names.
+
+    Methods:
+        submit   -- Queue a function for execution by a worker.
+        stats    -- Return the pool's size and job counters.
+        shutdown -- Stop accepting jobs and let the workers exit.
+    """
+
+    def __init__(self, max_workers=32, backlog=0, overflow=BLOCK,
+                 idle_timeout=5, name='worker'):
+        """
+        Create a new worker pool. No threads are started
+        until jobs are submitted.
+
+        Arguments:
+            max_workers  -- The maximum number of worker threads.
+                            Defaults to 32.
+            backlog      -- The maximum number of waiting jobs.
+                            Defaults to 0 for no limit.
+            overflow     -- The policy for a full backlog.
+                            Defaults to 'block'.
+            idle_timeout -- Seconds an idle worker waits before
+                            exiting. Defaults to 5.
+            name         -- A prefix for the worker threads' names.
+        """
+        self.max_workers = max_workers
+        self.backlog = backlog
+        self.overflow = overflow
+        self.idle_timeout = idle_timeout
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._jobs = deque()
+        self._deferred = {}
+        self._deferred_count = 0
+        self._running = {}
+        self._seq = 0
+        self._workers = 0
+        self._starting = 0
+        self._idle = 0
+        self._peak = 0
+        self._completed = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._stopped = False
+
+    def submit(self, func, args=(), key=None, limit=None):
+        """
+        Queue a function for execution by a worker thread.
+
+        Returns True if the job was accepted, or False if it was
+        rejected because the backlog is full or the pool was shut down.
+
+        Arguments:
+            func  -- The function to execute.
+            args  -- A tuple of arguments for the function.
+            key   -- Optional key grouping jobs for the limit.
+            limit -- Optional number of jobs with the same key
+                     that may run at once.
+        """
+        with self._lock:
+            if self._stopped:
+                return False
+            while self.backlog and not self._has_capacity() and \
+                  self._waiting() >= self.backlog:
+                if self.overflow == DROP_OLDEST:
+                    self._drop_oldest()
+                elif self.overflow == REJECT:
+                    self._rejected += 1
+                    log.warning("Worker pool %s backlog full, " % self.name + \
+                                "rejecting %s" % str(func))
+                    return False
+                else:
+                    self._space.wait()
+                    if self._stopped:
+                        return False
+
+            self._seq += 1
+            job = (self._seq, func, args, key, limit)
+            if limit is not None:
+                if self._running.get(key, 0) >= limit:
+                    self._deferred.setdefault(key, deque()).append(job)
+                    self._deferred_count += 1
+                    return True
+                self._running[key] = self._running.get(key, 0) + 1
+            self._queue(job)
+            return True
+
+    def stats(self):
+        """
+        Return a dictionary describing the pool's current size and
+        the number of jobs it has handled.
+
+        The keys are:
+            workers      -- The number of worker threads.
+            idle         -- The number of workers waiting for jobs.
+            busy         -- The number of workers executing jobs.
+            waiting      -- The number of jobs waiting for a worker
+                            or for their concurrency limit.
+            peak_workers -- The largest number of workers at once.
+            completed    -- The number of jobs executed.
+            dropped      -- The number of jobs dropped from a full
+                            backlog.
+            rejected     -- The number of jobs rejected because the
+                            backlog was full.
+        """
+        with self._lock:
+            return {'workers': self._workers,
+                    'idle': self._idle,
+                    'busy': self._workers - self._idle - self._starting,
+                    'waiting': len(self._jobs) + self._deferred_count,
+                    'peak_workers': self._peak,
+                    'completed': self._completed,
+                    'dropped': self._dropped,
+                    'rejected': self._rejected}
+
+    def shutdown(self):
+        """
+        Stop accepting new jobs. Workers exit once the jobs
+        already queued have been executed.
+        """
+        with self._lock:
+            self._stopped = True
+            self._work.notify_all()
+            self._space.notify_all()
+
+    def _has_capacity(self):
+        """
+        Return True if a new job could start without waiting.
+        Must be called with the lock held.
+        """
+        free = self._idle + self._starting + \
+               self.max_workers - self._workers
+        return len(self._jobs) < free
+
+    def _waiting(self):
+        """
+        Return the number of jobs that are waiting for a worker
+        or for their concurrency limit. Must be called with the
+        lock held.
+        """
+        free = self._idle + self._starting + \
+               self.max_workers - self._workers
+        return max(0, len(self._jobs) - free) + self._deferred_count
+
+    def _queue(self, job):
+        """
+        Make a job available to the workers, starting a new worker
+        if none are free. Must be called with the lock held.
+
+        Arguments:
+            job -- The job tuple to execute.
+        """
+        self._jobs.append(job)
+        if len(self._jobs) > self._idle + self._starting and \
+           self._workers < self.max_workers:
+            self._workers += 1
+            self._starting += 1
+            self._peak = max(self._peak, self._workers)
+            thread = threading.Thread(name='%s_%s' % (self.name, self._seq),
+                                      target=self._worker)
+            thread.daemon = True
+            thread.start()
+        else:
+            self._work.notify()
+
+    def _release(self, key, limit):
+        """
+        Record that a job with a concurrency limit has finished,
+        queuing the next job waiting on the same key.
+        Must be called with the lock held.
+
+        Arguments:
+            key   -- The finished job's key.
+            limit -- The finished job's concurrency limit.
+        """
+        if limit is None:
+            return
+        waiting = self._deferred.get(key, None)
+        if waiting:
+            self._deferred_count -= 1
+            job = waiting.popleft()
+            if not waiting:
+                del self._deferred[key]
+            self._queue(job)
+        elif self._running.get(key, 0) <= 1:
+            self._running.pop(key, None)
+        else:
+            self._running[key] -= 1
+
+    def _drop_oldest(self):
+        """
+        Discard the oldest job waiting in the backlog. Jobs that free
+        workers are about to take are not considered waiting.
+        Must be called with the lock held.
+        """
+        free = max(0, self._idle + self._starting + \
+                      self.max_workers - self._workers)
+        oldest = None
+        if len(self._jobs) > free:
+            oldest = self._jobs[free]
+        for waiting in self._deferred.values():
+            if oldest is None or waiting[0][0] < oldest[0]:
+                oldest = waiting[0]
+        if oldest is None:
+            return
+        seq, func, args, key, limit = oldest
+        if len(self._jobs) > free and self._jobs[free] is oldest:
+            del self._jobs[free]
+            self._release(key, limit)
+        else:
+            waiting = self._deferred[key]
+            waiting.popleft()
+            self._deferred_count -= 1
+            if not waiting:
+                del self._deferred[key]
+        self._dropped += 1
+        log.warning("Worker pool %s backlog full, " % self.name + \
+                    "dropping %s" % str(func))
+
+    def _worker(self):
+        """Execute jobs until idle for longer than idle_timeout."""
+        job = None
+        with self._lock:
+            self._starting -= 1
+        while True:
+            with self._lock:
+                if job is not None:
+                    self._completed += 1
+                    self._release(job[3], job[4])
+                    self._space.notify()
+                    job = None
+
+                deadline = time.time() + self.idle_timeout
+                while not self._jobs:
+                    remaining = deadline - time.time()
+                    if self._stopped or remaining <= 0:
+                        self._workers -= 1
+                        return
+                    self._idle += 1
+                    self._work.wait(remaining)
+                    self._idle -= 1
+                job = self._jobs.popleft()
+                self._space.notify()
+
+            try:
+                job[1](*job[2])
+            except Exception:
+                log.exception('Error in worker pool job: %s' % str(job[1]))
@@ -11,7 +11,6 @@ from __future__ import with_statement, unicode_literals
 import copy
 import logging
 import socket as Socket
-import ssl
 import sys
 import threading
 import time
@@ -24,25 +23,51 @@ except ImportError:
 
 from sleekxmpp.thirdparty.statemachine import StateMachine
 from sleekxmpp.xmlstream import Scheduler, tostring
-from sleekxmpp.xmlstream.stanzabase import StanzaBase, ET
-
-# In Python 2.x, file socket objects are broken. A patched socket
-# wrapper is provided for this case in filesocket.py.
-if sys.version_info < (3, 0):
-    from sleekxmpp.xmlstream.filesocket import FileSocket, Socket26
+from sleekxmpp.xmlstream.dispatch import HandlerIndex
+from sleekxmpp.xmlstream.parser import XMLStreamParser
+from sleekxmpp.xmlstream.queues import NotifyQueue, SendQueue
+from sleekxmpp.xmlstream.recvbuffer import RecvBuffer
+from sleekxmpp.xmlstream.resolver import connect_first, resolve_addresses
+from sleekxmpp.xmlstream.resolver import CONNECT_DELAY, CONNECT_TIMEOUT
+from sleekxmpp.xmlstream.stanzabase import StanzaBase, ElementBase, ET
+from sleekxmpp.xmlstream.tls import TLSContext, TLS_CONTEXT
+from sleekxmpp.xmlstream.trace import WireTrace
+from sleekxmpp.xmlstream.workerpool import WorkerPool
 
 
 # The time in seconds to wait before timing out waiting for response stanzas.
 RESPONSE_TIMEOUT = 10
 
-# The number of threads to use to handle XML stream events. This is not the
-# same as the number of custom event handling threads. HANDLER_THREADS must
-# be at least 1.
+# The default number of threads to use to handle XML stream events. This is
+# not the same as the number of custom event handling threads.
+# HANDLER_THREADS must be at least 1. See XMLStream.handler_threads.
 HANDLER_THREADS = 1
 
+# The maximum number of threads used to run event handlers that
+# were added with threaded=True.
+HANDLER_POOL_SIZE = 32
+
 # Flag indicating if the SSL library is available for use.
 SSL_SUPPORT = True
 
+# The initial number of bytes to read from the socket at once.
+RECV_SIZE = 4096
+
+# The largest number of bytes to read from the socket at once, once
+# the receive buffer has grown to keep up with a busy stream.
+RECV_MAX_SIZE = 65536
+
+# The time in seconds to wait after failing to reach every address
+# of the server before trying again.
+RECONNECT_DELAY = 1.0
+
+# The maximum number of queued stanzas to combine into a single write.
+SEND_BATCH_MAX = 100
+
+# The number of parsed stanzas that may wait to be dispatched
+# when receiving is pipelined.
+PIPELINE_SIZE = 256
+
 
 log = logging.getLogger(__name__)
 
@@ -54,6 +79,20 @@ class RestartStream(Exception):
     """
 
 
+class SendQueueFull(Exception):
+    """
+    Exception raised when data can not be sent because the
+    send queue is full and the 'raise' send policy is used.
+    """
+
+
+class PendingLimitReached(Exception):
+    """
+    Exception raised when a response handler is registered from an
+    event runner while the limit on pending requests is reached.
+    """
+
+
 class XMLStream(object):
     """
     An XML stream connection manager and event dispatcher.
@@ -73,25 +112,101 @@ class XMLStream(object):
 
     Typically, stanzas are first processed by a stream event handler which
     will then trigger custom events to continue further processing,
-    especially since custom event handlers may run in individual threads.
+    especially since custom event handlers may run in their own threads.
 
 
     Attributes:
         address       -- The hostname and port of the server.
+        connect_delay -- The time in seconds to wait for a connection
+                         attempt before also trying the next address.
+                         Defaults to CONNECT_DELAY.
+        connect_timeout -- The time in seconds before abandoning a
+                           single connection attempt. Defaults to
+                           CONNECT_TIMEOUT.
+        connect_stats -- Counters for connections made, failed, and
+                         attempted, and the time taken to connect.
+        copy_on_write -- Flag indicating if handlers should share stanza
+                         objects' XML, copying it only when a handler
+                         modifies its stanza. Defaults to False.
         default_ns    -- The default XML namespace that will be applied
                          to all non-namespaced stanzas.
+        dispatch_key  -- Optional function returning the key used to
+                         order events for a stanza when ordered_dispatch
+                         is used. Defaults to the sender's bare JID.
         event_queue   -- A queue of stream, custom, and scheduled
                          events to be processed.
-        filesocket    -- A filesocket created from the main connection socket.
-                         Required for ElementTree.iterparse.
+        event_shards  -- When ordered_dispatch is used, a list of event
+                         queues, one per event runner thread. The first
+                         is event_queue.
+        event_queue_limit -- Optional number of queued events at which
+                             the reader stops reading from the socket
+                             until the event runners catch up. Applies
+                             to each of event_shards. Reading goes on
+                             while an event handler awaits a response
+                             to a request, since otherwise the
+                             response could not arrive. Defaults to
+                             None.
+        inbound_stats -- Counters for how often and for how long the
+                         reader paused for full event queues, and the
+                         deepest event queue seen.
+        handler_pool  -- A WorkerPool executing threaded event handlers.
+                         Its size, backlog, and overflow policy may
+                         be adjusted before processing starts.
+        handler_threads  -- The number of event runner threads.
+                            Defaults to HANDLER_THREADS.
+        ordered_dispatch -- Flag indicating if events for stanzas with
+                            the same dispatch key should be processed
+                            in order by a single event runner thread,
+                            so that handler_threads may be raised
+                            safely. Defaults to False.
+        max_pending   -- The limit on requests awaiting a response,
+                         or None. See set_max_pending.
         namespace_map -- Optional mapping of namespaces to namespace prefixes.
+        parser        -- The incremental parser for the incoming stream.
+        reconnect_delay -- The time in seconds to wait before trying
+                           again once no address could be reached.
+                           Defaults to RECONNECT_DELAY.
+        pipeline_receive -- Flag indicating if, once the session has
+                            started, received stanzas should be matched
+                            against handlers in a separate dispatch
+                            thread so that parsing and matching overlap.
+                            Defaults to False.
+        recv_size     -- The initial number of bytes to read from the
+                         socket at once. Defaults to RECV_SIZE.
+        recv_max_size -- The number of bytes per read that the receive
+                         buffer may grow to while reads keep filling it.
+                         Defaults to RECV_MAX_SIZE.
+        recv_buffer   -- The RecvBuffer holding received data, created
+                         when processing starts.
         scheduler     -- A scheduler object for triggering events
                          after a given period of time.
-        send_queue    -- A queue of stanzas to be sent on the stream.
+        send_queue    -- A SendQueue of stanzas to be sent on the stream.
+                         Its max_items and max_bytes attributes limit
+                         its size, and its bytes attribute gives the
+                         length of the queued data. The send_queue_high
+                         and send_queue_drained events are triggered
+                         at its watermarks.
+        send_policy   -- What to do when sending to a full send queue:
+                         'block' to wait for room, 'raise' to raise
+                         SendQueueFull, or 'drop' to discard the data.
+                         Defaults to 'block'.
+        send_timeout  -- Optional time in seconds to wait for room with
+                         the 'block' policy before discarding the data.
+        send_batch_max   -- The maximum number of queued stanzas to
+                            combine into a single socket write.
+        send_batch_delay -- Time in seconds to wait for more stanzas
+                            to be queued before writing. Defaults to 0.
+        send_stats    -- Counters for socket writes, stanzas and bytes
+                         sent, and the largest batch written.
         socket        -- The connection to the server.
+        ssl_context   -- The TLSContext used for TLS connections, which
+                         caches sessions for resumption. Shared by all
+                         streams in the process by default.
         ssl_support   -- Indicates if a SSL library is available for use.
-        ssl_version   -- The version of the SSL protocol to use.
-                         Defaults to ssl.PROTOCOL_TLSv1.
+        ssl_version   -- Deprecated. If set to a version of the SSL
+                         protocol, a TLSContext for that version is
+                         created in place of ssl_context. Defaults to
+                         None, to use the highest version available.
         state         -- A state machine for managing the stream's
                          connection state.
         stream_footer -- The start tag and any attributes for the stream's
@@ -100,38 +215,50 @@ class XMLStream(object):
         use_ssl       -- Flag indicating if SSL should be used.
         use_tls       -- Flag indicating if TLS should be used.
         stop          -- threading Event used to stop all threads.
+        trace         -- Wire tracing for raw sent and received data.
         auto_reconnect-- Flag to determine whether we auto reconnect.
 
     Methods:
         add_event_handler    -- Add a handler for a custom event.
+        add_filter           -- Add a filter for received or sent data.
         add_handler          -- Shortcut method for registerHandler.
         connect              -- Connect to the given server.
+        connect_targets      -- Return the addresses to connect to.
         del_event_handler    -- Remove a handler for a custom event.
+        del_filter           -- Remove a filter.
         disconnect           -- Disconnect from the server and terminate
                                 processing.
         event                -- Trigger a custom event.
         get_id               -- Return the current stream ID.
         incoming_filter      -- Optionally filter stanzas before processing.
         new_id               -- Generate a new, unique ID value.
+        pending_count        -- Return the number of requests awaiting
+                                a response.
         process              -- Read XML stanzas from the stream and apply
                                 matching stream handlers.
         reconnect            -- Reestablish a connection to the server.
         register_handler     -- Add a handler for a stream event.
+        register_response    -- Add a handler for the response to a
+                                request with a given ID.
         register_stanza      -- Add a new stanza object type that may appear
                                 as a direct child of the stream's root.
         remove_handler       -- Remove a stream handler.
+        remove_response      -- Remove a response handler.
         remove_stanza        -- Remove a stanza object type.
+        set_max_pending      -- Limit the number of requests awaiting
+                                a response.
         schedule             -- Schedule an event handler to execute after a
                                 given delay.
         send                 -- Send a stanza object on the stream.
         send_raw             -- Send a raw string on the stream.
         send_xml             -- Send an XML string on the stream.
-        set_socket           -- Set the stream's socket and generate a new
-                                filesocket.
+        set_socket           -- Set the stream's socket.
         start_stream_handler -- Perform any stream initialization such
                                 as handshakes.
         start_tls            -- Establish a TLS connection and restart
                                 the stream.
+        tls_server_name      -- Return the name the server's TLS
+                                certificate must match.
     """
 
     def __init__(self, socket=None, host='', port=0):
@@ -160,19 +287,16 @@ class XMLStream(object):
         self.sendXML = self.send_xml
 
         self.ssl_support = SSL_SUPPORT
-        self.ssl_version = ssl.PROTOCOL_TLSv1
+        self.ssl_version = None
+        self.ssl_context = TLS_CONTEXT
 
         self.state = StateMachine(('disconnected', 'connected'))
         self.state._set_state('disconnected')
 
         self.address = (host, int(port))
-        self.filesocket = None
         self.set_socket(socket)
-
-        if sys.version_info < (3, 0):
-            self.socket_class = Socket26
-        else:
-            self.socket_class = Socket.socket
+        self.socket_class = Socket.socket
+        self.parser = XMLStreamParser()
 
         self.use_ssl = False
         self.use_tls = False
@@ -184,21 +308,78 @@ class XMLStream(object):
         self.stop = threading.Event()
         self.stream_end_event = threading.Event()
         self.stream_end_event.set()
-        self.event_queue = queue.Queue()
-        self.send_queue = queue.Queue()
+        self.event_queue = NotifyQueue()
+        self.event_shards = [self.event_queue]
+        self.send_queue = SendQueue()
+        self.send_queue.on_high = self._send_queue_high
+        self.send_queue.on_drained = self._send_queue_drained
+        self.send_policy = 'block'
+        self.send_timeout = None
         self.scheduler = Scheduler(self.event_queue, self.stop)
 
+        # Set when the stream is driven by an asyncio event loop.
+        self._async = None
+        # Set when a TLS handshake is left to the asyncio runner.
+        self._tls_pending = False
+
         self.namespace_map = {}
 
         self.__thread = {}
         self.__root_stanza = []
+        self.__root_stanza_map = {}
         self.__handlers = []
+        self.__handler_index = HandlerIndex()
+        self.__responses = {}
+        self.__runner_responses = set()
+        self.__filters = {'in': [], 'out': []}
+        self.__responses_lock = threading.Lock()
+        self.__response_slots = None
+        self.__runner_state = threading.local()
+        self.max_pending = None
         self.__event_handlers = {}
         self.__event_handlers_lock = threading.Lock()
 
         self._id = 0
         self._id_lock = threading.Lock()
 
+        self.trace = WireTrace()
+        self.handler_pool = WorkerPool(HANDLER_POOL_SIZE,
+                                       name='event_handler')
+        self.handler_threads = HANDLER_THREADS
+        self.ordered_dispatch = False
+        self.dispatch_key = None
+        self.copy_on_write = False
+
+        self.connect_delay = CONNECT_DELAY
+        self.connect_timeout = CONNECT_TIMEOUT
+        self.reconnect_delay = RECONNECT_DELAY
+        self.connect_stats = {'connects': 0,
+                              'failures': 0,
+                              'attempts': 0,
+                              'last_time': None,
+                              'total_time': 0.0}
+
+        self.send_batch_max = SEND_BATCH_MAX
+        self.send_batch_delay = 0
+        self.send_stats = {'writes': 0,
+                           'stanzas': 0,
+                           'bytes': 0,
+                           'largest_batch': 0}
+
+        self.recv_size = RECV_SIZE
+        self.recv_max_size = RECV_MAX_SIZE
+        self.recv_buffer = None
+
+        self.event_queue_limit = None
+
+        self.pipeline_receive = False
+        self.__pipeline_active = False
+        self.__dispatch_queue = queue.Queue(PIPELINE_SIZE)
+        self.add_event_handler('session_start', self._start_pipeline)
+        self.inbound_stats = {'pauses': 0,
+                              'paused_time': 0.0,
+                              'max_depth': 0}
+
         self.auto_reconnect = True
         self.is_client = False
 
@@ -243,8 +424,10 @@ class XMLStream(object):
         """
         Create a new socket and connect to the server.
 
-        Setting reattempt to True will cause connection attempts to be made
-        every second until a successful connection is established.
+        Every address of the server is tried, with attempts started
+        connect_delay seconds apart until one succeeds. Setting reattempt
+        to True will cause this to be repeated every reconnect_delay
+        seconds until a successful connection is established.
 
         Arguments:
             host      -- The name of the desired server for the connection.
@@ -275,32 +458,53 @@ class XMLStream(object):
 
     def _connect(self):
         self.stop.clear()
-        self.socket = self.socket_class(Socket.AF_INET, Socket.SOCK_STREAM)
-        self.socket.settimeout(None)
-        if self.use_ssl and self.ssl_support:
-            log.debug("Socket Wrapped for SSL")
-            ssl_socket = ssl.wrap_socket(self.socket)
-            if hasattr(self.socket, 'socket'):
-                # We are using a testing socket, so preserve the top
-                # layer of wrapping.
-                self.socket.socket = ssl_socket
-            else:
-                self.socket = ssl_socket
-
+        stats = self.connect_stats
+        start = time.time()
         try:
-            log.debug("Connecting to %s:%s" % self.address)
-            self.socket.connect(self.address)
-            self.set_socket(self.socket, ignore=True)
-            #this event is where you should set your application state
-            self.event("connected", direct=True)
-            return True
+            if self.socket_class is Socket.socket:
+                addresses = resolve_addresses(self.connect_targets())
+                self.socket, self.address = connect_first(
+                        addresses, self.connect_delay,
+                        self.connect_timeout, stats)
+            else:
+                # Testing sockets connect to a single address.
+                self.socket = self.socket_class(Socket.AF_INET,
+                                                Socket.SOCK_STREAM)
+                self.socket.settimeout(None)
+                log.debug("Connecting to %s:%s" % self.address)
+                self.socket.connect(self.address)
+
+            if self.use_ssl and self.ssl_support:
+                log.debug("Socket Wrapped for SSL")
+                self._wrap_tls()
         except Socket.error as serr:
+            stats['failures'] += 1
             error_msg = "Could not connect to %s:%s. Socket Error #%s: %s"
             log.error(error_msg % (self.address[0], self.address[1],
                                        serr.errno, serr.strerror))
-            time.sleep(1)
+            time.sleep(self.reconnect_delay)
             return False
 
+        elapsed = time.time() - start
+        stats['connects'] += 1
+        stats['last_time'] = elapsed
+        stats['total_time'] += elapsed
+        log.debug("Connected to %s:%s in %.3f seconds" % (
+                  self.address[0], self.address[1], elapsed))
+        self.set_socket(self.socket, ignore=True)
+        #this event is where you should set your application state
+        self.event("connected", direct=True)
+        return True
+
+    def connect_targets(self):
+        """
+        Return the list of (host, port) tuples to connect to,
+        in order of preference.
+
+        Meant to be overridden, for example to use DNS SRV records.
+        """
+        return [self.address]
+
     def disconnect(self, reconnect=False):
         """
         Terminate processing and close the XML streams.
@@ -316,19 +520,27 @@ class XMLStream(object):
         self.state.transition('connected', 'disconnected', wait=0.0,
                               func=self._disconnect, args=(reconnect,))
 
-    def _disconnect(self, reconnect=False):
-        # Send the end of stream marker.
-        self.send_raw(self.stream_footer)
-        # Wait for confirmation that the stream was
-        # closed in the other direction.
+    def _disconnect(self, reconnect=False, graceful=True):
+        if graceful:
+            # Send the end of stream marker.
+            # Do not wait on a full send queue since the
+            # connection may no longer be writable.
+            self.send_raw(self.stream_footer, policy='drop')
         if not reconnect:
             self.auto_reconnect = False
-        self.stream_end_event.wait(4)
+        if graceful:
+            # Wait for confirmation that the stream was
+            # closed in the other direction.
+            self.stream_end_event.wait(4)
         if not self.auto_reconnect:
             self.stop.set()
+        if self._async is not None:
+            self._async.interrupt()
+        # TLS 1.3 session tickets arrive after the handshake, so
+        # keep the latest session before closing the connection.
+        self.ssl_context.save_session(self.socket, self.address)
         try:
             self.socket.close()
-            self.filesocket.close()
             self.socket.shutdown(Socket.SHUT_RDWR)
         except Socket.error as serr:
             pass
@@ -337,13 +549,20 @@ class XMLStream(object):
             self.event("disconnected", direct=True)
             return True
 
-    def reconnect(self):
+    def reconnect(self, graceful=True):
         """
         Reset the stream's state and reconnect to the server.
+
+        Arguments:
+            graceful -- Flag indicating if the stream should be closed
+                        with an end of stream marker. Pass False when
+                        the connection has already been lost, so that
+                        the server may keep the session for resumption.
+                        Defaults to True.
         """
         log.debug("reconnecting...")
         self.state.transition('connected', 'disconnected', wait=2.0,
-                              func=self._disconnect, args=(True,))
+                              func=self._disconnect, args=(True, graceful))
         log.debug("connecting...")
         return self.state.transition('disconnected', 'connected',
                                      wait=2.0, func=self._connect)
@@ -352,26 +571,13 @@ class XMLStream(object):
         """
         Set the socket to use for the stream.
 
-        The filesocket will be recreated as well.
-
         Arguments:
             socket -- The new socket to use.
             ignore -- don't set the state
         """
         self.socket = socket
-        if socket is not None:
-            # ElementTree.iterparse requires a file.
-            # 0 buffer files have to be binary.
-
-            # Use the correct fileobject type based on the Python
-            # version to work around a broken implementation in
-            # Python 2.x.
-            if sys.version_info < (3, 0):
-                self.filesocket = FileSocket(self.socket)
-            else:
-                self.filesocket = self.socket.makefile('rb', 0)
-            if not ignore:
-                self.state._set_state('connected')
+        if socket is not None and not ignore:
+            self.state._set_state('connected')
 
     def start_tls(self):
         """
@@ -382,23 +588,55 @@ class XMLStream(object):
         """
         if self.ssl_support:
             log.info("Negotiating TLS")
-            log.info("Using SSL version: %s" % str(self.ssl_version))
-            ssl_socket = ssl.wrap_socket(self.socket,
-                                         ssl_version=self.ssl_version,
-                                         do_handshake_on_connect=False)
-            if hasattr(self.socket, 'socket'):
-                # We are using a testing socket, so preserve the top
-                # layer of wrapping.
-                self.socket.socket = ssl_socket
-            else:
-                self.socket = ssl_socket
-            self.socket.do_handshake()
+            # The asyncio runner's socket is non-blocking, so the
+            # runner performs the handshake once the stream restarts.
+            # The stream manager negotiates on a blocking socket.
+            handshake = True
+            if self._async is not None:
+                from sleekxmpp.xmlstream.asyncloop import AsyncRunner
+                handshake = not isinstance(self._async, AsyncRunner)
+            self._wrap_tls(handshake=handshake)
             self.set_socket(self.socket)
             return True
         else:
             log.warning("Tried to enable TLS, but ssl module not found.")
             return False
 
+    def _wrap_tls(self, handshake=True):
+        """
+        Wrap the stream's socket with TLS and perform the handshake,
+        resuming a cached session with the server if possible.
+
+        Arguments:
+            handshake -- If False, the handshake is left for the
+                         asyncio runner to perform. Defaults to True.
+        """
+        if self.ssl_version is not None and \
+           self.ssl_version != self.ssl_context.ssl_version:
+            self.ssl_context = TLSContext(ssl_version=self.ssl_version)
+        if hasattr(self.socket, 'socket'):
+            # We are using a testing socket, so preserve the top
+            # layer of wrapping.
+            self.socket.socket = self.ssl_context.wrap_socket(
+                    self.socket.socket, self.address,
+                    server_hostname=self.tls_server_name())
+        else:
+            self.socket = self.ssl_context.wrap_socket(
+                    self.socket, self.address, handshake,
+                    server_hostname=self.tls_server_name())
+            self._tls_pending = not handshake
+
+    def tls_server_name(self):
+        """
+        Return the name the server's TLS certificate must match when
+        the TLS context verifies certificates, and which is sent to
+        the server using SNI.
+
+        Meant to be overridden, for example to use the XMPP domain
+        instead of the name of the host connected to.
+        """
+        return self.address[0] or None
+
     def start_stream_handler(self, xml):
         """
         Perform any initialization actions, such as handshakes, once the
@@ -425,6 +663,7 @@ class XMLStream(object):
             stanza_class -- The top-level stanza object's class.
         """
         self.__root_stanza.append(stanza_class)
+        self.__root_stanza_map.setdefault(stanza_class.name, stanza_class)
 
     def remove_stanza(self, stanza_class):
         """
@@ -435,7 +674,10 @@ class XMLStream(object):
         stanza objects, but may still be processed using handlers and
         matchers.
         """
-        del self.__root_stanza[stanza_class]
+        self.__root_stanza.remove(stanza_class)
+        self.__root_stanza_map = {}
+        for stanza_class in self.__root_stanza:
+            self.__root_stanza_map.setdefault(stanza_class.name, stanza_class)
 
     def add_handler(self, mask, pointer, name=None, disposable=False,
                     threaded=False, filter=False, instream=False):
@@ -476,6 +718,7 @@ class XMLStream(object):
         """
         if handler.stream is None:
             self.__handlers.append(handler)
+            self.__handler_index.add(handler)
             handler.stream = self
 
     def remove_handler(self, name):
@@ -489,28 +732,163 @@ class XMLStream(object):
         for handler in self.__handlers:
             if handler.name == name:
                 self.__handlers.pop(idx)
+                self.__handler_index.remove(handler)
                 return True
             idx += 1
         return False
 
-    def add_event_handler(self, name, pointer,
-                          threaded=False, disposable=False):
+    def register_response(self, sid, handler, timeout=None,
+                          timeout_callback=None):
+        """
+        Add a handler for the response to a request stanza, such as
+        an <iq> query, that was sent with the given ID.
+
+        Response handlers are found by ID, without checking every
+        registered handler, before normal stream handlers are matched.
+        A response handler is removed once a stanza with its ID is
+        received, or once the timeout expires.
+
+        If a limit was set using set_max_pending, this call will block
+        until fewer than that many requests are awaiting a response.
+        Event runners expire pending requests and so can not wait for
+        them; when called while running an event handler,
+        PendingLimitReached is raised instead.
+
+        Arguments:
+            sid              -- The ID of the request stanza.
+            handler          -- The handler to execute when the response
+                                is received, such as a Waiter.
+            timeout          -- Optional time in seconds after which the
+                                handler will be removed.
+            timeout_callback -- Optional function to execute, without
+                                arguments, if the timeout expires before
+                                a response is received.
+        """
+        handler.stream = self
+        handler._response_id = sid
+        slots = self.__response_slots
+        in_runner = getattr(self.__runner_state, 'running', False)
+        if slots is not None:
+            if in_runner:
+                if not slots.acquire(False):
+                    raise PendingLimitReached()
+            else:
+                slots.acquire()
+        with self.__responses_lock:
+            previous = self.__responses.get(sid, None)
+            self.__responses[sid] = (handler, slots)
+            if in_runner:
+                self.__runner_responses.add(sid)
+            else:
+                self.__runner_responses.discard(sid)
+        if previous is not None and previous[1] is not None:
+            previous[1].release()
+        if timeout is not None:
+            self.schedule('Response timeout %s' % sid, timeout,
+                          self._expire_response,
+                          args=(sid, handler, timeout_callback))
+
+    def remove_response(self, sid, handler=None):
+        """
+        Remove the handler waiting for a response with the given ID.
+
+        Returns True if a handler was removed.
+
+        Arguments:
+            sid     -- The ID of the request stanza.
+            handler -- Optionally, only remove this handler.
+        """
+        with self.__responses_lock:
+            current = self.__responses.get(sid, None)
+            if current is None:
+                return False
+            if handler is not None and current[0] is not handler:
+                return False
+            del self.__responses[sid]
+            self.__runner_responses.discard(sid)
+        if current[1] is not None:
+            current[1].release()
+        self.scheduler.cancel('Response timeout %s' % sid)
+        return True
+
+    def set_max_pending(self, size=None):
+        """
+        Limit the number of requests that may await a response at
+        once. Registering a response handler beyond the limit blocks
+        until an earlier response is received or times out, or raises
+        PendingLimitReached from within an event handler.
+
+        Requests already awaiting a response are not counted against
+        a new limit.
+
+        Arguments:
+            size -- The maximum number of pending requests, or None
+                    to remove the limit.
+        """
+        self.max_pending = size
+        if size:
+            self.__response_slots = threading.BoundedSemaphore(size)
+        else:
+            self.__response_slots = None
+
+    def _pop_response(self, sid):
+        """
+        Remove and return the handler waiting for a response with
+        the given ID, or None if there is no such handler.
+
+        Arguments:
+            sid -- The ID of the received stanza.
+        """
+        with self.__responses_lock:
+            entry = self.__responses.pop(sid, None)
+            self.__runner_responses.discard(sid)
+        if entry is None:
+            return None
+        if entry[1] is not None:
+            entry[1].release()
+        self.scheduler.cancel('Response timeout %s' % sid)
+        return entry[0]
+
+    def _expire_response(self, sid, handler, timeout_callback=None):
+        """
+        Remove a response handler whose timeout has expired, and
+        execute its timeout callback if it was still waiting.
+
+        Arguments:
+            sid              -- The ID of the request stanza.
+            handler          -- The expired response handler.
+            timeout_callback -- Optional function to execute if the
+                                handler was removed.
+        """
+        if self.remove_response(sid, handler) and timeout_callback:
+            timeout_callback()
+
+    def pending_count(self):
+        """Return the number of requests awaiting a response."""
+        return len(self.__responses)
+
+    def add_event_handler(self, name, pointer, threaded=False,
+                          disposable=False, concurrency=None):
         """
         Add a custom event handler that will be executed whenever
         its event is manually triggered.
 
         Arguments:
-            name       -- The name of the event that will trigger
-                          this handler.
-            pointer    -- The function to execute.
-            threaded   -- If set to True, the handler will execute
-                          in its own thread. Defaults to False.
-            disposable -- If set to True, the handler will be
-                          discarded after one use. Defaults to False.
+            name        -- The name of the event that will trigger
+                           this handler.
+            pointer     -- The function to execute.
+            threaded    -- If set to True, the handler will execute
+                           in a thread from handler_pool.
+                           Defaults to False.
+            disposable  -- If set to True, the handler will be
+                           discarded after one use. Defaults to False.
+            concurrency -- Optional limit on the number of threads that
+                           may execute a threaded handler at once.
         """
         if not name in self.__event_handlers:
             self.__event_handlers[name] = []
-        self.__event_handlers[name].append((pointer, threaded, disposable))
+        self.__event_handlers[name].append((pointer, threaded,
+                                            disposable, concurrency))
 
     def del_event_handler(self, name, pointer):
         """
@@ -557,14 +935,15 @@ class XMLStream(object):
         for handler in self.__event_handlers.get(name, []):
             if direct:
                 try:
-                    handler[0](copy.copy(data))
+                    handler[0](self._copy_event_data(data))
                 except Exception as e:
                     error_msg = 'Error processing event handler: %s'
                     log.exception(error_msg % str(handler[0]))
                     if hasattr(data, 'exception'):
                         data.exception(e)
             else:
-                self.event_queue.put(('event', handler, copy.copy(data)))
+                self._event_queue_for(data).put(
+                        ('event', handler, self._copy_event_data(data)))
 
             if handler[2]:
                 # If the handler is disposable, we will go ahead and
@@ -577,11 +956,30 @@ class XMLStream(object):
                     except:
                         pass
 
+    def _copy_event_data(self, data):
+        """
+        Return a copy of event data for a single event handler.
+
+        When copy_on_write is enabled, stanza objects are given to
+        each handler as views sharing the same XML.
+
+        Arguments:
+            data -- The data passed to the event.
+        """
+        if self.copy_on_write and isinstance(data, ElementBase) and \
+           data.parent is None:
+            return data._share()
+        return copy.copy(data)
+
     def schedule(self, name, seconds, callback, args=None,
                  kwargs=None, repeat=False):
         """
         Schedule a callback function to execute after a given delay.
 
+        Scheduling a callback using the name of a pending one replaces
+        it. Pending callbacks may be cancelled or rescheduled by name
+        using self.scheduler.cancel and self.scheduler.reschedule.
+
         Arguments:
             name     -- A unique name for the scheduled callback.
             seconds  -- The time in seconds to wait before executing.
@@ -595,6 +993,39 @@ class XMLStream(object):
         self.scheduler.add(name, seconds, callback, args, kwargs,
                            repeat, qpointer=self.event_queue)
 
+    def add_filter(self, mode, handler):
+        """
+        Add a filter for data received or sent on the stream.
+
+        Filters for received data ('in') are given each received XML
+        object, after incoming_filter, before it is matched against
+        stream handlers. Filters for sent data ('out') are given each
+        queued string as it is written to the socket, in the order the
+        data is sent. A filter returns the data to keep processing,
+        possibly modified, or None to discard it.
+
+        Filters are executed by the reader and sender, and should
+        not block.
+
+        Arguments:
+            mode    -- Either 'in' or 'out'.
+            handler -- The filter function.
+        """
+        # The list is replaced instead of modified so that
+        # data may be filtered while filters are being changed.
+        self.__filters[mode] = self.__filters[mode] + [handler]
+
+    def del_filter(self, mode, handler):
+        """
+        Remove a filter for received or sent data.
+
+        Arguments:
+            mode    -- Either 'in' or 'out'.
+            handler -- The filter function.
+        """
+        self.__filters[mode] = [f for f in self.__filters[mode] \
+                                if f != handler]
+
     def incoming_filter(self, xml):
         """
         Filter incoming XML objects before they are processed.
@@ -606,12 +1037,15 @@ class XMLStream(object):
         """
         return xml
 
-    def send(self, data, mask=None, timeout=RESPONSE_TIMEOUT):
+    def send(self, data, mask=None, timeout=RESPONSE_TIMEOUT, policy=None):
         """
         A wrapper for send_raw for sending stanza objects.
 
         May optionally block until an expected response is received.
 
+        Returns False if the stanza was dropped because the send
+        queue is full.
+
         Arguments:
             data    -- The stanza object to send on the stream.
             mask    -- Deprecated. An XML snippet matching the structure
@@ -620,6 +1054,7 @@ class XMLStream(object):
                        or a timeout occurs.
             timeout -- Time in seconds to wait for a response before
                        continuing. Defaults to RESPONSE_TIMEOUT.
+            policy  -- Optionally override send_policy for this stanza.
         """
         if hasattr(mask, 'xml'):
             mask = mask.xml
@@ -629,20 +1064,66 @@ class XMLStream(object):
             wait_for = Waiter("SendWait_%s" % self.new_id(),
                               MatchXMLMask(mask))
             self.register_handler(wait_for)
-        self.send_raw(data)
+        sent = self.send_raw(data, policy)
         if mask is not None:
             return wait_for.wait(timeout)
+        return sent
 
-    def send_raw(self, data):
+    def send_raw(self, data, policy=None):
         """
         Send raw data across the stream.
 
+        If the send queue is full, the send policy decides whether to
+        wait for room, raise SendQueueFull, or drop the data.
+
+        When the stream is run by an asyncio event loop or a stream
+        manager, the thread performing the stream's I/O is the one
+        that empties the send queue, so it never waits for room.
+        Data it sends with the 'block' policy, such as stream headers
+        and negotiation responses, is queued beyond the limits.
+
+        Returns True if the data was queued, or False if it was dropped.
+
         Arguments:
-            data -- Any string value.
+            data   -- Any string value.
+            policy -- Optionally override send_policy: one of
+                      'block', 'raise', or 'drop'.
         """
-        self.send_queue.put(data)
+        if policy is None:
+            policy = self.send_policy
+        try:
+            if policy == 'block' and self._async is not None and \
+               self._async.in_io_thread():
+                self.send_queue.put(data, False, force=True)
+            elif policy == 'block':
+                self.send_queue.put(data, True, self.send_timeout)
+            else:
+                self.send_queue.put(data, False)
+        except queue.Full:
+            if policy == 'raise':
+                raise SendQueueFull()
+            log.warning("Send queue full, dropping data: %s" % data)
+            return False
         return True
 
+    def _send_queue_high(self):
+        """
+        Trigger the send_queue_high event once the send queue fills
+        past its high watermark. Called with the queue's lock held.
+        """
+        self.event('send_queue_high', {'items': len(self.send_queue.queue),
+                                       'bytes': self.send_queue.bytes})
+
+    def _send_queue_drained(self):
+        """
+        Trigger the send_queue_drained event once the send queue
+        empties below its low watermark. Called with the queue's
+        lock held.
+        """
+        self.event('send_queue_drained',
+                   {'items': len(self.send_queue.queue),
+                    'bytes': self.send_queue.bytes})
+
     def send_xml(self, data, mask=None, timeout=RESPONSE_TIMEOUT):
         """
         Send an XML object on the stream, and optionally wait
@@ -659,12 +1140,25 @@ class XMLStream(object):
         """
         return self.send(tostring(data), mask, timeout)
 
-    def process(self, threaded=True):
+    def process(self, threaded=True, loop=None, executor=None, manager=None):
         """
         Initialize the XML streams and begin processing events.
 
         The number of threads used for processing stream events is determined
-        by HANDLER_THREADS.
+        by handler_threads. Unless ordered_dispatch is set, events from a
+        single sender may be processed out of order if there is more than
+        one such thread.
+
+        If an asyncio event loop is given, no threads are started. Instead,
+        reading, sending, and scheduling are done by coroutines on that
+        loop, and handlers are executed in order using the executor. The
+        call returns immediately; the loop must be run by the caller.
+        See sleekxmpp.xmlstream.asyncloop.AsyncRunner.
+
+        If a stream manager is given, no threads are started either. The
+        stream is instead processed by the manager's selector thread and
+        worker pool, which are shared with other streams.
+        See sleekxmpp.xmlstream.manager.StreamManager.
 
         Arguments:
             threaded -- If threaded=True then event dispatcher will run
@@ -674,16 +1168,45 @@ class XMLStream(object):
 
                         Event handlers and the send queue will be threaded
                         regardless of this parameter's value.
-        """
+            loop     -- Optional asyncio event loop to process the
+                        stream with instead of using threads.
+            executor -- Optional concurrent.futures executor for running
+                        handlers when using an event loop. Defaults to
+                        the loop's default executor.
+            manager  -- Optional StreamManager to process the stream
+                        with instead of using threads.
+        """
+        if manager is not None:
+            manager.add(self)
+            return
+
+        if loop is not None:
+            # Loaded here since asyncio is not available in all
+            # supported versions of Python.
+            from sleekxmpp.xmlstream.asyncloop import AsyncRunner
+            self._async = AsyncRunner(self, loop, executor)
+            self._async.start()
+            return
+
         self.scheduler.process(threaded=True)
 
-        def start_thread(name, target):
-            self.__thread[name] = threading.Thread(name=name, target=target)
+        def start_thread(name, target, args=()):
+            self.__thread[name] = threading.Thread(name=name, target=target,
+                                                   args=args)
             self.__thread[name].start()
 
-        for t in range(0, HANDLER_THREADS):
+        if self.ordered_dispatch:
+            self.event_shards = [self.event_queue] + \
+                                [NotifyQueue() for t in \
+                                 range(1, self.handler_threads)]
+        else:
+            self.event_shards = [self.event_queue]
+
+        for t in range(0, self.handler_threads):
             log.debug("Starting HANDLER THREAD")
-            start_thread('stream_event_handler_%s' % t, self._event_runner)
+            equeue = self.event_shards[t % len(self.event_shards)]
+            start_thread('stream_event_handler_%s' % t, self._event_runner,
+                         args=(equeue,))
 
         start_thread('send_thread', self._send_thread)
 
@@ -731,49 +1254,198 @@ class XMLStream(object):
                 if not self.stop.isSet():
                     log.exception('Connection error.')
             if not self.stop.isSet() and self.auto_reconnect:
-                self.reconnect()
+                # Only close the stream gracefully if the server
+                # closed it; otherwise the connection is gone.
+                self.reconnect(graceful=self.stream_end_event.isSet())
             else:
                 self.disconnect()
                 self.event_queue.put(('quit', None, None))
-        self.scheduler.run = False
+        self.scheduler.quit()
 
     def __read_xml(self):
         """
         Parse the incoming XML stream, raising stream events for
         each received stanza.
-        """
-        depth = 0
-        root = None
-        for (event, xml) in ET.iterparse(self.filesocket, (b'end', b'start')):
-            if event == b'start':
-                if depth == 0:
-                    # We have received the start of the root element.
-                    root = xml
-                    # Perform any stream initialization actions, such
-                    # as handshakes.
-                    self.stream_end_event.clear()
-                    self.start_stream_handler(root)
-                depth += 1
-            if event == b'end':
-                depth -= 1
-                if depth == 0:
-                    # The stream's root element has closed,
-                    # terminating the stream.
-                    log.debug("End of stream recieved")
-                    self.stream_end_event.set()
+
+        Returns True if the stream was restarted, or False if the
+        stream has ended.
+        """
+        self.parser.reset()
+        if self.recv_buffer is None:
+            self.recv_buffer = RecvBuffer(self.recv_size, self.recv_max_size)
+        while not self.stop.isSet():
+            # The data is only valid until the next read.
+            data = self.recv_buffer.recv(self.socket)
+            if not data:
+                # The connection has been closed.
+                break
+            try:
+                if not self._feed(data):
                     return False
-                elif depth == 1:
-                    # We only raise events for stanzas that are direct
-                    # children of the root element.
-                    try:
-                        self.__spawn_event(xml)
-                    except RestartStream:
-                        return True
-                    if root:
-                        # Keep the root element empty of children to
-                        # save on memory use.
-                        root.clear()
+            except RestartStream:
+                return True
+            if self.event_queue_limit:
+                self._throttle_reader()
         log.debug("Ending read XML loop")
+        return False
+
+    def _throttle_reader(self):
+        """
+        Pause reading while any event queue holds event_queue_limit
+        or more events, resuming once it has drained to half of the
+        limit. Not reading from the socket lets TCP flow control slow
+        down the server.
+
+        Reading continues while an event handler awaits a response,
+        such as from a blocking Iq.send, since the response can only
+        arrive by reading.
+        """
+        limit = self.event_queue_limit
+        stats = self.inbound_stats
+        for equeue in self.event_shards:
+            depth = equeue.qsize()
+            if depth > stats['max_depth']:
+                stats['max_depth'] = depth
+            if depth < limit or self.__runner_responses:
+                continue
+            start = time.time()
+            stats['pauses'] += 1
+            log.debug("Event queue full, pausing reader at %s events" % depth)
+            while not self.stop.isSet() and not self.__runner_responses:
+                if equeue.wait_below(max(1, limit // 2), timeout=0.1):
+                    break
+            stats['paused_time'] += time.time() - start
+
+    def _feed(self, data):
+        """
+        Parse a chunk of data received from the stream, raising stream
+        events for each completed stanza.
+
+        Returns False once the stream's root element has closed, and
+        True otherwise. Any RestartStream exception raised by a stream
+        handler is passed on to the caller; the rest of the data must
+        then be discarded and the parser reset.
+
+        Arguments:
+            data -- The data received from the stream, as a string
+                    or a view of the receive buffer.
+        """
+        for event, xml in self.parser.feed(data):
+            if event == 'stanza':
+                # We only raise events for stanzas that are direct
+                # children of the root element.
+                if self.__pipeline_active:
+                    self._queue_dispatch(('stanza', xml))
+                else:
+                    self._spawn_event(xml)
+            elif event == 'start':
+                # We have received the start of the root element.
+                self._start_stream(xml)
+            else:
+                # The stream's root element has closed,
+                # terminating the stream.
+                self._end_stream()
+                return False
+        return True
+
+    def _start_stream(self, root):
+        """
+        Perform any stream initialization actions, such as handshakes,
+        once the start of the stream's root element has been received.
+
+        Arguments:
+            root -- The stream's root element.
+        """
+        self.stream_end_event.clear()
+        if self.__pipeline_active:
+            # A new stream must be negotiated, which may involve
+            # restarting the stream from a stream handler, so
+            # stanzas are dispatched by the reader until the
+            # session starts again.
+            self.__pipeline_active = False
+            self._sync_dispatch()
+        self.start_stream_handler(root)
+
+    def _start_pipeline(self, data=None):
+        """
+        Begin passing received stanzas to the dispatch thread, if
+        pipeline_receive is set, once the session has started.
+
+        Arguments:
+            data -- Unused data given by the session_start event.
+        """
+        if not self.pipeline_receive or self._async is not None:
+            return
+        thread = self.__thread.get('dispatch', None)
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(name='dispatch',
+                                      target=self._dispatch_thread)
+            self.__thread['dispatch'] = thread
+            thread.start()
+        self.__pipeline_active = True
+
+    def _queue_dispatch(self, item):
+        """
+        Pass an item to the dispatch thread, waiting while the
+        dispatch queue is full.
+
+        Arguments:
+            item -- A tuple of the item type and its data.
+        """
+        while not self.stop.isSet():
+            try:
+                self.__dispatch_queue.put(item, True, 1)
+                return
+            except queue.Full:
+                continue
+
+    def _sync_dispatch(self):
+        """
+        Wait until the dispatch thread has handled every stanza
+        queued so far.
+        """
+        done = threading.Event()
+        self._queue_dispatch(('sync', done))
+        while not self.stop.isSet() and not done.isSet():
+            done.wait(1)
+
+    def _dispatch_thread(self):
+        """
+        Match stanzas parsed by the reader against the stream's
+        handlers when receiving is pipelined.
+        """
+        try:
+            while not self.stop.isSet():
+                try:
+                    kind, data = self.__dispatch_queue.get(True, 1)
+                except queue.Empty:
+                    continue
+                if kind == 'sync':
+                    data.set()
+                    continue
+                try:
+                    self._spawn_event(data)
+                except RestartStream:
+                    log.warning("Stream restart requested while " + \
+                                "dispatching a pipelined stanza.")
+                except:
+                    log.exception('Error dispatching stanza')
+        except KeyboardInterrupt:
+            log.debug("Keyboard Escape Detected in _dispatch_thread")
+            self.disconnect()
+            return
+        except SystemExit:
+            self.disconnect()
+            self.event_queue.put(('quit', None, None))
+            return
+
+    def _end_stream(self):
+        """
+        Record that the stream's root element has been closed,
+        terminating the stream.
+        """
+        log.debug("End of stream recieved")
+        self.stream_end_event.set()
 
     def _build_stanza(self, xml, default_ns=None):
         """
@@ -789,15 +1461,29 @@ class XMLStream(object):
         """
         if default_ns is None:
             default_ns = self.default_ns
-        stanza_type = StanzaBase
-        for stanza_class in self.__root_stanza:
-            if xml.tag == "{%s}%s" % (default_ns, stanza_class.name):
-                stanza_type = stanza_class
-                break
+        stanza_type = self._root_stanza_class(xml, default_ns)
         stanza = stanza_type(self, xml)
         return stanza
 
-    def __spawn_event(self, xml):
+    def _root_stanza_class(self, xml, default_ns):
+        """
+        Return the registered stanza class for a root stanza's XML, or
+        StanzaBase if none applies.
+
+        Arguments:
+            xml        -- The XML object of the root stanza.
+            default_ns -- The stream's default namespace.
+        """
+        tag = xml.tag
+        if tag.startswith('{'):
+            ns, name = tag[1:].split('}', 1)
+        else:
+            ns, name = '', tag
+        if ns != default_ns:
+            return StanzaBase
+        return self.__root_stanza_map.get(name, StanzaBase)
+
+    def _spawn_event(self, xml):
         """
         Analyze incoming XML stanzas and convert them into stanza
         objects if applicable and queue stream events to be processed
@@ -806,32 +1492,40 @@ class XMLStream(object):
         Arguments:
             xml -- The XML stanza to analyze.
         """
-        log.debug("RECV: %s" % tostring(xml,
-                                            xmlns=self.default_ns,
-                                            stream=self))
+        if self.trace.active():
+            self.trace.record('RECV', xml, stream=self)
         # Apply any preprocessing filters.
         xml = self.incoming_filter(xml)
+        for handler in self.__filters['in']:
+            xml = handler(xml)
+            if xml is None:
+                return
 
         # Convert the raw XML object into a stanza object. If no registered
         # stanza type applies, a generic StanzaBase stanza will be used.
-        stanza_type = StanzaBase
-        for stanza_class in self.__root_stanza:
-            if xml.tag == "{%s}%s" % (self.default_ns, stanza_class.name):
-                stanza_type = stanza_class
-                break
+        stanza_type = self._root_stanza_class(xml, self.default_ns)
         stanza = stanza_type(self, xml)
 
+        unhandled = True
+
+        # Responses to our own requests are found directly by ID.
+        sid = xml.attrib.get('id', None)
+        if sid is not None and self.__responses:
+            handler = self._pop_response(sid)
+            if handler is not None:
+                self._deliver(handler, stanza, stanza_type, xml)
+                unhandled = False
+
         # Match the stanza against registered handlers. Handlers marked
         # to run "in stream" will be executed immediately; the rest will
-        # be queued.
-        unhandled = True
-        for handler in self.__handlers:
+        # be queued. Only handlers whose index keys fit the stanza
+        # need to be checked.
+        for handler in self.__handler_index.candidates(xml):
             if handler.match(stanza):
-                stanza_copy = stanza_type(self, copy.deepcopy(xml))
-                handler.prerun(stanza_copy)
-                self.event_queue.put(('stanza', handler, stanza_copy))
+                self._deliver(handler, stanza, stanza_type, xml)
                 try:
                     if handler.check_delete():
+                        self.__handler_index.remove(handler)
                         self.__handlers.pop(self.__handlers.index(handler))
                 except:
                     pass  # not thread safe
@@ -842,6 +1536,53 @@ class XMLStream(object):
         if unhandled:
             stanza.unhandled()
 
+    def _deliver(self, handler, stanza, stanza_type, xml):
+        """
+        Give a handler its own copy of a matched stanza and queue
+        the handler to be executed.
+
+        Arguments:
+            handler     -- The matching stream handler.
+            stanza      -- The received stanza object.
+            stanza_type -- The stanza object's class.
+            xml         -- The received XML object.
+        """
+        if self.copy_on_write and handler.share_payload:
+            # Handlers may share the XML as long as it is
+            # copied before being modified.
+            stanza_copy = stanza._share()
+        else:
+            stanza_copy = stanza_type(self, copy.deepcopy(xml))
+        handler.prerun(stanza_copy)
+        self._event_queue_for(stanza).put(('stanza', handler, stanza_copy))
+
+    def _event_queue_for(self, data):
+        """
+        Return the event queue for events concerning the given data.
+
+        With ordered_dispatch, events for stanzas are spread across
+        event_shards by their dispatch key, so that events with the
+        same key are processed in order while others run in parallel.
+        All other events use event_queue.
+
+        Arguments:
+            data -- The stanza or other data given to the event.
+        """
+        shards = self.event_shards
+        if len(shards) == 1 or not isinstance(data, StanzaBase):
+            return self.event_queue
+        try:
+            if self.dispatch_key is not None:
+                key = self.dispatch_key(data)
+            else:
+                key = data['from'].bare
+        except:
+            log.exception('Error computing dispatch key')
+            return self.event_queue
+        if key is None:
+            return self.event_queue
+        return shards[hash(key) % len(shards)]
+
     def _threaded_event_wrapper(self, func, args):
         """
         Capture exceptions for event handlers that run
@@ -859,59 +1600,38 @@ class XMLStream(object):
             if hasattr(args[0], 'exception'):
                 args[0].exception(e)
 
-    def _event_runner(self):
+    def _event_runner(self, equeue=None):
         """
         Process the event queue and execute handlers.
 
-        The number of event runner threads is controlled by HANDLER_THREADS.
+        The number of event runner threads is controlled by handler_threads.
+        A request to quit received on event_queue is passed on to
+        the other event_shards.
 
-        Stream event handlers will all execute in this thread. Custom event
-        handlers may be spawned in individual threads.
+        Arguments:
+            equeue -- The event queue to process. Defaults to
+                      event_queue.
+
+        Stream event handlers will all execute in this thread. Threaded
+        custom event handlers are passed to handler_pool.
         """
+        if equeue is None:
+            equeue = self.event_queue
         log.debug("Loading event runner")
         try:
             while not self.stop.isSet():
                 try:
-                    event = self.event_queue.get(True, timeout=5)
+                    event = equeue.get(True, timeout=5)
                 except queue.Empty:
                     event = None
                 if event is None:
                     continue
 
-                etype, handler = event[0:2]
-                args = event[2:]
-
-                if etype == 'stanza':
-                    try:
-                        handler.run(args[0])
-                    except Exception as e:
-                        error_msg = 'Error processing stream handler: %s'
-                        log.exception(error_msg % handler.name)
-                        args[0].exception(e)
-                elif etype == 'schedule':
-                    try:
-                        log.debug(args)
-                        handler(*args[0])
-                    except:
-                        log.exception('Error processing scheduled task')
-                elif etype == 'event':
-                    func, threaded, disposable = handler
-                    try:
-                        if threaded:
-                            x = threading.Thread(
-                                    name="Event_%s" % str(func),
-                                    target=self._threaded_event_wrapper,
-                                    args=(func, args))
-                            x.start()
-                        else:
-                            func(*args)
-                    except Exception as e:
-                        error_msg = 'Error processing event handler: %s'
-                        log.exception(error_msg % str(func))
-                        if hasattr(args[0], 'exception'):
-                            args[0].exception(e)
-                elif etype == 'quit':
+                if not self._run_event(event):
                     log.debug("Quitting event runner thread")
+                    if equeue is self.event_queue:
+                        for shard in self.event_shards[1:]:
+                            shard.put(('quit', None, None))
                     return False
         except KeyboardInterrupt:
             log.debug("Keyboard Escape Detected in _event_runner")
@@ -922,6 +1642,134 @@ class XMLStream(object):
             self.event_queue.put(('quit', None, None))
             return
 
+    def _run_event(self, event):
+        """
+        Execute the handler for a single event taken from the event queue.
+
+        Returns False if the event was a request to stop processing.
+
+        Arguments:
+            event -- A tuple of the event type, the handler, and any
+                     arguments for the handler.
+        """
+        self.__runner_state.running = True
+        try:
+            etype, handler = event[0:2]
+            args = event[2:]
+
+            if etype == 'stanza':
+                try:
+                    handler.run(args[0])
+                except Exception as e:
+                    error_msg = 'Error processing stream handler: %s'
+                    log.exception(error_msg % handler.name)
+                    args[0].exception(e)
+            elif etype == 'schedule':
+                try:
+                    log.debug(args)
+                    handler(*args[0])
+                except:
+                    log.exception('Error processing scheduled task')
+            elif etype == 'event':
+                func, threaded, disposable, concurrency = handler
+                try:
+                    if threaded and self._async is not None:
+                        self._async.run_threaded(func, args, concurrency)
+                    elif threaded:
+                        self.handler_pool.submit(self._threaded_event_wrapper,
+                                                 (func, args),
+                                                 key=func, limit=concurrency)
+                    else:
+                        func(*args)
+                except Exception as e:
+                    error_msg = 'Error processing event handler: %s'
+                    log.exception(error_msg % str(func))
+                    if hasattr(args[0], 'exception'):
+                        args[0].exception(e)
+            elif etype == 'quit':
+                return False
+            return True
+        finally:
+            self.__runner_state.running = False
+
+    def _gather_send_batch(self, data):
+        """
+        Collect queued stanzas to send along with the given data,
+        waiting up to send_batch_delay seconds for more to arrive.
+
+        Arguments:
+            data -- The first item taken from the send queue.
+        """
+        batch = [data]
+        self._drain_send_queue(batch)
+        if self.send_batch_delay and len(batch) < self.send_batch_max:
+            end = time.time() + self.send_batch_delay
+            while len(batch) < self.send_batch_max:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.send_queue.get(True, remaining))
+                except queue.Empty:
+                    break
+                self._drain_send_queue(batch)
+        return batch
+
+    def _drain_send_queue(self, batch):
+        """
+        Move items already in the send queue into a batch, without
+        blocking, until the batch holds send_batch_max items.
+
+        Arguments:
+            batch -- The list of items to send.
+        """
+        while len(batch) < self.send_batch_max:
+            try:
+                batch.append(self.send_queue.get(False))
+            except queue.Empty:
+                break
+
+    def _encode_send_batch(self, batch):
+        """
+        Join a batch of queued items into a single buffer to be
+        written to the socket, and update the send statistics.
+
+        Arguments:
+            batch -- The list of items to send.
+        """
+        filters = self.__filters['out']
+        if filters:
+            batch = self._filter_batch(batch, filters)
+        if self.trace.active():
+            for data in batch:
+                self.trace.record('SEND', data)
+        data = ''.join(batch).encode('utf-8')
+        stats = self.send_stats
+        stats['writes'] += 1
+        stats['stanzas'] += len(batch)
+        stats['bytes'] += len(data)
+        if len(batch) > stats['largest_batch']:
+            stats['largest_batch'] = len(batch)
+        return data
+
+    def _filter_batch(self, batch, filters):
+        """
+        Apply the filters for sent data to a batch of queued items.
+
+        Arguments:
+            batch   -- The list of items to send.
+            filters -- The list of filters for sent data.
+        """
+        filtered = []
+        for data in batch:
+            for handler in filters:
+                data = handler(data)
+                if data is None:
+                    break
+            else:
+                filtered.append(data)
+        return filtered
+
     def _send_thread(self):
         """
         Extract stanzas from the send queue and send them on the stream.
@@ -932,11 +1780,11 @@ class XMLStream(object):
                     data = self.send_queue.get(True, 1)
                 except queue.Empty:
                     continue
-                log.debug("SEND: %s" % data)
+                batch = self._gather_send_batch(data)
                 try:
-                    self.socket.send(data.encode('utf-8'))
+                    self.socket.sendall(self._encode_send_batch(batch))
                 except:
-                    log.warning("Failed to send %s" % data)
+                    log.warning("Failed to send %s" % ''.join(batch))
                     self.disconnect(self.auto_reconnect)
         except KeyboardInterrupt:
             log.debug("Keyboard Escape Detected in _send_thread")
@@ -11,7 +11,7 @@ class testoverall(unittest.TestCase):
 		import compileall
 		import re
 		if sys.version_info < (3,0):
-			self.failUnless(compileall.compile_dir('.' + os.sep + 'sleekxmpp', rx=re.compile('/[.]svn'), quiet=True))
+			self.failUnless(compileall.compile_dir('.' + os.sep + 'sleekxmpp', rx=re.compile('/[.]svn|.*asyncloop.*'), quiet=True))
 		else:
 			self.failUnless(compileall.compile_dir('.' + os.sep + 'sleekxmpp', rx=re.compile('/[.]svn|.*26.*'), quiet=True))
 
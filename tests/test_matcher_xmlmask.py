@@ -0,0 +1,66 @@
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.matcher import MatchXMLMask
+import sleekxmpp.xmlstream.matcher.xmlmask as xmlmask
+
+
+class TestMatchXMLMask(SleekTest):
+
+    """
+    Test compiled XML mask matchers.
+    """
+
+    def setUp(self):
+        self.xml = self.parse_xml("""
+          <message xmlns="jabber:client" type="groupchat" to="a@b">
+            <body>Hi!</body>
+            <x xmlns="foo"><item id="1" /></x>
+          </message>
+        """)
+
+    def tearDown(self):
+        xmlmask.IGNORE_NS = False
+
+    def tryMask(self, mask, expected):
+        """Check that a mask matches the test stanza as expected."""
+        matcher = MatchXMLMask(mask)
+        result = matcher.match(self.xml)
+        self.failUnless(result == expected,
+                "Mask %s returned %s" % (mask, result))
+
+    def testMasks(self):
+        """Test matching masks with namespaces."""
+        self.tryMask("<message xmlns='jabber:client' />", True)
+        self.tryMask("<message />", True)
+        self.tryMask("<presence xmlns='jabber:client' />", False)
+        self.tryMask("<message xmlns='jabber:client' type='groupchat'>" + \
+                     "<body /></message>", True)
+        self.tryMask("<message xmlns='jabber:client' type='chat' />", False)
+        self.tryMask("<message xmlns='jabber:client'>" + \
+                     "<body>Hi!</body></message>", True)
+        self.tryMask("<message xmlns='jabber:client'>" + \
+                     "<body>Bye!</body></message>", False)
+        self.tryMask("<message xmlns='jabber:client'>" + \
+                     "<x xmlns='foo'><item id='1' /></x></message>", True)
+        self.tryMask("<message xmlns='jabber:client'>" + \
+                     "<x xmlns='foo'><item id='2' /></x></message>", False)
+        self.tryMask("<message xmlns='jabber:client'><subject /></message>",
+                     False)
+
+    def testIgnoreNamespaces(self):
+        """Test matching masks without namespaces."""
+        xmlmask.IGNORE_NS = True
+        self.tryMask("<message xmlns='other'><x><item /></x></message>", True)
+        self.tryMask("<message xmlns='other'><y /></message>", False)
+
+    def testShared(self):
+        """Test that identical masks share a compiled function."""
+        mask = "<message xmlns='jabber:client'><body /></message>"
+        first = MatchXMLMask(mask)
+        second = MatchXMLMask(mask)
+        first.match(self.xml)
+        second.match(self.xml)
+        self.failUnless(first._compiled is second._compiled,
+                "Identical masks were compiled separately.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestMatchXMLMask)
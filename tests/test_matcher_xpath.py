@@ -0,0 +1,71 @@
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.matcher import MatchXPath
+from sleekxmpp.xmlstream.matcher.xpath import compile_xpath
+import sleekxmpp.xmlstream.matcher.xpath as xpath
+
+
+class TestMatchXPath(SleekTest):
+
+    """
+    Test compiled XPath matchers.
+    """
+
+    def setUp(self):
+        self.xml = self.parse_xml("""
+          <iq xmlns="jabber:client" type="get" id="1">
+            <query xmlns="test">
+              <item name="a" />
+              <item name="b"><x /></item>
+            </query>
+          </iq>
+        """)
+
+    def tearDown(self):
+        xpath.IGNORE_NS = False
+
+    def tryMatch(self, criteria, expected):
+        """Check a matcher's result against ElementTree's find method."""
+        wrapper = ET.Element('x')
+        wrapper.append(self.xml)
+        found = wrapper.find(criteria) is not None
+        result = MatchXPath(criteria).match(self.xml)
+        self.failUnless(result == expected == found,
+                "Matching %s returned %s, find returned %s" % (
+                    criteria, result, found))
+
+    def testCompile(self):
+        """Test compiling XPath expressions."""
+        steps = compile_xpath("{jabber:client}iq[@type='get']/{test}query")
+        expected = (('{jabber:client}iq', 'iq', (('type', 'get'),)),
+                    ('{test}query', 'query', ()))
+        self.failUnless(steps == expected, "Unexpected steps: %s" % (steps,))
+        self.failUnless(compile_xpath('{jabber:client}iq/*') is None,
+                "Wildcard expression was compiled.")
+
+    def testMatchTags(self):
+        """Test matching namespaced paths and attribute predicates."""
+        self.tryMatch('{jabber:client}iq', True)
+        self.tryMatch('{jabber:client}iq/{test}query', True)
+        self.tryMatch("{jabber:client}iq[@type='get']/{test}query", True)
+        self.tryMatch("{jabber:client}iq[@type='set']", False)
+        self.tryMatch('{jabber:client}iq/{test}query/' + \
+                      '{test}item[@name="b"]/{test}x', True)
+        self.tryMatch('{jabber:client}iq/{test}query/{test}item[@type]', False)
+        self.tryMatch('{jabber:client}message', False)
+        self.tryMatch('iq', False)
+
+    def testFallback(self):
+        """Test expressions that can not be compiled."""
+        self.tryMatch('{jabber:client}iq/*', True)
+        self.tryMatch('{jabber:client}iq//{test}x', True)
+
+    def testIgnoreNamespaces(self):
+        """Test matching while ignoring namespaces."""
+        xpath.IGNORE_NS = True
+        self.failUnless(MatchXPath('{foo}iq/{bar}query/item').match(self.xml),
+                "Path was not matched without namespaces.")
+        self.failIf(MatchXPath('iq/item').match(self.xml),
+                "Path matched without namespaces.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestMatchXPath)
@@ -0,0 +1,64 @@
+import socket
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.parser import XMLStreamParser
+from sleekxmpp.xmlstream.recvbuffer import RecvBuffer
+
+
+class TestRecvBuffer(SleekTest):
+
+    """
+    Test reading socket data into a reusable receive buffer.
+    """
+
+    def setUp(self):
+        self.client, self.server = socket.socketpair()
+        self.client.settimeout(5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def testGrowth(self):
+        """Test that the buffer grows while reads fill it."""
+        buf = RecvBuffer(16, 64)
+        self.server.sendall(b'x' * 200)
+        sizes = []
+        received = 0
+        while received < 200:
+            sizes.append(buf.size)
+            received += len(buf.recv(self.client))
+        self.failUnless(sizes[:3] == [16, 32, 64],
+                "Buffer did not grow as expected: %s" % sizes)
+        self.failUnless(buf.size == 64,
+                "Buffer grew past its maximum size: %s" % buf.size)
+        self.failUnless(buf.stats['bytes'] == 200,
+                "Unexpected byte count: %s" % buf.stats)
+
+    def testParse(self):
+        """Test feeding buffer views, split mid-character, to the parser."""
+        buf = RecvBuffer(8, 8)
+        parser = XMLStreamParser()
+        data = u'<stream><message><body>\xe9t\xe9</body></message>'
+        self.server.sendall(data.encode('utf-8'))
+        self.server.close()
+        events = []
+        while True:
+            chunk = buf.recv(self.client)
+            if not chunk:
+                break
+            events.extend(parser.feed(chunk))
+        self.failUnless([e[0] for e in events] == ['start', 'stanza'],
+                "Unexpected stream events: %s" % events)
+        self.failUnless(events[1][1].find('body').text == u'\xe9t\xe9',
+                "Text was not decoded correctly.")
+
+    def testClosed(self):
+        """Test that reading a closed connection returns no data."""
+        buf = RecvBuffer()
+        self.server.close()
+        self.failIf(buf.recv(self.client),
+                "Data returned for a closed connection.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestRecvBuffer)
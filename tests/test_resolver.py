@@ -0,0 +1,137 @@
+import socket
+import time
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.resolver import SRVCache, order_srv
+from sleekxmpp.xmlstream.resolver import connect_first, resolve_addresses
+
+
+class TestResolver(SleekTest):
+
+    """
+    Test caching SRV records and racing connection attempts.
+    """
+
+    def setUp(self):
+        self.lookups = []
+        self.records = [(10, 0, 'localhost', 5222)]
+        self.ttl = 60
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def lookup(self, name):
+        self.lookups.append(name)
+        return (self.records, self.ttl)
+
+    def closedPort(self):
+        """Return a local port that refuses connections."""
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    def testCacheTTL(self):
+        """Test that SRV records are reused until their TTL expires."""
+        cache = SRVCache(self.lookup, min_ttl=0)
+        self.ttl = 0.1
+        name = '_xmpp-client._tcp.example.com'
+        first = cache.get(name)
+        second = cache.get(name)
+        self.failUnless(first == second == self.records,
+                "Unexpected records: %s %s" % (first, second))
+        self.failUnless(len(self.lookups) == 1,
+                "Records were not cached: %s" % self.lookups)
+        time.sleep(0.2)
+        cache.get(name)
+        self.failUnless(len(self.lookups) == 2,
+                "Expired records were not looked up again.")
+        self.failUnless(cache.stats == {'hits': 1, 'misses': 2},
+                "Unexpected counters: %s" % cache.stats)
+
+    def testCacheFailure(self):
+        """Test keeping expired records when a lookup fails."""
+        cache = SRVCache(self.lookup, min_ttl=0)
+        self.ttl = 0
+        name = '_xmpp-client._tcp.example.com'
+        cache.get(name)
+        self.records = None
+        records = cache.get(name)
+        self.failUnless(records == [(10, 0, 'localhost', 5222)],
+                "Expired records were not kept: %s" % records)
+
+    def testOrder(self):
+        """Test ordering SRV records by priority."""
+        records = [(20, 10, 'c.example.com', 5222),
+                   (10, 0, 'b.example.com', 5222),
+                   (10, 50, 'a.example.com', 5222),
+                   (30, 0, '.', 0)]
+        ordered = [record[2] for record in order_srv(records)]
+        self.failUnless(ordered[2] == 'c.example.com',
+                "Records were not ordered by priority: %s" % ordered)
+        self.failUnless(set(ordered[:2]) == set(['a.example.com',
+                                                 'b.example.com']),
+                "Unexpected records: %s" % ordered)
+
+    def testRefused(self):
+        """Test moving on to the next target when one refuses."""
+        stats = {}
+        closed = ('127.0.0.1', self.closedPort())
+        target = ('127.0.0.1', self.port)
+        start = time.time()
+        sock, connected = connect_first(resolve_addresses([closed, target]),
+                                        delay=5, stats=stats)
+        sock.close()
+        self.failUnless(connected == target,
+                "Connected to the wrong target: %s" % (connected,))
+        self.failUnless(time.time() - start < 2,
+                "Refused connection did not start the next attempt.")
+        self.failUnless(stats['attempts'] == 2,
+                "Unexpected counters: %s" % stats)
+
+    def testStaggered(self):
+        """Test starting the next attempt while one is still pending."""
+        slow = ('192.0.2.1', 5222)
+        target = ('127.0.0.1', self.port)
+        addresses = [(slow, socket.AF_INET, slow),
+                     (target, socket.AF_INET, target)]
+        start = time.time()
+        sock, connected = connect_first(addresses, delay=0.1, timeout=5)
+        sock.close()
+        self.failUnless(connected == target,
+                "Connected to the wrong target: %s" % (connected,))
+        self.failUnless(time.time() - start < 2,
+                "Next attempt was not started in time.")
+
+    def testFailure(self):
+        """Test raising an error when no target can be reached."""
+        closed = ('127.0.0.1', self.closedPort())
+        self.failUnlessRaises(socket.error, connect_first,
+                              resolve_addresses([closed]))
+
+    def testClientSRV(self):
+        """Test that a client connects to its domain's SRV targets."""
+        self.records = [(10, 0, '127.0.0.1', self.closedPort()),
+                        (20, 0, '127.0.0.1', self.port)]
+        self.xmpp = sleekxmpp.ClientXMPP('tester@localhost', 'test')
+        self.xmpp.srv_support = True
+        self.xmpp.srv_cache = SRVCache(self.lookup)
+        self.xmpp.reconnect_delay = 0
+        self.failUnless(self.xmpp.connect(),
+                "Could not connect to an SRV target.")
+        self.xmpp.socket.close()
+        self.failUnless(self.lookups == ['_xmpp-client._tcp.localhost'],
+                "Unexpected SRV lookups: %s" % self.lookups)
+        self.failUnless(self.xmpp.address == ('127.0.0.1', self.port),
+                "Connected to the wrong target: %s" % (self.xmpp.address,))
+        stats = self.xmpp.connect_stats
+        self.failUnless(stats['connects'] == 1 and stats['attempts'] == 2,
+                "Unexpected counters: %s" % stats)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestResolver)
@@ -0,0 +1,76 @@
+import time
+from sleekxmpp.test import *
+from sleekxmpp.roster import RosterItem, ResourcePresence
+
+
+class TestRosterItem(SleekTest):
+
+    """
+    Test the compact roster entries and their dictionary interface.
+    """
+
+    def tearDown(self):
+        if hasattr(self, 'xmpp'):
+            self.stream_close()
+
+    def testDictAccess(self):
+        """Test reading and changing an item as a dictionary."""
+        item = RosterItem()
+        item.update({'name': 'User', 'subscription': 'both'},
+                    groups=['Friends'])
+        item['in_roster'] = True
+        self.failUnless(item['name'] == 'User' and item.name == 'User',
+                "Name was not set: %s" % item)
+        self.failUnless(item.get('ask', 'none') == 'none',
+                "Unknown key did not return the default.")
+        self.failUnless(item == {'name': 'User',
+                                 'subscription': 'both',
+                                 'groups': ['Friends'],
+                                 'presence': {},
+                                 'in_roster': True},
+                "Unexpected item values: %s" % item)
+        self.failUnlessRaises(KeyError, item.__setitem__, 'ask', 'subscribe')
+
+    def testInterning(self):
+        """Test that repeated values share a single string."""
+        first = RosterItem(subscription=''.join(['bo', 'th']))
+        second = RosterItem(subscription=''.join(['b', 'oth']))
+        self.failUnless(first.subscription is second.subscription,
+                "Subscription states were not interned.")
+        self.failIf(hasattr(first, '__dict__'),
+                "Roster items should not have a __dict__.")
+
+    def testPresence(self):
+        """Test tracking the presence of a JID's resources."""
+        self.stream_start()
+        self.recv("""
+          <presence from="user@localhost/a">
+            <show>away</show>
+            <status>Out</status>
+            <priority>5</priority>
+          </presence>
+        """)
+        time.sleep(0.1)
+        self.failUnless(self.xmpp.roster == {
+                    'user@localhost': {'name': '',
+                                       'subscription': 'none',
+                                       'groups': [],
+                                       'in_roster': False,
+                                       'presence': {'a': {'show': 'away',
+                                                          'status': 'Out',
+                                                          'priority': 5}}}},
+                "Unexpected roster values: %s" % self.xmpp.roster)
+        presence = self.xmpp.roster['user@localhost']['presence']['a']
+        self.failUnless(isinstance(presence, ResourcePresence),
+                "Presence was not stored compactly: %r" % presence)
+
+        self.recv("""
+          <presence type="unavailable" from="user@localhost/a" />
+        """)
+        time.sleep(0.1)
+        self.failUnless(self.xmpp.roster == {},
+                "JID was not removed after going offline: %s" % \
+                    self.xmpp.roster)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestRosterItem)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+from sleekxmpp.test import *
+from sleekxmpp.roster import SQLiteRosterStore
+
+
+class TestRosterStore(SleekTest):
+
+    """
+    Test keeping versioned rosters in an SQLite database.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'roster.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testPersist(self):
+        """Test loading a saved roster after reopening the database."""
+        items = {'user@localhost': {'name': 'User',
+                                    'subscription': 'both',
+                                    'groups': ['Friends', 'Examples']},
+                 'other@localhost': {'name': '',
+                                     'subscription': 'to',
+                                     'groups': []}}
+        store = SQLiteRosterStore(self.path)
+        store.save('tester@localhost', 'v1', items)
+        store.close()
+
+        store = SQLiteRosterStore(self.path)
+        loaded = store.load('tester@localhost')
+        store.close()
+        self.failUnless(loaded == ('v1', items),
+                "Unexpected stored roster: %s" % (loaded,))
+
+    def testUpdate(self):
+        """Test applying roster pushes to a stored roster."""
+        store = SQLiteRosterStore(self.path)
+        store.save('tester@localhost', 'v1',
+                   {'user@localhost': {'name': 'User',
+                                       'subscription': 'both',
+                                       'groups': []}})
+        store.update('tester@localhost', 'v2',
+                     {'user@localhost': {'subscription': 'remove'},
+                      'new@localhost': {'name': 'New',
+                                        'subscription': 'none',
+                                        'groups': ['Work']}})
+        loaded = store.load('tester@localhost')
+        self.failUnless(loaded == ('v2', {'new@localhost': {
+                                             'name': 'New',
+                                             'subscription': 'none',
+                                             'groups': ['Work']}}),
+                "Unexpected stored roster: %s" % (loaded,))
+        self.failUnless(store.load('other@localhost') == (None, {}),
+                "Rosters of other accounts were mixed up.")
+        store.close()
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestRosterStore)
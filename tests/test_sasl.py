@@ -0,0 +1,121 @@
+import base64
+
+from sleekxmpp.test import *
+from sleekxmpp.sasl import SASLError, SCRAMKeyCache
+from sleekxmpp.sasl import SCRAM_SHA_1, SCRAM_SHA_256
+
+
+class TestSASL(SleekTest):
+
+    """
+    Test SASL mechanisms, using the examples from RFC 5802 and RFC 7677.
+    """
+
+    # SCRAM-SHA-1 example from RFC 5802, section 5.
+    SHA1 = {'cnonce': 'fyko+d2lbbFgONRv9qkxdawL',
+            'server_first': 'r=fyko+d2lbbFgONRv9qkxdawL3rfcNHYJY1ZVvWVs7j,' + \
+                            's=QSXCR+Q6sek8bf92,i=4096',
+            'client_final': 'c=biws,r=fyko+d2lbbFgONRv9qkxdawL3rfcNHYJY1' + \
+                            'ZVvWVs7j,p=v0X8v3Bz2T0CJGbJQyF0X+HI4Ts=',
+            'server_final': 'v=rmF9pqV8S7suAoZWja4dJRkFsKQ='}
+
+    # SCRAM-SHA-256 example from RFC 7677, section 3.
+    SHA256 = {'cnonce': 'rOprNGfwEbeRWgbNEkqO',
+              'server_first': 'r=rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTCAfuxFIlj' + \
+                              ')hNlF$k0,s=W22ZaJ0SNY7soEsUEjb6gQ==,i=4096',
+              'client_final': 'c=biws,r=rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTC' + \
+                              'AfuxFIlj)hNlF$k0,p=dHzbZapWIk4jUhN+Ute9ytag9' + \
+                              'zjfMHgsqmmiz7AndVQ=',
+              'server_final': 'v=6rriTRBi23WpRR/wtup+mMhUZUn/dB5nLTJRsjl95G4='}
+
+    def tearDown(self):
+        if hasattr(self, 'xmpp'):
+            self.stream_close()
+
+    def exchange(self, mechanism, vector, cache=None):
+        """Run the client side of a SCRAM example exchange."""
+        scram = mechanism('user', 'pencil')
+        scram.cnonce = vector['cnonce']
+        if cache is not None:
+            scram.cache = cache
+        first = scram.start()
+        self.failUnless(first == ('n,,n=user,r=%s' % vector['cnonce']).encode(),
+                "Unexpected initial response: %s" % first)
+        final = scram.challenge(vector['server_first'].encode())
+        self.failUnless(final == vector['client_final'].encode(),
+                "Unexpected final response: %s" % final)
+        return scram
+
+    def testSCRAMSHA1(self):
+        """Test the SCRAM-SHA-1 example from RFC 5802."""
+        scram = self.exchange(SCRAM_SHA_1, self.SHA1)
+        scram.success(self.SHA1['server_final'].encode())
+
+    def testSCRAMSHA256(self):
+        """Test the SCRAM-SHA-256 example from RFC 7677."""
+        scram = self.exchange(SCRAM_SHA_256, self.SHA256)
+        scram.success(self.SHA256['server_final'].encode())
+
+    def testKeyCache(self):
+        """Test that derived keys are reused for the same salt."""
+        cache = SCRAMKeyCache()
+        self.exchange(SCRAM_SHA_1, self.SHA1, cache)
+        self.exchange(SCRAM_SHA_1, self.SHA1, cache)
+        self.failUnless(cache.stats == {'hits': 1, 'misses': 1},
+                "Unexpected counters: %s" % cache.stats)
+
+    def testBadServerSignature(self):
+        """Test rejecting a server that does not know the password."""
+        scram = self.exchange(SCRAM_SHA_1, self.SHA1)
+        self.failUnlessRaises(SASLError, scram.success,
+                              b'v=AAAAAAAAAAAAAAAAAAAAAAAAAAA=')
+
+    def testBadNonce(self):
+        """Test rejecting a challenge that does not extend our nonce."""
+        scram = SCRAM_SHA_1('user', 'pencil')
+        scram.start()
+        self.failUnlessRaises(SASLError, scram.challenge,
+                              b'r=abc,s=QSXCR+Q6sek8bf92,i=4096')
+
+    def testStream(self):
+        """Test authenticating a stream with SCRAM-SHA-1."""
+        vector = self.SHA1
+
+        class Fixed(SCRAM_SHA_1):
+            cnonce = vector['cnonce']
+
+        def b64(data):
+            return base64.b64encode(data.encode()).decode()
+
+        self.stream_start(mode='client', jid='user@localhost',
+                          password='pencil')
+        self.xmpp.register_sasl_mechanism(Fixed)
+        self.recv_feature("""
+          <stream:features>
+            <mechanisms xmlns="urn:ietf:params:xml:ns:xmpp-sasl">
+              <mechanism>PLAIN</mechanism>
+              <mechanism>SCRAM-SHA-1</mechanism>
+            </mechanisms>
+          </stream:features>
+        """)
+        self.send_feature("""
+          <auth xmlns="urn:ietf:params:xml:ns:xmpp-sasl"
+                mechanism="SCRAM-SHA-1">%s</auth>
+        """ % b64('n,,n=user,r=%s' % vector['cnonce']))
+        self.recv_feature("""
+          <challenge xmlns="urn:ietf:params:xml:ns:xmpp-sasl">%s</challenge>
+        """ % b64(vector['server_first']))
+        self.send_feature("""
+          <response xmlns="urn:ietf:params:xml:ns:xmpp-sasl">%s</response>
+        """ % b64(vector['client_final']))
+        self.recv_feature("""
+          <success xmlns="urn:ietf:params:xml:ns:xmpp-sasl">%s</success>
+        """ % b64(vector['server_final']))
+        header = self.xmpp.socket.next_sent(timeout=1)
+        self.failUnless(header == self.xmpp.stream_header.encode('utf-8'),
+                "Stream was not restarted, sent: %s" % header)
+        self.failUnless(self.xmpp.authenticated,
+                "Client was not authenticated.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSASL)
@@ -0,0 +1,170 @@
+import time
+import threading
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream import scheduler
+from sleekxmpp.xmlstream.scheduler import Scheduler
+
+
+class TestScheduler(SleekTest):
+
+    """
+    Test scheduling, cancelling, and rescheduling tasks.
+    """
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.scheduler.process(threaded=True)
+        self.fired = []
+        self.lock = threading.Condition()
+
+    def tearDown(self):
+        self.scheduler.quit()
+        self.scheduler.thread.join(2)
+
+    def record(self, name):
+        """Scheduled callback noting that a task ran."""
+        with self.lock:
+            self.fired.append(name)
+            self.lock.notify_all()
+
+    def waitFor(self, condition, timeout=10):
+        """Wait until a condition holds, or fail after a timeout."""
+        end = time.time() + timeout
+        with self.lock:
+            while not condition() and time.time() < end:
+                self.lock.wait(0.05)
+        self.failUnless(condition(), "Timed out waiting for tasks.")
+
+    def add(self, name, seconds, repeat=False):
+        """Schedule a task that records its name when it runs."""
+        self.scheduler.add(name, seconds, self.record,
+                           args=(name,), repeat=repeat)
+
+    def testOrder(self):
+        """Test that tasks run in order of their execution times."""
+        self.add('c', 0.3)
+        self.add('a', 0.1)
+        self.add('b', 0.2)
+        time.sleep(0.5)
+
+        self.failUnless(self.fired == ['a', 'b', 'c'],
+                "Tasks ran out of order: %s" % self.fired)
+        self.failUnless(self.scheduler.tasks == {},
+                "Finished tasks were not removed: %s" % self.scheduler.tasks)
+
+    def testWakeup(self):
+        """Test that a task runs when due instead of on a polling interval."""
+        self.add('idle', 60)
+        time.sleep(0.1)
+        start = time.time()
+        self.add('soon', 0.05)
+        while not self.fired and time.time() - start < 2:
+            time.sleep(0.01)
+
+        self.failUnless(self.fired == ['soon'],
+                "Task did not run: %s" % self.fired)
+        self.failUnless(time.time() - start < 0.5,
+                "Task ran late: %0.2f seconds" % (time.time() - start))
+
+    def testCancel(self):
+        """Test cancelling a task by name."""
+        self.add('keep', 0.1)
+        self.add('drop', 0.1)
+        self.failUnless(self.scheduler.cancel('drop'),
+                "Task was not cancelled.")
+        self.failIf(self.scheduler.cancel('missing'),
+                "Cancelled a task that does not exist.")
+        time.sleep(0.3)
+
+        self.failUnless(self.fired == ['keep'],
+                "Cancelled task ran: %s" % self.fired)
+
+    def testReschedule(self):
+        """Test changing the delay of a pending task."""
+        self.add('later', 0.1)
+        self.add('sooner', 0.3)
+        self.failUnless(self.scheduler.reschedule('later', 0.5),
+                "Task was not rescheduled.")
+        self.failUnless(self.scheduler.reschedule('sooner', 0.05),
+                "Task was not rescheduled.")
+        time.sleep(0.3)
+
+        self.failUnless(self.fired == ['sooner'],
+                "Unexpected tasks ran: %s" % self.fired)
+
+        time.sleep(0.4)
+        self.failUnless(self.fired == ['sooner', 'later'],
+                "Rescheduled task did not run: %s" % self.fired)
+
+    def testReplace(self):
+        """Test that adding a task replaces one with the same name."""
+        self.scheduler.add('task', 0.1, self.record, args=('first',))
+        self.scheduler.add('task', 0.1, self.record, args=('second',))
+        time.sleep(0.3)
+
+        self.failUnless(self.fired == ['second'],
+                "Task was not replaced: %s" % self.fired)
+
+    def testRepeat(self):
+        """Test repeating a task until it is cancelled."""
+        self.add('repeat', 0.05, repeat=True)
+        time.sleep(0.28)
+        self.scheduler.cancel('repeat')
+        count = len(self.fired)
+        time.sleep(0.15)
+
+        self.failUnless(count >= 3,
+                "Task did not repeat: %s" % self.fired)
+        self.failUnless(len(self.fired) == count,
+                "Task repeated after being cancelled.")
+
+    def testManyTasks(self):
+        """Test cancelling most of a large number of pending tasks."""
+        for i in range(20000):
+            self.add('task %s' % i, 1.0)
+        for i in range(20000):
+            if i % 100:
+                self.scheduler.cancel('task %s' % i)
+        self.waitFor(lambda: len(self.fired) >= 200)
+        self.waitFor(lambda: not self.scheduler.schedule)
+
+        self.failUnless(len(self.fired) == 200,
+                "Unexpected number of tasks ran: %s" % len(self.fired))
+        self.failUnless(sorted(self.fired) == \
+                        sorted(['task %s' % i for i in range(0, 20000, 100)]),
+                "Cancelled tasks were run.")
+
+    def testCompactWhileRunning(self):
+        """Test compacting the schedule while running due tasks."""
+        threshold = scheduler.COMPACT_THRESHOLD
+        scheduler.COMPACT_THRESHOLD = 4
+        try:
+            tasks = Scheduler()
+            tasks.add('repeat', 0.05, lambda: None, repeat=True)
+            for i in range(10):
+                tasks.add('cancelled%s' % i, 0.06, lambda: None)
+            tasks.run_pending()
+            for i in range(10):
+                tasks.cancel('cancelled%s' % i)
+            time.sleep(0.1)
+            wait = tasks.run_pending()
+        finally:
+            scheduler.COMPACT_THRESHOLD = threshold
+
+        self.failUnless(tasks._stale == 0,
+                "Stale entry count is wrong: %s" % tasks._stale)
+        self.failUnless(wait is not None and wait <= 0.05,
+                "Unexpected wait for the repeating task: %s" % wait)
+        self.failUnless(len(tasks.schedule) == 1,
+                "Schedule was not compacted: %s" % tasks.schedule)
+
+    def testQuit(self):
+        """Test that an idle scheduler stops promptly."""
+        self.scheduler.quit()
+        self.scheduler.thread.join(1)
+        self.failIf(self.scheduler.thread.is_alive(),
+                "Scheduler thread did not stop.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestScheduler)
@@ -1,4 +1,8 @@
+import threading
+import time
+
 from sleekxmpp.test import *
+from sleekxmpp.xmlstream import SendQueueFull
 import sleekxmpp.plugins.xep_0033 as xep_0033
 
 
@@ -57,4 +61,168 @@ class TestStreamTester(SleekTest):
         self.stream_start(mode='client', skip=False)
         self.send_header(sto='localhost')
 
+    def testSendBatch(self):
+        """Test that queued stanzas are combined into one write."""
+        self.stream_start(mode='client')
+        self.xmpp.send_batch_max = 10
+        self.xmpp.send_batch_delay = 0.2
+
+        for i in range(3):
+            self.xmpp.send_raw('<message id="%s" />' % i)
+
+        data = self.xmpp.socket.next_sent(timeout=1)
+        expected = '<message id="0" /><message id="1" /><message id="2" />'
+        self.failUnless(data == expected.encode('utf-8'),
+                "Stanzas were not sent in one write: %s" % data)
+        self.failUnless(self.xmpp.send_stats['largest_batch'] == 3,
+                "Batch size was not recorded: %s" % self.xmpp.send_stats)
+
+    def testSendQueueLimits(self):
+        """Test send policies and watermark events for a full send queue."""
+        self.stream_start(mode='client')
+        events = []
+        self.xmpp.add_event_handler('send_queue_high',
+                lambda data: events.append(('high', data['items'])))
+        self.xmpp.add_event_handler('send_queue_drained',
+                lambda data: events.append(('drained', data['items'])))
+
+        # Stall the socket so that stanzas stay queued.
+        stalled = threading.Event()
+        sendall = self.xmpp.socket.sendall
+
+        def stalled_sendall(data):
+            stalled.wait(2)
+            sendall(data)
+
+        self.xmpp.socket.sendall = stalled_sendall
+        self.xmpp.send_queue.max_items = 2
+        self.xmpp.send_queue.max_bytes = 1000
+
+        # The first stanza is taken by the stalled send thread.
+        self.xmpp.send_raw('<message id="0" />')
+        time.sleep(0.1)
+        self.failUnless(self.xmpp.send_raw('<message id="1" />'),
+                "Stanza was not queued.")
+        self.failUnless(self.xmpp.send_raw('<message id="2" />'),
+                "Stanza was not queued.")
+        self.failUnless(self.xmpp.send_queue.bytes == 36,
+                "Unexpected queued size: %s" % self.xmpp.send_queue.bytes)
+
+        self.failIf(self.xmpp.send_raw('<message id="3" />', policy='drop'),
+                "Stanza was not dropped from a full queue.")
+        self.assertRaises(SendQueueFull, self.xmpp.send_raw,
+                          '<message id="4" />', policy='raise')
+        self.xmpp.send_timeout = 0.1
+        self.failIf(self.xmpp.send_raw('<message id="5" />'),
+                "Blocked stanza was not dropped after the timeout.")
+
+        stalled.set()
+        for i in range(3):
+            self.xmpp.socket.next_sent(timeout=1)
+        time.sleep(0.2)
+
+        self.failUnless(events == [('high', 2), ('drained', 0)],
+                "Unexpected watermark events: %s" % events)
+        self.failUnless(self.xmpp.send_queue.bytes == 0,
+                "Queued size was not reset: %s" % self.xmpp.send_queue.bytes)
+
+    def testEventQueueLimit(self):
+        """Test pausing the reader while the event queue is full."""
+        self.stream_start(mode='client')
+        self.xmpp.event_queue_limit = 3
+        release = threading.Event()
+        handled = []
+
+        def slow_handler(msg):
+            release.wait(2)
+            handled.append(msg['id'])
+
+        self.xmpp.add_event_handler('message', slow_handler)
+
+        for i in range(10):
+            self.recv('<message id="%s"><body>%s</body></message>' % (i, i))
+        time.sleep(0.2)
+
+        stats = self.xmpp.inbound_stats
+        self.failUnless(stats['pauses'] >= 1,
+                "Reader did not pause: %s" % stats)
+        self.failUnless(self.xmpp.event_queue.qsize() <= 4,
+                "Event queue grew past its limit: %s" % \
+                        self.xmpp.event_queue.qsize())
+
+        release.set()
+        end = time.time() + 2
+        while len(handled) < 10 and time.time() < end:
+            time.sleep(0.05)
+
+        self.failUnless(handled == [str(i) for i in range(10)],
+                "Not all messages were handled: %s" % handled)
+        self.failUnless(stats['paused_time'] > 0 and stats['max_depth'] >= 3,
+                "Pause metrics were not recorded: %s" % stats)
+
+    def testEventQueueLimitRequest(self):
+        """Test that a handler awaiting a response does not stall reading."""
+        self.stream_start(mode='client')
+        self.xmpp.event_queue_limit = 3
+        results = []
+
+        def request_handler(msg):
+            if msg['id'] != '0':
+                return
+            iq = self.xmpp.Iq()
+            iq['id'] = 'paused'
+            iq['type'] = 'get'
+            iq['query'] = 'test'
+            start = time.time()
+            results.append(iq.send(timeout=5))
+            results.append(time.time() - start)
+
+        self.xmpp.add_event_handler('message', request_handler)
+
+        for i in range(6):
+            self.recv('<message id="%s"><body>%s</body></message>' % (i, i))
+        time.sleep(0.2)
+        self.recv("""
+          <iq id="paused" type="result">
+            <query xmlns="test" />
+          </iq>
+        """)
+        end = time.time() + 6
+        while len(results) < 2 and time.time() < end:
+            time.sleep(0.05)
+
+        self.failUnless(results and results[0] is not False and \
+                        results[0]['id'] == 'paused',
+                "Response was not received: %s" % results)
+        self.failUnless(results[1] < 2,
+                "Response was delayed: %s" % results)
+
+    def testPipelinedReceive(self):
+        """Test dispatching stanzas in a separate thread after session start."""
+        self.stream_start(mode='component', jid='tester.localhost')
+        self.xmpp.pipeline_receive = True
+        handled = []
+
+        def handle_message(msg):
+            handled.append((msg['id'], threading.current_thread().name))
+
+        self.xmpp.add_event_handler('message', handle_message)
+
+        self.recv('<message id="before"><body>0</body></message>')
+        self.xmpp.event('session_start')
+        time.sleep(0.2)
+
+        for i in range(20):
+            self.recv('<message id="%s"><body>%s</body></message>' % (i, i))
+
+        end = time.time() + 2
+        while len(handled) < 21 and time.time() < end:
+            time.sleep(0.05)
+
+        ids = [sid for sid, name in handled]
+        self.failUnless(ids == ['before'] + [str(i) for i in range(20)],
+                "Stanzas were not handled in order: %s" % ids)
+        self.failUnless('dispatch' in [t.name for t in threading.enumerate()],
+                "Dispatch thread was not started.")
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamTester)
@@ -0,0 +1,174 @@
+import os
+import socket
+import ssl
+import threading
+import time
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.handler import Callback
+from sleekxmpp.xmlstream.matcher import MatchXPath
+from sleekxmpp.xmlstream.tls import TLSContext
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+CERTFILE = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+
+
+class TestAsyncioStream(SleekTest):
+    """
+    Test processing a stream using an asyncio event loop
+    instead of the stream's own threads.
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever)
+        self.loop_thread.start()
+        self.server, client = socket.socketpair()
+        self.server.settimeout(2)
+
+        self.xmpp = ClientXMPP('tester@localhost', 'test')
+        self.xmpp.set_socket(client)
+        self.xmpp.auto_reconnect = False
+        self.xmpp.is_client = True
+
+    def tearDown(self):
+        # Closing the stream from the server's side will end processing.
+        self.server.sendall(b'</stream:stream>')
+        done = asyncio.run_coroutine_threadsafe(
+                asyncio.wait(self.xmpp._async._tasks, timeout=2), self.loop)
+        done.result()
+        self.server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+
+    def read_server(self, expected):
+        """Read from the server's end of the socket until expected is seen."""
+        data = b''
+        while expected not in data:
+            chunk = self.server.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def testEcho(self):
+        """Test that stanzas are received, handled, and answered."""
+        def echo(msg):
+            msg.reply('Thanks for sending: %(body)s' % msg).send()
+
+        self.xmpp.add_event_handler('message', echo)
+        self.xmpp.process(loop=self.loop)
+
+        self.read_server(b'<stream:stream')
+        self.server.sendall(self.make_header(sfrom='localhost').encode('utf-8'))
+        self.server.sendall(b"""
+          <message to="tester@localhost" from="user@localhost">
+            <body>Hi!</body>
+          </message>""")
+
+        data = self.read_server(b'</message>')
+        self.failUnless(b'Thanks for sending: Hi!' in data,
+                "Echo reply was not sent: %s" % data)
+
+    def testSendQueueLimit(self):
+        """Test that the loop does not wait on a full send queue."""
+        def reply(msg):
+            for i in range(3):
+                self.xmpp.send_raw('<message id="reply%s" />' % i)
+
+        self.xmpp.send_queue.max_items = 1
+        self.xmpp.register_handler(
+                Callback('Instream reply',
+                         MatchXPath('{jabber:client}message'),
+                         reply, instream=True))
+        self.xmpp.process(loop=self.loop)
+
+        self.read_server(b'<stream:stream')
+        self.server.sendall(self.make_header(sfrom='localhost').encode('utf-8'))
+        self.server.sendall(b"""
+          <message to="tester@localhost" from="user@localhost">
+            <body>Hi!</body>
+          </message>""")
+
+        data = self.read_server(b'reply2')
+        self.failUnless(b'<message id="reply2" />' in data,
+                "Replies were not sent: %s" % data)
+
+    def testThreads(self):
+        """Test that no stream threads are started."""
+        before = threading.active_count()
+        self.xmpp.process(loop=self.loop)
+        self.read_server(b'<stream:stream')
+        self.failUnless(threading.active_count() == before,
+                "Processing the stream started new threads.")
+
+    def testSchedule(self):
+        """Test that scheduled tasks run on the event loop."""
+        happened = threading.Event()
+        self.xmpp.process(loop=self.loop)
+        self.xmpp.schedule('test task', 0.1, happened.set)
+        self.failUnless(happened.wait(2), "Scheduled task did not run.")
+
+    def testConcurrency(self):
+        """Test limiting how many copies of a threaded handler run."""
+        lock = threading.Lock()
+        running = []
+        peak = []
+        finished = threading.Semaphore(0)
+
+        def handler(data):
+            with lock:
+                running.append(data)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(data)
+            finished.release()
+
+        self.xmpp.add_event_handler('limited', handler, threaded=True,
+                                    concurrency=1)
+        self.xmpp.process(loop=self.loop)
+        for i in range(4):
+            self.xmpp.event('limited', i)
+        for i in range(4):
+            self.failUnless(finished.acquire(timeout=2),
+                    "Threaded handler did not run.")
+        self.failUnless(max(peak) == 1,
+                "Handler concurrency was not limited: %s" % peak)
+
+    def testStartTLS(self):
+        """Test negotiating TLS without blocking the event loop."""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(CERTFILE)
+        self.xmpp.ssl_context = TLSContext()
+        self.xmpp.process(loop=self.loop)
+
+        self.read_server(b'<stream:stream')
+        self.server.sendall(self.make_header(sfrom='localhost').encode('utf-8'))
+        self.server.sendall(b"""
+          <stream:features>
+            <starttls xmlns="urn:ietf:params:xml:ns:xmpp-tls" />
+          </stream:features>""")
+        self.read_server(b'starttls')
+        self.server.sendall(b'<proceed xmlns="urn:ietf:params:xml:ns:xmpp-tls" />')
+
+        self.server = context.wrap_socket(self.server, server_side=True)
+        data = self.read_server(b'<stream:stream')
+        self.failUnless(b'<stream:stream' in data,
+                "Stream was not restarted over TLS: %s" % data)
+        self.failUnless(self.xmpp.ssl_context.stats['handshakes'] == 1,
+                "Unexpected counters: %s" % self.xmpp.ssl_context.stats)
+        self.server.sendall(self.make_header(sfrom='localhost').encode('utf-8'))
+
+
+if asyncio is not None:
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAsyncioStream)
+else:
+    del TestAsyncioStream
+    suite = unittest.TestSuite()
@@ -0,0 +1,74 @@
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.dispatch import HandlerIndex
+from sleekxmpp.xmlstream.handler import *
+from sleekxmpp.xmlstream.matcher import *
+
+
+class TestHandlerIndex(SleekTest):
+
+    """
+    Test selecting candidate stream handlers using a dispatch index.
+    """
+
+    def setUp(self):
+        self.index = HandlerIndex()
+        self.handlers = {}
+
+    def add(self, name, matcher):
+        """Index a new handler with the given matcher."""
+        handler = Callback(name, matcher, lambda stanza: None)
+        self.handlers[name] = handler
+        self.index.add(handler)
+        return handler
+
+    def checkCandidates(self, xml_string, expected):
+        """Compare the candidates for a stanza against a list of names."""
+        xml = self.parse_xml(xml_string)
+        names = [h.name for h in self.index.candidates(xml)]
+        self.failUnless(names == expected,
+                "Unexpected candidates: %s, expected %s" % (names, expected))
+
+    def testKeys(self):
+        """Test selecting handlers by tag, type, child, and id."""
+        self.add('Presence', MatchXPath('{jabber:client}presence'))
+        self.add('Disco', MatchXPath('{jabber:client}iq/' + \
+                                     '{http://jabber.org/protocol/disco#info}query'))
+        self.add('Groupchat', MatchXMLMask(
+                "<message xmlns='jabber:client' type='groupchat' />"))
+        self.add('Response', MatcherId('123'))
+        self.add('Anything', MatchXPath('*'))
+
+        self.checkCandidates("""
+          <iq xmlns="jabber:client" id="123" type="get">
+            <query xmlns="http://jabber.org/protocol/disco#info" />
+          </iq>
+        """, ['Disco', 'Response', 'Anything'])
+
+        self.checkCandidates("""
+          <message xmlns="jabber:client" type="groupchat" />
+        """, ['Groupchat', 'Anything'])
+
+        self.checkCandidates("""
+          <message xmlns="jabber:client" type="chat" />
+        """, ['Anything'])
+
+    def testStanzaPathKeys(self):
+        """Test indexing stanza paths given as strings or lists."""
+        for path in (u'message/body', 'message/body', ['message', 'body']):
+            keys = StanzaPath(path).index_keys()
+            self.failUnless(keys == [('tag', 'message')],
+                    "Unexpected keys for %r: %s" % (path, keys))
+
+    def testRemove(self):
+        """Test that removed handlers are no longer candidates."""
+        handler = self.add('Message', MatchXPath('{jabber:client}message'))
+        self.add('Many', MatchMany([MatchXPath('{jabber:client}message'),
+                                    MatcherId('abc')]))
+        self.index.remove(handler)
+
+        self.checkCandidates("""
+          <message xmlns="jabber:client" />
+        """, ['Many'])
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestHandlerIndex)
@@ -1,6 +1,12 @@
+import threading
+import time
+
+from sleekxmpp.exceptions import IqTimeout
+from sleekxmpp.stanza.iq import Future
 from sleekxmpp.test import *
 from sleekxmpp.xmlstream.handler import *
 from sleekxmpp.xmlstream.matcher import *
+from sleekxmpp.xmlstream import PendingLimitReached
 
 
 class TestHandlers(SleekTest):
@@ -108,5 +114,208 @@ class TestHandlers(SleekTest):
         self.failUnless(waiter_exists == False,
             "Waiter handler was not removed.")
 
+    def testPendingResponse(self):
+        """Test that responses are matched using the pending table."""
+        results = []
+
+        def waiter_handler(stanza):
+            iq = self.xmpp.Iq()
+            iq['id'] = 'pending'
+            iq['type'] = 'get'
+            iq['query'] = 'test'
+            results.append(iq.send(block=True, timeout=2))
+
+        self.xmpp.add_event_handler('message', waiter_handler, threaded=True)
+        self.recv("""<message><body>Start Test</body></message>""")
+
+        iq = self.Iq()
+        iq['id'] = 'pending'
+        iq['type'] = 'get'
+        iq['query'] = 'test'
+        self.send(iq)
+
+        self.failUnless(self.xmpp.pending_count() == 1,
+            "Request was not registered as pending.")
+
+        self.recv("""
+          <iq id="pending" type="result">
+            <query xmlns="test" />
+          </iq>
+        """)
+        time.sleep(0.2)
+
+        self.failUnless(self.xmpp.pending_count() == 0,
+            "Response handler was not removed.")
+        self.failUnless(results and results[0]['id'] == 'pending',
+            "Waiter did not receive the response: %s" % results)
+
+    def testIqCallback(self):
+        """Test sending an Iq stanza with a response callback."""
+        results = []
+
+        iq = self.xmpp.Iq()
+        iq['id'] = 'callback'
+        iq['type'] = 'get'
+        iq['query'] = 'test'
+        iq.send(callback=results.append)
+
+        self.send("""
+          <iq id="callback" type="get">
+            <query xmlns="test" />
+          </iq>
+        """)
+        self.recv("""
+          <iq id="callback" type="result">
+            <query xmlns="test" />
+          </iq>
+        """)
+        time.sleep(0.2)
+
+        self.failUnless(len(results) == 1 and results[0]['id'] == 'callback',
+            "Callback did not receive the response: %s" % results)
+        self.failUnless(self.xmpp.pending_count() == 0,
+            "Response handler was not removed.")
+
+    def testIqFuture(self):
+        """Test sending Iq stanzas that return futures."""
+        if Future is None:
+            # The futures backport is not installed.
+            return
+        futures = []
+        for i in range(3):
+            iq = self.xmpp.Iq()
+            iq['id'] = 'future%s' % i
+            iq['type'] = 'get'
+            iq['query'] = 'test'
+            futures.append(iq.send_future(timeout=0.5))
+
+        self.failUnless(self.xmpp.pending_count() == 3,
+            "Requests were not all pending at once.")
+
+        self.recv("""
+          <iq id="future1" type="result">
+            <query xmlns="test" />
+          </iq>
+        """)
+        result = futures[1].result(timeout=2)
+        self.failUnless(result['id'] == 'future1',
+            "Unexpected future result: %s" % result)
+
+        error = futures[0].exception(timeout=2)
+        self.failUnless(isinstance(error, IqTimeout),
+            "Future did not time out: %s" % error)
+        self.failUnless(error.iq['id'] == 'future0',
+            "Timeout refers to the wrong stanza: %s" % error.iq['id'])
+
+    def testMaxPending(self):
+        """Test limiting the number of requests awaiting responses."""
+        self.xmpp.set_max_pending(1)
+        sent = []
+
+        def send_requests():
+            for i in range(2):
+                iq = self.xmpp.Iq()
+                iq['id'] = 'window%s' % i
+                iq['type'] = 'get'
+                iq['query'] = 'test'
+                iq.send(callback=lambda stanza: None)
+                sent.append(i)
+
+        thread = threading.Thread(target=send_requests)
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.2)
+
+        self.failUnless(sent == [0],
+            "Second request was not held back: %s" % sent)
+
+        self.recv("""
+          <iq id="window0" type="result">
+            <query xmlns="test" />
+          </iq>
+        """)
+        thread.join(2)
+
+        self.failUnless(sent == [0, 1],
+            "Second request was not sent: %s" % sent)
+        self.failUnless(self.xmpp.pending_count() == 1,
+            "Unexpected number of pending requests.")
+
+    def testMaxPendingHandler(self):
+        """Test that event handlers are not blocked by the pending limit."""
+        self.xmpp.set_max_pending(1)
+        results = []
+
+        def send_requests(data):
+            for i in range(2):
+                iq = self.xmpp.Iq()
+                iq['id'] = 'handler%s' % i
+                iq['type'] = 'get'
+                iq['query'] = 'test'
+                try:
+                    iq.send(callback=lambda stanza: None)
+                    results.append(i)
+                except PendingLimitReached:
+                    results.append('full')
+
+        self.xmpp.add_event_handler('send_requests', send_requests)
+        self.xmpp.event('send_requests', {})
+        time.sleep(0.2)
+
+        self.failUnless(results == [0, 'full'],
+            "Event handler was not refused a response slot: %s" % results)
+
+    def testIqDropped(self):
+        """Test that a dropped <iq> does not wait for a response."""
+        self.xmpp.sendRaw = lambda data: False
+        results = []
+
+        iq = self.xmpp.Iq()
+        iq['id'] = 'dropped0'
+        iq['type'] = 'get'
+        iq['query'] = 'test'
+        self.failIf(iq.send(callback=results.append),
+            "Dropped request was reported as sent.")
+        self.failUnless(results == [False],
+            "Callback was not given False: %s" % results)
+
+        iq['id'] = 'dropped1'
+        start = time.time()
+        self.failIf(iq.send(timeout=5),
+            "Dropped request returned a response.")
+        self.failUnless(time.time() - start < 1,
+            "Dropped request waited for a response.")
+        self.failUnless(self.xmpp.pending_count() == 0,
+            "Dropped requests are still pending.")
+
+    def testCopyOnWrite(self):
+        """Test that handlers share stanza XML until it is modified."""
+        self.xmpp.copy_on_write = True
+        seen = []
+
+        def first_handler(msg):
+            seen.append(msg.xml)
+            msg['body'] = 'Changed'
+
+        def second_handler(msg):
+            seen.append(msg.xml)
+            seen.append(msg['body'])
+
+        for name, handler in (('First', first_handler),
+                              ('Second', second_handler)):
+            self.xmpp.registerHandler(
+                    Callback('Test %s' % name,
+                             MatchXPath('{jabber:client}message'),
+                             handler))
+
+        self.recv("""<message><body>Hi!</body></message>""")
+        time.sleep(0.2)
+
+        self.failUnless(len(seen) == 3, "Handlers were not run: %s" % seen)
+        self.failUnless(seen[0] is seen[1],
+            "Handlers were not given shared XML.")
+        self.failUnless(seen[2] == 'Hi!',
+            "Modified stanza was visible to another handler.")
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestHandlers)
@@ -0,0 +1,179 @@
+import os
+import socket
+import ssl
+import threading
+import time
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream import XMLStream
+from sleekxmpp.xmlstream.handler import Callback
+from sleekxmpp.xmlstream.matcher import MatchXPath
+from sleekxmpp.xmlstream import manager
+from sleekxmpp.xmlstream.manager import StreamManager
+from sleekxmpp.xmlstream.tls import TLSContext
+
+
+CERTFILE = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+
+
+class TestStreamManager(SleekTest):
+
+    """
+    Test processing several XML streams using a single
+    selector thread and a shared worker pool.
+    """
+
+    def setUp(self):
+        self.manager = StreamManager(max_workers=4)
+        self.manager.start()
+        self.peers = []
+
+    def tearDown(self):
+        self.manager.stop()
+        for peer in self.peers:
+            peer.close()
+
+    def addStream(self, name):
+        """
+        Create a stream connected to a local socket which
+        replies to every message it receives.
+        """
+        client, server = socket.socketpair()
+        server.settimeout(5)
+        self.peers.append(server)
+        stream = XMLStream()
+        stream.auto_reconnect = False
+        stream.set_socket(client)
+
+        def echo(stanza):
+            stream.send_raw('<message id="%s-%s" />' % (name, stanza['id']))
+
+        stream.register_handler(
+                Callback('Echo', MatchXPath('{jabber:client}message'), echo))
+        stream.process(manager=self.manager)
+        server.sendall(b'<stream xmlns="jabber:client">')
+        return stream, server
+
+    def recvUntil(self, sock, text):
+        """Read from a socket until the given text is received."""
+        data = ''
+        end = time.time() + 5
+        while text not in data and time.time() < end:
+            data += sock.recv(4096).decode('utf-8')
+        return data
+
+    def testManyStreams(self):
+        """Test that each stream's handlers receive its own stanzas."""
+        streams = [self.addStream('s%s' % i) for i in range(3)]
+        for i, (stream, server) in enumerate(streams):
+            server.sendall(('<message id="%s" />' % i).encode('utf-8'))
+        for i, (stream, server) in enumerate(streams):
+            data = self.recvUntil(server, 's%s-%s' % (i, i))
+            self.failUnless('<message id="s%s-%s" />' % (i, i) in data,
+                    "Stream %s did not reply: %s" % (i, data))
+        self.failUnless(len(self.manager.streams) == 3,
+                "Unexpected number of managed streams.")
+
+    def testEventsInOrder(self):
+        """Test that a stream's events are processed in order."""
+        events = []
+        stream, server = self.addStream('a')
+        stream.add_event_handler('ping', lambda data: events.append(data))
+        for i in range(50):
+            stream.event('ping', i)
+        end = time.time() + 5
+        while len(events) < 50 and time.time() < end:
+            time.sleep(0.01)
+        self.failUnless(events == list(range(50)),
+                "Events were not processed in order: %s" % events)
+
+    def testConcurrency(self):
+        """Test limiting how many copies of a threaded handler run."""
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def handler(data):
+            with lock:
+                running.append(data)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(data)
+
+        stream, server = self.addStream('a')
+        stream.add_event_handler('limited', handler, threaded=True,
+                                 concurrency=1)
+        for i in range(4):
+            stream.event('limited', i)
+        end = time.time() + 5
+        while len(peak) < 4 and time.time() < end:
+            time.sleep(0.01)
+        self.failUnless(peak == [1, 1, 1, 1],
+                "Handler concurrency was not limited: %s" % peak)
+
+    def testScheduledTasks(self):
+        """Test that streams may use the same task names."""
+        called = []
+        first, server1 = self.addStream('a')
+        second, server2 = self.addStream('b')
+        first.schedule('Ping', 0.1, lambda: called.append('a'))
+        second.schedule('Ping', 0.1, lambda: called.append('b'))
+        end = time.time() + 5
+        while len(called) < 2 and time.time() < end:
+            time.sleep(0.01)
+        self.failUnless(sorted(called) == ['a', 'b'],
+                "Scheduled tasks did not execute: %s" % called)
+
+    def testStartTLS(self):
+        """Test that STARTTLS completes and records its handshake."""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(CERTFILE)
+        client, server = socket.socketpair()
+        server.settimeout(5)
+        self.peers.append(server)
+
+        xmpp = ClientXMPP('tester@localhost', 'test')
+        xmpp.set_socket(client)
+        xmpp.auto_reconnect = False
+        xmpp.is_client = True
+        xmpp.ssl_context = TLSContext()
+        xmpp.process(manager=self.manager)
+
+        self.recvUntil(server, '<stream:stream')
+        server.sendall(self.make_header(sfrom='localhost').encode('utf-8'))
+        server.sendall(b"""
+          <stream:features>
+            <starttls xmlns="urn:ietf:params:xml:ns:xmpp-tls" />
+          </stream:features>""")
+        self.recvUntil(server, 'starttls')
+        server.sendall(b'<proceed xmlns="urn:ietf:params:xml:ns:xmpp-tls" />')
+
+        server = context.wrap_socket(server, server_side=True)
+        self.peers.append(server)
+        data = self.recvUntil(server, '<stream:stream')
+        self.failUnless('<stream:stream' in data,
+                "Stream was not restarted over TLS: %s" % data)
+        self.failUnless(xmpp.ssl_context.stats['handshakes'] == 1,
+                "Unexpected counters: %s" % xmpp.ssl_context.stats)
+        self.failIf(xmpp._tls_pending, "TLS handshake is still pending.")
+        server.sendall(b'</stream:stream>')
+
+    def testStreamEnd(self):
+        """Test that a closed stream is removed from the manager."""
+        stream, server = self.addStream('a')
+        server.sendall(b'</stream>')
+        end = time.time() + 5
+        while self.manager.streams and time.time() < end:
+            time.sleep(0.01)
+        self.failUnless(not self.manager.streams,
+                "Closed stream was not removed from the manager.")
+        self.failUnless(stream.stop.isSet(),
+                "Closed stream was not stopped.")
+
+
+if manager.selectors is not None:
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamManager)
+else:
+    del TestStreamManager
+    suite = unittest.TestSuite()
@@ -0,0 +1,179 @@
+import socket
+import time
+import threading
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream import XMLStream
+from sleekxmpp.xmlstream.handler import Callback
+from sleekxmpp.xmlstream.matcher import MatchXPath
+from sleekxmpp.xmlstream.queues import NotifyQueue
+
+
+class TestOrderedDispatch(SleekTest):
+
+    """
+    Test spreading stanza events across event runner threads
+    while keeping the order of events from each sender.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='component', jid='tester.localhost')
+
+    def tearDown(self):
+        self.stream_close()
+
+    def addShards(self, count):
+        """Add event queues and runner threads to the test stream."""
+        shards = [NotifyQueue() for i in range(count - 1)]
+        self.xmpp.event_shards = [self.xmpp.event_queue] + shards
+        for shard in shards:
+            thread = threading.Thread(target=self.xmpp._event_runner,
+                                      args=(shard,))
+            thread.daemon = True
+            thread.start()
+
+    def testShardKeys(self):
+        """Test choosing event queues by the sender's bare JID."""
+        self.addShards(8)
+
+        def queue_for(sender):
+            msg = self.Message()
+            msg['from'] = sender
+            return self.xmpp._event_queue_for(msg)
+
+        self.failUnless(queue_for('a@localhost/1') is \
+                        queue_for('a@localhost/2'),
+                "Resources of one sender used different queues.")
+        used = set([queue_for('user%s@localhost' % i) for i in range(50)])
+        self.failUnless(len(used) > 1,
+                "Senders were not spread across queues.")
+        self.failUnless(self.xmpp._event_queue_for({}) is \
+                        self.xmpp.event_queue,
+                "Non-stanza events should use the main event queue.")
+
+        self.xmpp.dispatch_key = lambda stanza: None
+        self.failUnless(queue_for('a@localhost') is self.xmpp.event_queue,
+                "Custom dispatch key was not used.")
+
+    def testSenderOrder(self):
+        """Test that each sender's messages are handled in order."""
+        self.addShards(4)
+        handled = {}
+        lock = threading.Lock()
+
+        def handle_message(msg):
+            sender = msg['from'].bare
+            if msg['body'] == '0':
+                # Give later messages a chance to overtake this one.
+                time.sleep(0.05)
+            with lock:
+                handled.setdefault(sender, []).append(msg['body'])
+
+        self.xmpp.add_event_handler('message', handle_message)
+
+        for i in range(5):
+            for sender in ('a', 'b', 'c', 'd'):
+                self.recv("""
+                  <message to="tester.localhost"
+                           from="%s@localhost/r%s">
+                    <body>%s</body>
+                  </message>
+                """ % (sender, i, i))
+
+        end = time.time() + 3
+        while sum(len(v) for v in handled.values()) < 20 and \
+              time.time() < end:
+            time.sleep(0.01)
+
+        expected = ['0', '1', '2', '3', '4']
+        for sender in ('a', 'b', 'c', 'd'):
+            self.failUnless(handled.get('%s@localhost' % sender) == expected,
+                    "Messages from %s were handled out of order: %s" % (
+                        sender, handled))
+
+
+class TestOrderedProcess(SleekTest):
+
+    """
+    Test ordered dispatch using the event runners started
+    by XMLStream.process.
+    """
+
+    def setUp(self):
+        client, self.server = socket.socketpair()
+        self.server.settimeout(5)
+        self.before = set(threading.enumerate())
+        self.stream = XMLStream()
+        self.stream.auto_reconnect = False
+        self.stream.set_socket(client)
+        self.stream.ordered_dispatch = True
+        self.stream.handler_threads = 4
+
+    def tearDown(self):
+        self.server.sendall(b'</stream>')
+        self.stream.disconnect()
+        self.server.close()
+
+    def runners(self):
+        """Return the stream's live event runner threads."""
+        return [t for t in threading.enumerate() \
+                if t not in self.before and t.is_alive() and \
+                   t.name.startswith('stream_event_handler')]
+
+    def testProcess(self):
+        """Test sender order and quitting with sharded event runners."""
+        handled = {}
+        lock = threading.Lock()
+
+        def handle_message(msg):
+            sender = msg['from'].bare
+            if msg['id'] == '0':
+                # Give later messages a chance to overtake this one.
+                time.sleep(0.05)
+            with lock:
+                handled.setdefault(sender, []).append(msg['id'])
+
+        self.stream.register_handler(
+                Callback('Ordered', MatchXPath('{jabber:client}message'),
+                         handle_message))
+        self.stream.process(threaded=True)
+        self.server.sendall(b'<stream xmlns="jabber:client">')
+
+        self.failUnless(len(self.stream.event_shards) == 4,
+                "Unexpected event shards: %s" % self.stream.event_shards)
+        self.failUnless(len(self.runners()) == 4,
+                "Unexpected event runners: %s" % self.runners())
+
+        for i in range(5):
+            for sender in ('a', 'b', 'c', 'd'):
+                self.server.sendall(('<message id="%s" ' % i + \
+                                     'from="%s@localhost/r%s" />' % (
+                                         sender, i)).encode('utf-8'))
+
+        end = time.time() + 3
+        while sum(len(v) for v in handled.values()) < 20 and \
+              time.time() < end:
+            time.sleep(0.01)
+
+        expected = ['0', '1', '2', '3', '4']
+        for sender in ('a', 'b', 'c', 'd'):
+            self.failUnless(handled.get('%s@localhost' % sender) == expected,
+                    "Messages from %s were handled out of order: %s" % (
+                        sender, handled))
+
+        # A quit request on the main event queue must stop every
+        # shard's runner, well before the runners notice the stream
+        # stopping on their own.
+        self.stream.event_queue.put(('quit', None, None))
+        end = time.time() + 2
+        while self.runners() and time.time() < end:
+            time.sleep(0.01)
+        self.failIf(self.runners(),
+                "Event runners did not quit: %s" % self.runners())
+        self.failIf(self.stream.stop.isSet(),
+                "Stream stopped before the event runners quit.")
+
+
+suite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(TestOrderedDispatch),
+        unittest.TestLoader().loadTestsFromTestCase(TestOrderedProcess)])
@@ -0,0 +1,58 @@
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.parser import XMLStreamParser
+
+
+class TestStreamParser(SleekTest):
+
+    """
+    Test the incremental XML stream parser.
+    """
+
+    header = '<stream:stream xmlns="jabber:client" ' + \
+             'xmlns:stream="http://etherx.jabber.org/streams">'
+
+    def setUp(self):
+        self.parser = XMLStreamParser()
+
+    def testStanzas(self):
+        """Test that only the root and its children are reported."""
+        events = self.parser.feed(self.header + \
+                '<message><body>Hi!</body></message>' + \
+                '<presence />' + \
+                '</stream:stream>')
+
+        names = [event for event, xml in events]
+        self.failUnless(names == ['start', 'stanza', 'stanza', 'end'],
+                "Unexpected stream events: %s" % names)
+
+        msg = self.Message(xml=events[1][1])
+        self.failUnless(msg['body'] == 'Hi!',
+                "Stanza contents were not preserved: %s" % msg)
+        self.failUnless(len(self.parser.root) == 0,
+                "Stanzas were added to the root element.")
+
+    def testChunked(self):
+        """Test that stanzas may be split across many reads."""
+        data = self.header + '<message><body>Hi!</body></message>'
+        events = []
+        for char in data:
+            events.extend(self.parser.feed(char))
+
+        names = [event for event, xml in events]
+        self.failUnless(names == ['start', 'stanza'],
+                "Unexpected stream events: %s" % names)
+        self.failUnless(events[1][1].find('{jabber:client}body').text == 'Hi!',
+                "Stanza text was not preserved.")
+
+    def testReset(self):
+        """Test restarting the stream with a new header."""
+        self.parser.feed(self.header + '<message><body>Hi')
+        self.parser.reset()
+
+        events = self.parser.feed(self.header + '<iq type="get" />')
+        names = [event for event, xml in events]
+        self.failUnless(names == ['start', 'stanza'],
+                "Unexpected stream events after reset: %s" % names)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamParser)
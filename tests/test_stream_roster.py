@@ -1,4 +1,5 @@
 from sleekxmpp.test import *
+from sleekxmpp.roster import RosterStore
 import time
 import threading
 
@@ -11,6 +12,14 @@ class TestStreamRoster(SleekTest):
     def tearDown(self):
         self.stream_close()
 
+    def waitForVersioning(self, timeout=1):
+        """Wait for the roster versioning feature to be processed."""
+        end = time.time() + timeout
+        while not self.xmpp.roster_versioning and time.time() < end:
+            time.sleep(0.01)
+        self.failUnless(self.xmpp.roster_versioning,
+                "Roster versioning feature was not processed.")
+
     def testGetRoster(self):
         """Test handling roster requests."""
         self.stream_start(mode='client')
@@ -80,7 +89,87 @@ class TestStreamRoster(SleekTest):
         self.failUnless(self.xmpp.roster == roster,
                 "Unexpected roster values: %s" % self.xmpp.roster)
 
+    def testRosterVersionEmpty(self):
+        """Test requesting a versioned roster without a stored version."""
+        self.stream_start(mode='client')
+        self.recv_feature("""
+          <stream:features>
+            <ver xmlns="urn:xmpp:features:rosterver" />
+          </stream:features>
+        """)
+        self.waitForVersioning()
+
+        t = threading.Thread(name='get_roster', target=self.xmpp.get_roster)
+        t.start()
 
+        self.send("""
+          <iq type="get" id="1">
+            <query xmlns="jabber:iq:roster" ver="" />
+          </iq>
+        """, use_values=False)
+        self.recv("""
+          <iq type="result" id="1">
+            <query xmlns="jabber:iq:roster" ver="v1">
+              <item jid="user@localhost" subscription="both" />
+            </query>
+          </iq>
+        """)
+        t.join()
+
+        self.failUnless(self.xmpp.roster_ver == 'v1',
+                "Unexpected roster version: %s" % self.xmpp.roster_ver)
+        self.failUnless(list(self.xmpp.roster.keys()) == ['user@localhost'],
+                "Unexpected roster values: %s" % self.xmpp.roster)
+
+    def testRosterVersionStored(self):
+        """Test requesting only roster changes since a stored version."""
+        self.stream_start(mode='client')
+        store = RosterStore()
+        store.save('tester@localhost', 'v1',
+                   {'user@localhost': {'name': 'User',
+                                       'subscription': 'both',
+                                       'groups': ['Friends']}})
+        self.xmpp.roster_store = store
+        self.recv_feature("""
+          <stream:features>
+            <ver xmlns="urn:xmpp:features:rosterver" />
+          </stream:features>
+        """)
+        self.waitForVersioning()
+
+        t = threading.Thread(name='get_roster', target=self.xmpp.get_roster)
+        t.start()
+
+        self.send("""
+          <iq type="get" id="1">
+            <query xmlns="jabber:iq:roster" ver="v1" />
+          </iq>
+        """, use_values=False)
+        # The stored roster is current.
+        self.recv("""<iq type="result" id="1" />""")
+        t.join()
+
+        self.failUnless(self.xmpp.roster['user@localhost']['groups'] == \
+                        ['Friends'],
+                "Stored roster was not loaded: %s" % self.xmpp.roster)
+
+        self.recv("""
+          <iq type="set" id="2">
+            <query xmlns="jabber:iq:roster" ver="v2">
+              <item jid="user@localhost" subscription="remove" />
+            </query>
+          </iq>
+        """)
+        self.send("""
+          <iq type="result" id="2">
+            <query xmlns="jabber:iq:roster" />
+          </iq>
+        """, use_values=False)
+        self.failUnless(self.xmpp.roster == {},
+                "Removed item was kept: %s" % self.xmpp.roster)
+        self.failUnless(store.load('tester@localhost') == ('v2', {}),
+                "Unexpected stored roster: %s" % (
+                    store.load('tester@localhost'),))
 
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamRoster)
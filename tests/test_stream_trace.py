@@ -0,0 +1,115 @@
+import logging
+import time
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.trace import WireTrace, log_sink
+
+
+class TestWireTrace(SleekTest):
+
+    """
+    Test tracing raw stream traffic.
+    """
+
+    def tearDown(self):
+        self.stream_close()
+
+    def testHistory(self):
+        """Test keeping recent traffic in memory."""
+        self.stream_start(mode='client')
+        self.xmpp.trace.enable(history=2)
+
+        for i in range(3):
+            self.xmpp.send_raw('<message id="%s" />' % i)
+            self.xmpp.socket.next_sent(timeout=1)
+
+        recent = [(direction, data) for when, direction, data \
+                  in self.xmpp.trace.recent()]
+        expected = [('SEND', '<message id="1" />'),
+                    ('SEND', '<message id="2" />')]
+        self.failUnless(recent == expected,
+                "Unexpected trace history: %s" % recent)
+
+    def testSinks(self):
+        """Test sampling received traffic to a custom sink."""
+        traced = []
+
+        def sink(direction, data, when):
+            traced.append((direction, data))
+
+        self.stream_start(mode='client')
+        self.xmpp.trace.del_sink(log_sink)
+        self.xmpp.trace.add_sink(sink)
+        self.xmpp.trace.enable(sample=2)
+
+        for i in range(4):
+            self.recv('<message id="%s" />' % i)
+        time.sleep(0.2)
+
+        self.failUnless([d for d, data in traced] == ['RECV', 'RECV'],
+                "Traffic was not sampled: %s" % traced)
+        self.failUnless('id="1"' in traced[0][1],
+                "Unexpected traced data: %s" % traced)
+
+    def testLogger(self):
+        """Test that traffic is logged on the XMLStream module's logger."""
+        records = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        logger = logging.getLogger('sleekxmpp.xmlstream.xmlstream')
+        handler = Collect()
+        level = logger.level
+        # The test runner may have disabled logging entirely.
+        disabled = logging.root.manager.disable
+        logging.disable(logging.NOTSET)
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            trace = WireTrace()
+            self.failUnless(trace.active(),
+                    "Trace did not follow the xmlstream debug level.")
+            trace.record('SEND', '<presence />')
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+            logging.disable(disabled)
+
+        # Other streams' threads may log while the level is lowered.
+        self.failUnless('SEND: <presence />' in \
+                        [r.getMessage() for r in records],
+                "Traffic was not logged: %s" % records)
+
+    def testDisabled(self):
+        """Test that nothing is recorded while tracing is disabled."""
+        trace = WireTrace(enabled=False, history=5)
+        self.failIf(trace.active(), "Disabled trace is active.")
+        trace.enable()
+        trace.record('SEND', '<presence />')
+        trace.disable()
+        self.failIf(trace.active(), "Disabled trace is active.")
+        self.failUnless(len(trace.recent()) == 1,
+                "History was not kept: %s" % trace.recent())
+
+    def testSinkError(self):
+        """Test that a failing sink does not stop other sinks."""
+        traced = []
+
+        def broken(direction, data, when):
+            raise ValueError('Broken sink')
+
+        def sink(direction, data, when):
+            traced.append((direction, data))
+
+        trace = WireTrace(enabled=True)
+        trace.del_sink(log_sink)
+        trace.add_sink(broken)
+        trace.add_sink(sink)
+        trace.record('SEND', '<presence />')
+        self.failUnless(traced == [('SEND', '<presence />')],
+                "Sink after a failing sink was not called: %s" % traced)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestWireTrace)
@@ -0,0 +1,61 @@
+import re
+import time
+
+from sleekxmpp.test import *
+
+
+class TestStreamPubsub(SleekTest):
+
+    """
+    Test making pubsub requests with callbacks using XEP-0060.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client')
+        self.xmpp.register_plugin('xep_0030')
+        self.xmpp.register_plugin('xep_0060')
+
+    def tearDown(self):
+        self.stream_close()
+
+    def getItems(self):
+        """Request a node's items, returning the results list and id."""
+        results = []
+        self.xmpp.plugin['xep_0060'].getItems('pubsub.localhost', 'news',
+                                              callback=results.append)
+        sent = self.xmpp.socket.next_sent(timeout=1)
+        sid = re.search(r'id="([^"]+)"', sent.decode('utf-8')).group(1)
+        return results, sid
+
+    def waitFor(self, results):
+        """Wait for a callback result to arrive."""
+        end = time.time() + 2
+        while not results and time.time() < end:
+            time.sleep(0.05)
+
+    def testGetItems(self):
+        """Test receiving a node's items with a callback."""
+        results, sid = self.getItems()
+        self.recv("""
+          <iq type="result" id="%s" from="pubsub.localhost">
+            <query xmlns="http://jabber.org/protocol/disco#items"
+                   node="news">
+              <item jid="pubsub.localhost" node="news/a" />
+              <item jid="pubsub.localhost" node="news/b" />
+            </query>
+          </iq>
+        """ % sid)
+        self.waitFor(results)
+        self.failUnless(results == [['news/a', 'news/b']],
+                "Unexpected items: %s" % results)
+
+    def testGetItemsTimeout(self):
+        """Test that the callback is told when no response arrives."""
+        results, sid = self.getItems()
+        self.xmpp.scheduler.reschedule('Response timeout %s' % sid, 0.01)
+        self.waitFor(results)
+        self.failUnless(results == [False],
+                "Callback was not given False: %s" % results)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamPubsub)
@@ -0,0 +1,77 @@
+from sleekxmpp.test import *
+from sleekxmpp.plugins.xep_0138 import ZlibSocket
+
+
+class TestStreamCompression(SleekTest):
+
+    """
+    Test negotiating stream compression using XEP-0138.
+    """
+
+    def tearDown(self):
+        self.stream_close()
+
+    def startCompression(self):
+        """Offer compression along with resource binding."""
+        self.stream_start(mode='client')
+        self.xmpp.register_plugin('xep_0138')
+        self.recv_feature("""
+          <stream:features>
+            <bind xmlns="urn:ietf:params:xml:ns:xmpp-bind" />
+            <compression xmlns="http://jabber.org/features/compress">
+              <method>zlib</method>
+            </compression>
+          </stream:features>
+        """)
+        self.send_feature("""
+          <compress xmlns="http://jabber.org/protocol/compress">
+            <method>zlib</method>
+          </compress>
+        """)
+
+    def testCompressed(self):
+        """Test that the stream restarts over a compressed socket."""
+        events = []
+        self.startCompression()
+        self.xmpp.add_event_handler('stream_compressed',
+                                    lambda data: events.append(data))
+        self.recv_feature("""
+          <compressed xmlns="http://jabber.org/protocol/compress" />
+        """)
+        header = self.xmpp.socket.next_sent(timeout=1)
+        self.failUnless(header == self.xmpp.stream_header.encode('utf-8'),
+                "Stream was not restarted, sent: %s" % header)
+        self.xmpp.socket.recv_data(self.xmpp.stream_header)
+        self.failUnless(isinstance(self.xmpp.socket.socket, ZlibSocket),
+                "Socket was not wrapped with compression.")
+        self.failUnless(len(events) == 1,
+                "The stream_compressed event was not triggered.")
+
+    def testFailure(self):
+        """Test binding a resource after compression fails."""
+        self.startCompression()
+        self.recv_feature("""
+          <failure xmlns="http://jabber.org/protocol/compress">
+            <setup-failed />
+          </failure>
+        """)
+        sent = self.xmpp.socket.next_sent(timeout=1).decode('utf-8')
+        self.failUnless('urn:ietf:params:xml:ns:xmpp-bind' in sent,
+                "Resource binding did not follow compression failure: %s" % (
+                    sent))
+        iq = self.parse_xml(sent)
+        self.recv("""
+          <iq type="result" id="%s">
+            <bind xmlns="urn:ietf:params:xml:ns:xmpp-bind">
+              <jid>tester@localhost/test</jid>
+            </bind>
+          </iq>
+        """ % iq.attrib['id'])
+        self.xmpp.session_started_event.wait(1)
+        self.failUnless(self.xmpp.session_started_event.isSet(),
+                "Session did not start after compression failure.")
+        self.failUnless(self.xmpp['xep_0138'].stats() is None,
+                "Stream should not be compressed.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamCompression)
@@ -0,0 +1,149 @@
+import time
+
+from sleekxmpp.test import *
+
+
+class TestStreamManagement(SleekTest):
+
+    """
+    Test acknowledging and resuming streams using XEP-0198.
+    """
+
+    def tearDown(self):
+        self.stream_close()
+
+    def sent(self, timeout=1):
+        """Return the next sent data as a string."""
+        data = self.xmpp.socket.next_sent(timeout=timeout)
+        if data is None:
+            return ''
+        return data.decode('utf-8')
+
+    def enable(self):
+        """Enable stream management after binding a resource."""
+        self.stream_start(mode='client')
+        self.xmpp.register_plugin('xep_0198', {'window': 2})
+        self.sm = self.xmpp['xep_0198']
+        self.xmpp.authenticated = True
+        self.xmpp.bound = True
+        self.recv_feature("""
+          <stream:features>
+            <sm xmlns="urn:xmpp:sm:3" />
+          </stream:features>
+        """)
+        self.send_feature("""
+          <enable xmlns="urn:xmpp:sm:3" resume="true" />
+        """)
+        self.recv_feature("""
+          <enabled xmlns="urn:xmpp:sm:3" id="sm-1" resume="true" />
+        """)
+        self.waitFor(lambda: self.sm.enabled)
+
+    def waitFor(self, condition, timeout=1):
+        """Wait for a condition to become true."""
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.failUnless(condition(), "Timed out waiting for condition.")
+
+    def sendMessages(self, count):
+        """Send a number of messages, returning the data written."""
+        sent = []
+        for i in range(count):
+            msg = self.xmpp.Message()
+            msg['to'] = 'user@localhost'
+            msg['body'] = str(i)
+            msg.send()
+            sent.append(self.sent())
+        return sent
+
+    def testAckRequests(self):
+        """Test requesting acks and discarding acknowledged stanzas."""
+        self.enable()
+        sent = self.sendMessages(3)
+        self.failUnless('<r xmlns' not in sent[0],
+                "Requested an ack before the window was full.")
+        self.failUnless(sent[1].endswith("<r xmlns='urn:xmpp:sm:3' />"),
+                "Did not request an ack, sent: %s" % sent[1])
+
+        self.recv_feature("""<a xmlns="urn:xmpp:sm:3" h="2" />""")
+        self.waitFor(lambda: len(self.sm.unacked) == 1)
+        stats = self.sm.stats()
+        self.failUnless(stats['seq'] == 3 and stats['acks'] == 1,
+                "Unexpected counters: %s" % stats)
+
+    def testAnswerRequest(self):
+        """Test answering ack requests with the received count."""
+        self.enable()
+        self.recv("""<message from="user@localhost"><body>1</body></message>""")
+        self.recv("""<presence from="user@localhost" />""")
+        self.recv_feature("""<r xmlns="urn:xmpp:sm:3" />""")
+        self.send_feature("""<a xmlns="urn:xmpp:sm:3" h="2" />""")
+
+    def testResume(self):
+        """Test resuming a session and resending unacked stanzas."""
+        events = []
+        self.enable()
+        self.xmpp.add_event_handler('session_resumed',
+                                    lambda data: events.append(data))
+        sent = self.sendMessages(3)
+        self.recv("""<message from="user@localhost"><body>1</body></message>""")
+
+        self.recv_feature("""
+          <stream:features>
+            <bind xmlns="urn:ietf:params:xml:ns:xmpp-bind" />
+            <sm xmlns="urn:xmpp:sm:3" />
+          </stream:features>
+        """)
+        self.send_feature("""
+          <resume xmlns="urn:xmpp:sm:3" h="1" previd="sm-1" />
+        """)
+        self.recv_feature("""
+          <resumed xmlns="urn:xmpp:sm:3" h="1" previd="sm-1" />
+        """)
+        resent = [self.sent(), self.sent()]
+        self.failUnless(resent[0] == sent[1].replace(
+                            "<r xmlns='urn:xmpp:sm:3' />", ''),
+                "Unexpected resent stanza: %s" % resent[0])
+        self.failUnless(resent[1].startswith(sent[2]),
+                "Unexpected resent stanza: %s" % resent[1])
+        self.waitFor(lambda: len(events) == 1)
+        self.failUnless(self.sm.stats()['resent'] == 2,
+                "Unexpected counters: %s" % self.sm.stats())
+
+    def testResumeFailed(self):
+        """Test binding a new resource when resuming fails."""
+        self.enable()
+        self.xmpp.bound = False
+        self.recv_feature("""
+          <stream:features>
+            <bind xmlns="urn:ietf:params:xml:ns:xmpp-bind" />
+            <sm xmlns="urn:xmpp:sm:3" />
+          </stream:features>
+        """)
+        self.send_feature("""
+          <resume xmlns="urn:xmpp:sm:3" h="0" previd="sm-1" />
+        """)
+        self.recv_feature("""
+          <failed xmlns="urn:xmpp:sm:3">
+            <item-not-found xmlns="urn:ietf:params:xml:ns:xmpp-stanzas" />
+          </failed>
+        """)
+        sent = self.sent()
+        self.failUnless('urn:ietf:params:xml:ns:xmpp-bind' in sent,
+                "Did not bind a resource after resuming failed: %s" % sent)
+        self.recv("""
+          <iq type="result" id="%s">
+            <bind xmlns="urn:ietf:params:xml:ns:xmpp-bind">
+              <jid>tester@localhost/test</jid>
+            </bind>
+          </iq>
+        """ % self.parse_xml(sent).attrib['id'])
+        self.send_feature("""
+          <enable xmlns="urn:xmpp:sm:3" resume="true" />
+        """)
+        self.failUnless(self.sm.sm_id is None,
+                "Previous session was not forgotten.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamManagement)
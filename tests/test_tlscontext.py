@@ -0,0 +1,121 @@
+import os
+import socket
+import ssl
+import threading
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream import XMLStream, tls
+from sleekxmpp.xmlstream.tls import TLSContext
+
+
+CERTFILE = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+
+
+class TestTLSContext(SleekTest):
+
+    """
+    Test sharing TLS settings and resuming TLS sessions.
+    """
+
+    def setUp(self):
+        self.server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.server_context.load_cert_chain(CERTFILE)
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.address = ('127.0.0.1', self.listener.getsockname()[1])
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def serve(self):
+        """Accept TLS connections, greet, and wait for them to close."""
+        while True:
+            try:
+                conn = self.listener.accept()[0]
+            except socket.error:
+                return
+            try:
+                conn = self.server_context.wrap_socket(conn,
+                                                       server_side=True)
+                conn.sendall(b'ok')
+                while conn.recv(1024):
+                    pass
+            except (socket.error, ssl.SSLError):
+                pass
+            conn.close()
+
+    def handshake(self, context, server_hostname=None):
+        """Connect to the server, returning the TLS socket."""
+        sock = socket.create_connection(self.address)
+        sock = context.wrap_socket(sock, self.address,
+                                   server_hostname=server_hostname)
+        # Read the greeting so that any session ticket is received.
+        sock.recv(2)
+        context.save_session(sock, self.address)
+        return sock
+
+    def testCiphers(self):
+        """Test that AEAD ciphers are preferred."""
+        ciphers = [cipher['name'] for cipher in \
+                   TLSContext().context.get_ciphers() \
+                   if cipher['protocol'] != 'TLSv1.3']
+        self.failUnless('GCM' in ciphers[0] or 'CHACHA20' in ciphers[0],
+                "Unexpected cipher preference: %s" % ciphers)
+
+    def testResume(self):
+        """Test resuming a session on the next connection."""
+        context = TLSContext()
+        first = self.handshake(context)
+        first.close()
+        second = self.handshake(context)
+        resumed = second.session_reused
+        second.close()
+        self.failUnless(resumed, "Session was not resumed.")
+        self.failUnless(context.stats['handshakes'] == 2 and \
+                        context.stats['resumed'] == 1,
+                "Unexpected counters: %s" % context.stats)
+        self.failUnless(context.hit_rate() == 0.5,
+                "Unexpected hit rate: %s" % context.hit_rate())
+
+    def testClear(self):
+        """Test performing a full handshake after clearing sessions."""
+        context = TLSContext()
+        self.handshake(context).close()
+        context.clear()
+        sock = self.handshake(context)
+        resumed = sock.session_reused
+        sock.close()
+        self.failIf(resumed, "Session was resumed after clearing.")
+
+    def testVerify(self):
+        """Test checking the server's certificate and host name."""
+        context = TLSContext(ca_certs=CERTFILE)
+        self.handshake(context, 'localhost').close()
+        self.failUnlessRaises((ssl.SSLError, ValueError), self.handshake,
+                              context, 'example.com')
+
+    def testStreams(self):
+        """Test resuming a session when a stream reconnects."""
+        stream = XMLStream()
+        stream.ssl_context = TLSContext()
+        for i in range(2):
+            self.failUnless(stream.connect(self.address[0], self.address[1],
+                                           use_ssl=True, use_tls=False,
+                                           reattempt=False),
+                    "Could not connect.")
+            stream.socket.recv(2)
+            stream.disconnect()
+        stats = stream.ssl_context.stats
+        self.failUnless(stats['handshakes'] == 2 and stats['resumed'] == 1,
+                "Unexpected counters: %s" % stats)
+
+
+if tls.CONTEXT_SUPPORT and hasattr(ssl, 'PROTOCOL_TLS_SERVER'):
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTLSContext)
+else:
+    del TestTLSContext
+    suite = unittest.TestSuite()
@@ -0,0 +1,132 @@
+import time
+import threading
+
+from sleekxmpp.test import *
+from sleekxmpp.xmlstream.workerpool import WorkerPool
+
+
+class TestWorkerPool(SleekTest):
+
+    """
+    Test executing jobs using a bounded pool of worker threads.
+    """
+
+    def setUp(self):
+        self.done = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def job(self, name):
+        """Wait until released, then record the job's name."""
+        self.release.wait(2)
+        with self.lock:
+            self.done.append(name)
+
+    def wait_for(self, count):
+        """Wait until a number of jobs have finished."""
+        end = time.time() + 2
+        while len(self.done) < count and time.time() < end:
+            time.sleep(0.01)
+
+    def testMaxWorkers(self):
+        """Test that no more than max_workers threads are started."""
+        pool = WorkerPool(max_workers=3, idle_timeout=0.2)
+        for i in range(20):
+            pool.submit(self.job, (i,))
+        time.sleep(0.1)
+
+        stats = pool.stats()
+        self.failUnless(stats['workers'] == 3 and stats['busy'] == 3,
+                "Unexpected number of workers: %s" % stats)
+        self.failUnless(stats['waiting'] == 17,
+                "Unexpected number of waiting jobs: %s" % stats)
+
+        self.release.set()
+        self.wait_for(20)
+        self.failUnless(sorted(self.done) == list(range(20)),
+                "Not all jobs ran: %s" % self.done)
+
+        time.sleep(0.5)
+        stats = pool.stats()
+        self.failUnless(stats['workers'] == 0,
+                "Idle workers did not exit: %s" % stats)
+        self.failUnless(stats['peak_workers'] == 3 and \
+                        stats['completed'] == 20,
+                "Unexpected pool metrics: %s" % stats)
+
+    def testConcurrencyLimit(self):
+        """Test limiting the number of jobs with the same key."""
+        pool = WorkerPool(max_workers=4)
+        for i in range(3):
+            pool.submit(self.job, ('a%s' % i,), key='a', limit=1)
+        pool.submit(self.job, ('b',))
+        time.sleep(0.1)
+
+        self.failUnless(pool.stats()['busy'] == 2,
+                "Keyed jobs exceeded their limit: %s" % pool.stats())
+
+        self.release.set()
+        self.wait_for(4)
+        keyed = [name for name in self.done if name != 'b']
+        self.failUnless(keyed == ['a0', 'a1', 'a2'],
+                "Keyed jobs ran out of order: %s" % self.done)
+
+    def testReject(self):
+        """Test rejecting jobs when the backlog is full."""
+        pool = WorkerPool(max_workers=1, backlog=2, overflow='reject')
+        results = [pool.submit(self.job, (i,)) for i in range(5)]
+
+        self.failUnless(results == [True, True, True, False, False],
+                "Unexpected submit results: %s" % results)
+
+        self.release.set()
+        self.wait_for(3)
+        time.sleep(0.1)
+        self.failUnless(sorted(self.done) == [0, 1, 2],
+                "Unexpected jobs ran: %s" % self.done)
+        self.failUnless(pool.stats()['rejected'] == 2,
+                "Rejected jobs were not counted: %s" % pool.stats())
+
+    def testDropOldest(self):
+        """Test dropping the oldest waiting job when the backlog is full."""
+        pool = WorkerPool(max_workers=1, backlog=2, overflow='drop_oldest')
+        for i in range(5):
+            pool.submit(self.job, (i,))
+
+        self.release.set()
+        self.wait_for(3)
+        time.sleep(0.1)
+        self.failUnless(self.done == [0, 3, 4],
+                "Oldest jobs were not dropped: %s" % self.done)
+        self.failUnless(pool.stats()['dropped'] == 2,
+                "Dropped jobs were not counted: %s" % pool.stats())
+
+    def testBlock(self):
+        """Test that submitting blocks while the backlog is full."""
+        pool = WorkerPool(max_workers=1, backlog=1)
+        pool.submit(self.job, (0,))
+        pool.submit(self.job, (1,))
+
+        submitted = []
+
+        def submit():
+            pool.submit(self.job, (2,))
+            submitted.append(True)
+
+        thread = threading.Thread(target=submit)
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.1)
+        self.failIf(submitted, "Submit did not block.")
+
+        self.release.set()
+        thread.join(2)
+        self.wait_for(3)
+        self.failUnless(self.done == [0, 1, 2],
+                "Unexpected jobs ran: %s" % self.done)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkerPool)
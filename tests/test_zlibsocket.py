@@ -0,0 +1,93 @@
+import socket
+import threading
+import zlib
+
+from sleekxmpp.test import *
+from sleekxmpp.plugins.xep_0138 import ZlibSocket, WOULD_BLOCK
+from sleekxmpp.xmlstream.recvbuffer import RecvBuffer
+
+
+class TestZlibSocket(SleekTest):
+
+    """
+    Test compressing data sent on a socket.
+    """
+
+    def setUp(self):
+        client, server = socket.socketpair()
+        self.client = ZlibSocket(client, level=6)
+        self.server = ZlibSocket(server, flush='full')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def testRoundTrip(self):
+        """Test reading compressed stanzas through a receive buffer."""
+        stanza = '<presence from="user@example.com/a"><show>away</show>' + \
+                 '<status>Out to lunch</status></presence>'
+        data = (stanza * 200).encode('utf-8')
+
+        sender = threading.Thread(target=self.client.sendall, args=(data,))
+        sender.start()
+        buf = RecvBuffer(64, 1024)
+        received = b''
+        while len(received) < len(data):
+            received += bytes(buf.recv(self.server))
+        sender.join()
+
+        self.failUnless(received == data,
+                "Decompressed data does not match.")
+        stats = self.client.stats()
+        self.failUnless(stats['sent'] == len(data),
+                "Unexpected sent byte count: %s" % stats)
+        self.failUnless(stats['send_ratio'] > 10,
+                "Repetitive data was not compressed: %s" % stats)
+        self.failUnless(self.server.stats()['received'] == len(data),
+                "Unexpected received byte count: %s" % self.server.stats())
+
+    def testPartialSend(self):
+        """Test that data is not lost when a write is cut short."""
+        if not WOULD_BLOCK:
+            # Non-blocking writes are not supported.
+            return
+
+        class SlowSocket(object):
+            def __init__(self):
+                self.written = b''
+                self.calls = 0
+
+            def send(self, data):
+                self.calls += 1
+                if self.calls % 3 == 0:
+                    raise WOULD_BLOCK[0]()
+                self.written += bytes(data[:7])
+                return len(data[:7])
+
+        slow = SlowSocket()
+        zsock = ZlibSocket(slow)
+        data = b''.join([b'<message id="%d"><body>Hi</body></message>' % i
+                         for i in range(50)])
+        out = bytearray(data)
+        while out:
+            try:
+                sent = zsock.send(out[:100])
+            except WOULD_BLOCK:
+                continue
+            del out[:sent]
+
+        received = zlib.decompressobj().decompress(slow.written)
+        self.failUnless(received == data,
+                "Decompressed data does not match.")
+
+    def testClosed(self):
+        """Test that a closed connection is reported."""
+        self.client.sendall(b'<message />')
+        self.client.shutdown(socket.SHUT_RDWR)
+        self.failUnless(self.server.recv(4096) == b'<message />',
+                "Data sent before closing was not received.")
+        self.failUnless(self.server.recv(4096) == b'',
+                "Closed connection was not reported.")
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestZlibSocket)